@@ -0,0 +1,117 @@
+"""
+异步代理基准测试：同一进程内并发会话数增加时的首字延迟、吞吐与线程数
+
+对比 Streamlit 的每会话一个线程（同步 stream）与单个事件循环驱动全部会话（astream）。
+模拟LLM：首token前等待 --ttft-ms，之后每 --chunk-ms 产出一块；
+模拟检索：占用 --retrieval-ms 的CPU（与真实的embedding+FAISS一样受GIL限制，线程再多也不会更快）。
+运行: python -m benchmarks.bench_async_agents --sessions 50 200 500
+"""
+import argparse
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.messages import AIMessageChunk
+
+import src.core.agent_logic as agent_logic
+
+PERSONA = "预算敏感型 (王女士)"
+
+
+class SimulatedLLM:
+    def __init__(self, ttft_ms: float, chunk_ms: float, chunks: int):
+        self.ttft = ttft_ms / 1000
+        self.chunk = chunk_ms / 1000
+        self.chunks = chunks
+
+    def _delays(self):
+        return [self.ttft] + [self.chunk] * (self.chunks - 1)
+
+    def stream(self, prompt, **kwargs):
+        for delay in self._delays():
+            time.sleep(delay)
+            yield AIMessageChunk(content="嗯")
+
+    async def astream(self, prompt, **kwargs):
+        for delay in self._delays():
+            await asyncio.sleep(delay)
+            yield AIMessageChunk(content="嗯")
+
+    def invoke(self, prompt, **kwargs):
+        return AIMessageChunk(content="摘要")
+
+
+def _install(args):
+    llm = SimulatedLLM(args.ttft_ms, args.chunk_ms, args.chunks)
+    agent_logic.get_llm = lambda use_deepseek=True, temperature=0.7: llm
+    retrieval_pool = ThreadPoolExecutor(max_workers=4)
+
+    def retrieve(query, k=1, filters=None):
+        deadline = time.thread_time() + args.retrieval_ms / 1000
+        while time.thread_time() < deadline:
+            pass
+        return []
+
+    async def aretrieve(query, k=1, filters=None):
+        return await asyncio.get_running_loop().run_in_executor(retrieval_pool, retrieve, query, k, filters)
+
+    agent_logic.query_vector_store = retrieve
+    agent_logic.aquery_vector_store = aretrieve
+
+
+def run_threaded(sessions):
+    agents = [agent_logic.create_rag_agent(PERSONA) for _ in range(sessions)]
+    peak_threads = [threading.active_count()]
+
+    def turn(agent):
+        "".join(agent.stream("您好，欢迎光临！"))
+        peak_threads[0] = max(peak_threads[0], threading.active_count())
+        return agent.last_timing
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        timings = list(pool.map(turn, agents))
+    return time.perf_counter() - start, timings, peak_threads[0]
+
+
+def run_async(sessions):
+    agents = [agent_logic.create_rag_agent(PERSONA) for _ in range(sessions)]
+    peak_threads = [threading.active_count()]
+
+    async def turn(agent):
+        async for _ in agent.astream("您好，欢迎光临！"):
+            pass
+        peak_threads[0] = max(peak_threads[0], threading.active_count())
+        return agent.last_timing
+
+    async def main():
+        return await asyncio.gather(*(turn(agent) for agent in agents))
+
+    start = time.perf_counter()
+    timings = asyncio.run(main())
+    return time.perf_counter() - start, timings, peak_threads[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="异步代理基准测试")
+    parser.add_argument("--sessions", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--chunk-ms", type=float, default=20)
+    parser.add_argument("--chunks", type=int, default=30)
+    parser.add_argument("--retrieval-ms", type=float, default=2)
+    args = parser.parse_args()
+    _install(args)
+
+    print(f"{'模式':<10}{'会话数':>7}{'总耗时(s)':>11}{'轮/秒':>8}{'TTFT p50':>10}{'TTFT p99':>10}{'峰值线程':>9}")
+    for sessions in args.sessions:
+        for name, runner in (("每会话线程", run_threaded), ("单事件循环", run_async)):
+            elapsed, timings, threads = runner(sessions)
+            ttft = np.array([t["ttft_ms"] for t in timings])
+            print(f"{name:<10}{sessions:>7}{elapsed:>11.2f}{sessions / elapsed:>8.0f}"
+                  f"{np.percentile(ttft, 50):>10.0f}{np.percentile(ttft, 99):>10.0f}{threads:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+属性预过滤基准测试：列式属性索引 + FAISS/BM25 预过滤
+
+运行: python -m benchmarks.bench_attribute_filter --rows 1000000
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.synthetic_catalog import make_catalog
+from src.rag.attribute_index import AttributeIndex
+from src.rag.keyword_index import KeywordIndex
+
+FILTERS = [
+    "price_yuan<=8000",
+    "price_yuan>=5000, price_yuan<=8000",
+    "series in {星动系列, 玲珑系列}, price_yuan<=8000",
+    "designer=意大利设计师, weight_g<20",
+]
+
+
+def _ms(fn, repeat=20):
+    latencies = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return float(np.median(latencies)), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="属性预过滤基准测试")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="合成产品数量")
+    parser.add_argument("--dim", type=int, default=32, help="FAISS测试向量维度")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--keyword-rows", type=int, default=200_000, help="BM25预过滤测试的产品数量（0为跳过）")
+    args = parser.parse_args()
+
+    df = make_catalog(args.rows)
+    start = time.perf_counter()
+    index = AttributeIndex.from_dataframe(df)
+    print(f"属性索引构建: {args.rows} 行，{time.perf_counter() - start:.2f}秒")
+
+    masks = {}
+    for spec in FILTERS:
+        ms, mask = _ms(lambda: index.mask(spec))
+        masks[spec] = mask
+        print(f"  过滤 [{spec}]: {ms:.2f}ms，命中 {int(mask.sum())} 行 ({mask.mean():.1%})")
+
+    # FAISS：预过滤(IDSelectorBitmap) vs 先检索再过滤
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((args.rows, args.dim)).astype(np.float32)
+    faiss_index = faiss.IndexFlatL2(args.dim)
+    faiss_index.add(vectors)
+    query = rng.standard_normal((1, args.dim)).astype(np.float32)
+
+    plain_ms, _ = _ms(lambda: faiss_index.search(query, args.k), repeat=5)
+    print(f"\nFAISS 无过滤 top-{args.k}: {plain_ms:.1f}ms")
+    for spec, mask in masks.items():
+        bitmap = np.packbits(mask, bitorder="little")
+        params = faiss.SearchParameters(sel=faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap)))
+        pre_ms, (_, pre_ids) = _ms(lambda: faiss_index.search(query, args.k, params=params), repeat=5)
+
+        fetch_k = args.k * 10
+        post_ms, (_, post_ids) = _ms(lambda: faiss_index.search(query, fetch_k), repeat=5)
+        survivors = [i for i in post_ids[0] if mask[i]][:args.k]
+        print(f"  [{spec}] 预过滤 {pre_ms:.1f}ms 返回 {int((pre_ids[0] >= 0).sum())}/{args.k} 条；"
+              f"后过滤(fetch_k={fetch_k}) {post_ms:.1f}ms 仅剩 {len(survivors)}/{args.k} 条")
+
+    if args.keyword_rows:
+        kw_df = df.head(args.keyword_rows)
+        kw_index = KeywordIndex.from_dataframe(kw_df)
+        kw_attr = AttributeIndex.from_dataframe(kw_df)
+        print(f"\nBM25 ({args.keyword_rows} 行)")
+        base_ms, _ = _ms(lambda: kw_index.search("星动系列的手镯", args.k), repeat=50)
+        print(f"  无过滤: {base_ms:.3f}ms")
+        for spec in FILTERS:
+            allowed = kw_attr.mask(spec)
+            ms, results = _ms(lambda: kw_index.search("星动系列的手镯", args.k, allowed=allowed), repeat=50)
+            assert all(allowed[i] for i, _ in results)
+            print(f"  [{spec}] 预过滤: {ms:.3f}ms，返回 {len(results)} 条")
+
+
+if __name__ == "__main__":
+    main()
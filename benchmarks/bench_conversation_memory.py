@@ -0,0 +1,127 @@
+"""
+对话记忆基准测试：长会话中每轮的prompt token数与关键路径延迟
+
+对比三种记忆：完整历史（原 ConversationBufferMemory）、只保留最近10行（原RAG代理的截断）、
+按token预算的滚动摘要（RollingSummaryMemory）。模拟LLM的延迟按 固定开销 + 每token预填充耗时 计算，
+不真正sleep；滚动摘要的LLM调用在后台进行，计入后台token但不计入关键路径。
+运行: python -m benchmarks.bench_conversation_memory --turns 80
+"""
+import argparse
+
+import numpy as np
+
+from src.memory.conversation_memory import RollingSummaryMemory, count_tokens
+from src.prompts.memory_prompts import SUMMARY_PROMPT
+from src.prompts.persona_prompts import PERSONA_PROMPTS
+
+PERSONA = "预算敏感型 (王女士)"
+EARLY_FACT = "预算最多六千"
+
+SALES_LINES = [
+    "这款古法金手镯今天有活动，工费打八折。",
+    "足金999，每克比市场价低十块，还可以免费刻字。",
+    "这款满天星手镯是新款，很多年轻客户喜欢。",
+    "我们支持以旧换新，旧金可以直接抵扣。",
+    "这款龙凤呈祥适合婚嫁，寓意好，也很保值。",
+]
+CUSTOMER_LINES = [
+    "嗯，价格还是有点贵，能不能再便宜点？",
+    "这个多少克？总价多少钱？",
+    "我再看看别家，感觉差不多。",
+    "保值吗？以后卖回去能值多少？",
+]
+
+
+class SimulatedLLM:
+    """延迟 = base_ms + 每个prompt token的预填充耗时 + 输出token的解码耗时"""
+
+    def __init__(self, base_ms: float, prefill_ms_per_token: float, decode_ms_per_token: float):
+        self.base_ms = base_ms
+        self.prefill_ms = prefill_ms_per_token
+        self.decode_ms = decode_ms_per_token
+
+    def latency_ms(self, prompt_tokens: int, output_tokens: int) -> float:
+        return self.base_ms + prompt_tokens * self.prefill_ms + output_tokens * self.decode_ms
+
+
+class BufferHistory:
+    """完整历史"""
+
+    def __init__(self):
+        self.lines = []
+
+    def render(self):
+        return "\n".join(self.lines)
+
+    def add_turn(self, human, ai):
+        self.lines += [f"销售：{human}", f"王女士：{ai}"]
+
+
+class TrimmedHistory(BufferHistory):
+    """只保留最近10行"""
+
+    def render(self):
+        return "\n".join(self.lines[-10:])
+
+
+def extractive_summarize(background_tokens):
+    """模拟摘要：保留含预算/价格的句子；记录摘要调用的prompt token数"""
+
+    def summarize(previous, lines):
+        prompt = SUMMARY_PROMPT.format(summary=previous or "无", new_lines="\n".join(lines))
+        background_tokens.append(count_tokens(prompt))
+        kept = [line for line in lines if "预算" in line or "元" in line]
+        return "；".join(([previous] if previous else []) + kept + [f"另讨论了{len(lines)}句工费、克重和款式"])
+
+    return summarize
+
+
+def run_session(memory, llm, turns):
+    prompt_template = PERSONA_PROMPTS[PERSONA]
+    prompt_tokens, latencies = [], []
+    for i in range(turns):
+        sales = SALES_LINES[i % len(SALES_LINES)]
+        customer = EARLY_FACT + "，别给我推荐太贵的。" if i == 0 else CUSTOMER_LINES[i % len(CUSTOMER_LINES)]
+        prompt = prompt_template.format(history=memory.render(), input=sales)
+        tokens = count_tokens(prompt)
+        prompt_tokens.append(tokens)
+        latencies.append(llm.latency_ms(tokens, count_tokens(customer)))
+        memory.add_turn(sales, customer)
+    retained = EARLY_FACT in memory.render()
+    return np.asarray(prompt_tokens), np.asarray(latencies), retained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对话记忆基准测试")
+    parser.add_argument("--turns", type=int, default=80)
+    parser.add_argument("--budget", type=int, default=1000, help="滚动摘要的token预算")
+    parser.add_argument("--base-ms", type=float, default=300.0)
+    parser.add_argument("--prefill-ms", type=float, default=0.5, help="每个prompt token的预填充耗时")
+    parser.add_argument("--decode-ms", type=float, default=30.0, help="每个输出token的解码耗时")
+    args = parser.parse_args()
+
+    llm = SimulatedLLM(args.base_ms, args.prefill_ms, args.decode_ms)
+    background_tokens = []
+    memories = {
+        "完整历史": BufferHistory(),
+        "最近10行": TrimmedHistory(),
+        "滚动摘要": RollingSummaryMemory(extractive_summarize(background_tokens), token_budget=args.budget,
+                                      summary_max_tokens=200, ai_prefix="王女士", background=False),
+    }
+
+    print(f"{args.turns}轮会话，模拟LLM：{args.base_ms:.0f}ms + {args.prefill_ms}ms/prompt token"
+          f" + {args.decode_ms}ms/输出token")
+    print(f"{'记忆':<8}{'平均prompt':>11}{'最后一轮':>9}{'p50延迟(ms)':>13}{'最后一轮(ms)':>14}"
+          f"{'总prompt token':>16}{'早期事实保留':>14}")
+    for name, memory in memories.items():
+        tokens, latencies, retained = run_session(memory, llm, args.turns)
+        print(f"{name:<8}{tokens.mean():>11.0f}{tokens[-1]:>9}{np.percentile(latencies, 50):>13.0f}"
+              f"{latencies[-1]:>14.0f}{tokens.sum():>16}{'是' if retained else '否':>14}")
+
+    stats = memories["滚动摘要"].stats()
+    print(f"滚动摘要：后台摘要调用 {stats['summary_calls']} 次，后台prompt token {sum(background_tokens)}，"
+          f"折叠 {stats['lines_folded']} 行，当前摘要 {stats['summary_tokens']} token")
+
+
+if __name__ == "__main__":
+    main()
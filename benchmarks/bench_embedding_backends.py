@@ -0,0 +1,118 @@
+"""
+句向量推理后端基准测试：延迟、吞吐、内存，以及与PyTorch结果的一致性
+
+每个后端在独立子进程中加载，RSS互不干扰。ONNX依赖缺失回退到PyTorch时，后端列显示为 "onnx->torch"。
+运行: python -m benchmarks.bench_embedding_backends --docs 2000 --queries 200
+"""
+import argparse
+import multiprocessing as mp
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.bench_faiss_index import rss_mb
+from benchmarks.synthetic_catalog import make_catalog
+from config import EMBEDDING_MODEL_NAME, PERFORMANCE_CONFIG
+from src.rag.catalog import product_embedding_content
+from src.rag.embedding_backends import EMBEDDING_BACKENDS
+
+QUERY_TEMPLATES = ["想看看{}", "{}多少钱", "{}有什么寓意", "介绍一下{}", "{}是什么工艺"]
+
+
+def _run_backend(backend, model_name, docs, queries, batch_size, result_queue):
+    from src.rag.embedding_backends import load_sentence_model, loaded_backend
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    model = load_sentence_model(model_name, backend, PERFORMANCE_CONFIG["onnx_quantized_file"])
+    load_seconds = time.perf_counter() - start
+    model.encode(queries[:4], show_progress_bar=False)  # 预热
+
+    latencies = []
+    query_vectors = []
+    for query in queries:
+        t = time.perf_counter()
+        query_vectors.append(model.encode([query], show_progress_bar=False)[0])
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    start = time.perf_counter()
+    doc_vectors = model.encode(docs, batch_size=batch_size, show_progress_bar=False)
+    throughput = len(docs) / (time.perf_counter() - start)
+
+    result_queue.put({
+        "backend": backend,
+        "loaded_backend": loaded_backend(model, backend),
+        "load_seconds": load_seconds,
+        "rss_mb": rss_mb(),
+        "rss_delta_mb": rss_mb() - rss_before,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "docs_per_second": throughput,
+        "doc_vectors": np.asarray(doc_vectors, dtype=np.float32),
+        "query_vectors": np.asarray(query_vectors, dtype=np.float32),
+    })
+
+
+def _top_k(doc_vectors, query_vectors, k):
+    index = faiss.IndexFlatL2(doc_vectors.shape[1])
+    index.add(doc_vectors)
+    return index.search(query_vectors, k)[1]
+
+
+def _cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return np.sum(a * b, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="句向量推理后端基准测试")
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--backends", default=",".join(EMBEDDING_BACKENDS))
+    parser.add_argument("--model", default=EMBEDDING_MODEL_NAME)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.docs)
+    docs = [product_embedding_content(row) for row in catalog.to_dict("records")]
+    rng = np.random.default_rng(0)
+    names = catalog["name"].to_numpy()[rng.integers(0, args.docs, args.queries)]
+    queries = [QUERY_TEMPLATES[i % len(QUERY_TEMPLATES)].format(name) for i, name in enumerate(names)]
+
+    ctx = mp.get_context("spawn")
+    results = {}
+    for backend in args.backends.split(","):
+        result_queue = ctx.Queue()
+        process = ctx.Process(
+            target=_run_backend,
+            args=(backend, args.model, docs, queries, PERFORMANCE_CONFIG["bert_batch_size"], result_queue),
+        )
+        process.start()
+        try:
+            results[backend] = result_queue.get(timeout=1800)
+        except Exception as e:
+            print(f"{backend}: 运行失败 ({e})")
+        process.join()
+
+    baseline = results.get("torch")
+    header = (f"{'后端':<18}{'加载(s)':>9}{'RSS(MB)':>9}{'p50(ms)':>9}{'p99(ms)':>9}"
+              f"{'文档/秒':>9}{'余弦一致性':>11}{'top-k重合':>10}")
+    print(header)
+    print("-" * len(header))
+    for backend, r in results.items():
+        if r["loaded_backend"] != backend:
+            backend = f"{backend}->{r['loaded_backend']}"
+        agreement, overlap = float("nan"), float("nan")
+        if baseline is not None:
+            agreement = float(np.mean(_cosine(r["doc_vectors"], baseline["doc_vectors"])))
+            ours = _top_k(r["doc_vectors"], r["query_vectors"], args.k)
+            ref = _top_k(baseline["doc_vectors"], baseline["query_vectors"], args.k)
+            overlap = float(np.mean([len(set(a) & set(b)) / args.k for a, b in zip(ours, ref)]))
+        print(f"{backend:<18}{r['load_seconds']:>9.1f}{r['rss_mb']:>9.0f}{r['p50_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+              f"{r['docs_per_second']:>9.0f}{agreement:>11.4f}{overlap:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+FAISS索引类型基准测试：recall@k、单次查询 p50/p99 延迟、内存占用
+
+运行: python -m benchmarks.bench_faiss_index --rows 100000 --dim 384
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from src.rag.faiss_index import INDEX_TYPES, create_faiss_index
+
+
+def synthetic_vectors(n: int, dim: int, n_clusters: int = 200, seed: int = 0):
+    """聚类分布的合成向量（比均匀随机更接近真实句向量）"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((n_clusters, dim)).astype(np.float32)
+    assignment = rng.integers(0, n_clusters, n)
+    return centers[assignment] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB），仅Linux"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS索引类型基准测试")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384, help="all-MiniLM-L6-v2 为384维")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--pq-m", type=int, default=48)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.rows, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(args.rows, args.queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+
+    ground_truth_index = faiss.IndexFlatL2(args.dim)
+    ground_truth_index.add(vectors)
+    _, ground_truth = ground_truth_index.search(queries, args.k)
+    del ground_truth_index
+    print(f"合成向量: {args.rows} x {args.dim}，查询 {args.queries} 条，k={args.k}\n")
+
+    header = f"{'索引类型':<10}{'构建(s)':>9}{'索引(MB)':>10}{'RSS增量(MB)':>13}{'recall@k':>10}{'p50(ms)':>9}{'p99(ms)':>9}"
+    print(header)
+    print("-" * len(header))
+    for index_type in args.types.split(","):
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        index, resolved = create_faiss_index(
+            vectors, index_type, nlist=args.nlist, hnsw_m=args.hnsw_m, pq_m=args.pq_m,
+            nprobe=args.nprobe, ef_search=args.ef_search,
+        )
+        index.add(vectors)
+        build_seconds = time.perf_counter() - start
+        rss_delta = rss_mb() - rss_before
+        index_mb = faiss.serialize_index(index).nbytes / 1024 / 1024
+
+        latencies = []
+        found = np.zeros((args.queries, args.k), dtype=np.int64)
+        for i in range(args.queries):
+            t = time.perf_counter()
+            _, ids = index.search(queries[i:i + 1], args.k)
+            latencies.append((time.perf_counter() - t) * 1000)
+            found[i] = ids[0]
+        recall = np.mean([len(set(found[i]) & set(ground_truth[i])) / args.k for i in range(args.queries)])
+
+        label = index_type if resolved == index_type else f"{index_type}->{resolved}"
+        print(f"{label:<12}{build_seconds:>9.1f}{index_mb:>10.1f}{rss_delta:>13.1f}{recall:>10.3f}"
+              f"{np.percentile(latencies, 50):>9.3f}{np.percentile(latencies, 99):>9.3f}")
+        del index
+
+
+if __name__ == "__main__":
+    main()
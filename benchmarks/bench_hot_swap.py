@@ -0,0 +1,115 @@
+"""
+索引热切换基准测试：后台重建并切换版本期间的检索延迟与错误数
+
+使用哈希向量代替BERT（见 bench_ingestion.HashEncoder），关闭检索结果缓存，
+查询线程持续检索，同时修改产品目录并触发 reload_product_index。
+运行: python -m benchmarks.bench_hot_swap --rows 50000
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import src.rag.rag_system as rag_system
+from benchmarks.bench_ingestion import HashEncoder
+from benchmarks.synthetic_catalog import make_catalog
+
+QUERIES = ["满天星手镯", "古法金 传承", "福运转运珠", "龙凤呈祥 婚嫁", "玲珑 小蛮腰", "平安扣 足金"]
+
+
+def _summary(latencies):
+    if not latencies:
+        return "    -"
+    values = np.asarray(latencies)
+    return (f"{len(values):>7}{np.percentile(values, 50):>9.2f}{np.percentile(values, 99):>9.2f}"
+            f"{values.max():>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="索引热切换基准测试")
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--mode", default="hybrid")
+    args = parser.parse_args()
+
+    config = rag_system.PERFORMANCE_CONFIG
+    config["embedding_cache_enabled"] = False
+    config["ingestion_workers"] = 1
+    rag_system._bert_model = HashEncoder()
+    rag_system._query_cache = None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, "products.csv")
+        rag_system.PRODUCT_KNOWLEDGE_PATH = csv_path
+        rag_system.VECTOR_STORE_PATH = os.path.join(tmp, "vector_store")
+        rag_system._index_versions = rag_system._new_index_versions()
+        catalog = make_catalog(args.rows)
+        catalog.to_csv(csv_path, index=False)
+        print("构建初始版本...")
+        rag_system.create_vector_store()
+
+        swap_times = []
+        original_swap = rag_system._index_versions.swap
+
+        def timed_swap(value):
+            swap_times.append(time.perf_counter())
+            return original_swap(value)
+
+        rag_system._index_versions.swap = timed_swap
+
+        samples, errors = [], []
+        stop = threading.Event()
+
+        def worker(offset):
+            i = offset
+            while not stop.is_set():
+                query = QUERIES[i % len(QUERIES)]
+                start = time.perf_counter()
+                try:
+                    results = rag_system.query_vector_store(query, k=3, mode=args.mode)
+                    if not results:
+                        errors.append("empty")
+                except Exception as e:
+                    errors.append(str(e))
+                samples.append((start, (time.perf_counter() - start) * 1000))
+                i += 1
+
+        threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(args.threads)]
+        for t in threads:
+            t.start()
+        time.sleep(2)
+
+        # 修改10%产品价格后触发后台重建
+        changed = catalog.sample(frac=0.1, random_state=1).index
+        catalog.loc[changed, "price_yuan"] += 100
+        catalog.to_csv(csv_path, index=False)
+        build_start = time.perf_counter()
+        rag_system.reload_product_index()
+        while not swap_times and time.perf_counter() - build_start < 1800:
+            time.sleep(0.05)
+        time.sleep(2)
+        stop.set()
+        for t in threads:
+            t.join()
+
+    if not swap_times:
+        print("未发生版本切换")
+        return
+    swap_at = swap_times[0]
+    windows = {
+        "重建前": [ms for t, ms in samples if t < build_start],
+        "后台重建中": [ms for t, ms in samples if build_start <= t < swap_at - 0.5],
+        "切换前后0.5秒": [ms for t, ms in samples if abs(t - swap_at) <= 0.5],
+        "切换后": [ms for t, ms in samples if t > swap_at + 0.5],
+    }
+    print(f"重建+预热耗时: {swap_at - build_start:.1f}s，错误数: {len(errors)}")
+    print(f"{'时间段':<14}{'查询数':>7}{'p50(ms)':>9}{'p99(ms)':>9}{'max(ms)':>9}")
+    for name, latencies in windows.items():
+        print(f"{name:<14}{_summary(latencies)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+关键词检索基准测试：原逐行扫描实现 vs BM25倒排索引
+
+运行: python -m benchmarks.bench_keyword_search --rows 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_catalog import make_catalog
+from src.rag.keyword_index import KeywordIndex
+
+QUERIES = [
+    "星动系列的手镯多少钱",
+    "想看看玲珑系列",
+    "有没有古法金的款式",
+    "福运转运珠手镯",
+    "适合结婚的龙凤呈祥",
+    "限量设计师款",
+    "5G黄金 硬度",
+    "平安扣手镯",
+]
+
+
+def legacy_keyword_search(df, query: str, k: int = 2):
+    """原 _cached_keyword_search 的逐行扫描逻辑（不含缓存）"""
+    relevant_products = []
+    query_lower = query.lower()
+    keywords = ['手镯', '黄金', '价格', '克', '折扣', '工艺', '设计', '传承', '星动', '玲珑', '福运']
+
+    for _, row in df.iterrows():
+        product_text = f"{row['name']} {row['series']} {row['craft']} {row['meaning']} {row['description']}".lower()
+        score = sum(1 for keyword in keywords if keyword in query_lower and keyword in product_text)
+        if score > 0 or any(word in product_text for word in query_lower.split()[:3]):
+            content = f"产品名称: {row['name']}, 系列: {row['series']}, 工艺: {row['craft']}, 寓意: {row['meaning']}, 价格: {row['price_yuan']}元, 重量: {row['weight_g']}克, 描述: {row['description']}"
+            relevant_products.append((content, row['id'], score))
+
+    relevant_products.sort(key=lambda x: x[2], reverse=True)
+    return relevant_products[:k]
+
+
+def _time_calls(fn, queries, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for q in queries:
+            start = time.perf_counter()
+            fn(q)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return np.asarray(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="关键词检索基准测试")
+    parser.add_argument("--rows", type=int, default=100_000, help="合成产品数量")
+    parser.add_argument("--repeat", type=int, default=50, help="倒排索引查询重复轮数")
+    parser.add_argument("--legacy-queries", type=int, default=3, help="原实现测试的查询数（逐行扫描很慢）")
+    args = parser.parse_args()
+
+    df = make_catalog(args.rows)
+    print(f"合成产品目录: {len(df)} 行")
+
+    start = time.perf_counter()
+    index = KeywordIndex.from_dataframe(df)
+    print(f"倒排索引构建: {time.perf_counter() - start:.2f}秒，词表 {len(index.vocab)}，倒排记录 {len(index.postings_doc)}")
+
+    indexed = _time_calls(lambda q: index.search(q, 2), QUERIES, args.repeat)
+    print(f"倒排索引查询: p50={np.percentile(indexed, 50):.3f}ms p99={np.percentile(indexed, 99):.3f}ms "
+          f"({len(indexed)} 次)")
+
+    legacy = _time_calls(lambda q: legacy_keyword_search(df, q, 2), QUERIES[:args.legacy_queries], 1)
+    print(f"原逐行扫描:   p50={np.percentile(legacy, 50):.1f}ms max={legacy.max():.1f}ms ({len(legacy)} 次)")
+    print(f"加速比(p50): {np.percentile(legacy, 50) / np.percentile(indexed, 50):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+LLM对冲请求基准测试：服务端有长尾延迟时，对冲前后的首token延迟分布和额外请求数
+
+使用本地假OpenAI服务（benchmarks.fake_openai_server），--slow-ratio 的请求首token延迟为 --slow-ms。
+运行: python -m benchmarks.bench_llm_hedging --requests 200 --slow-ratio 0.05
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from src.utils.llm_client import ResilientChatModel, create_chat_model
+
+
+def run(args, hedging: bool):
+    with FakeOpenAIServer(reply="嗯，这款多少钱一克？", ttft_ms=args.ttft_ms, chunk_ms=args.chunk_ms) as server:
+        model = ResilientChatModel(
+            create_chat_model("fake-model", "sk-bench", server.base_url, streaming=True), hedging=hedging
+        )
+        # 预热：积累首token延迟样本，对冲截止时间从上限收敛到分位数
+        for _ in range(30):
+            model.invoke("预热")
+        server.slow_ratio = args.slow_ratio
+        server.slow_ttft_ms = args.slow_ms
+        requests_before = server.requests
+
+        def one(i):
+            start = time.perf_counter()
+            for _ in model.stream(f"请求{i}"):
+                return (time.perf_counter() - start) * 1000
+
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            ttfts = np.array(list(pool.map(one, range(args.requests))))
+        stats = model.stats()
+        extra = (server.requests - requests_before) / args.requests - 1
+        print(f"对冲{'开启' if hedging else '关闭'}: 首token p50 {np.percentile(ttfts, 50):.0f}ms  "
+              f"p95 {np.percentile(ttfts, 95):.0f}ms  p99 {np.percentile(ttfts, 99):.0f}ms  "
+              f"对冲 {stats['hedges']} 次（胜出 {stats['hedge_wins']}）  额外请求 {extra:.1%}  "
+              f"截止时间 {stats['hedge_deadline_ms']:.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM对冲请求基准测试")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--ttft-ms", type=float, default=80)
+    parser.add_argument("--chunk-ms", type=float, default=2)
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--slow-ratio", type=float, default=0.05)
+    args = parser.parse_args()
+    for hedging in (False, True):
+        run(args, hedging)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+向量存储持久化格式基准测试：pickle（FAISS.save_local）与 mmap索引+偏移索引docstore 的冷启动耗时和内存
+
+每种格式在独立子进程中打开，RssAnon 为进程私有内存，RssFile 为可被多进程共享的文件页。
+运行: python -m benchmarks.bench_store_format --rows 200000
+"""
+import argparse
+import multiprocessing as mp
+import os
+import tempfile
+import time
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+
+from benchmarks.bench_faiss_index import synthetic_vectors
+from benchmarks.synthetic_catalog import make_catalog
+from src.rag.catalog import chunk_ids, product_embedding_content
+
+
+class NoEmbeddings(Embeddings):
+    """基准测试按向量查询，不需要模型"""
+
+    def embed_documents(self, texts):
+        raise NotImplementedError
+
+    def embed_query(self, text):
+        raise NotImplementedError
+
+
+def memory_mb():
+    """(RssAnon, RssFile)，单位MB，仅Linux"""
+    values = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(("RssAnon:", "RssFile:")):
+                key, value = line.split(":")
+                values[key] = int(value.split()[0]) / 1024
+    return values.get("RssAnon", float("nan")), values.get("RssFile", float("nan"))
+
+
+def _open_and_query(store_format, store_path, queries, result_queue):
+    import src.rag.rag_system as rag_system
+
+    anon_before, file_before = memory_mb()
+    start = time.perf_counter()
+    if store_format == "pickle":
+        store = FAISS.load_local(store_path, NoEmbeddings(), allow_dangerous_deserialization=True)
+    else:
+        store = rag_system._read_vectorstore(store_path, NoEmbeddings())
+    open_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    store.similarity_search_by_vector(queries[0].tolist(), k=5)
+    first_query_ms = (time.perf_counter() - start) * 1000
+    for query in queries[1:]:
+        store.similarity_search_by_vector(query.tolist(), k=5)
+
+    anon_after, file_after = memory_mb()
+    result_queue.put({
+        "open_seconds": open_seconds,
+        "first_query_ms": first_query_ms,
+        "anon_mb": anon_after - anon_before,
+        "file_mb": file_after - file_before,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量存储持久化格式基准测试")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    import src.rag.rag_system as rag_system
+
+    catalog = make_catalog(args.rows)
+    vectors = synthetic_vectors(args.rows, args.dim)
+    texts = [product_embedding_content(row) for row in catalog.to_dict("records")]
+    ids = [chunk_ids(str(pid), 1)[0] for pid in catalog["id"]]
+    metadatas = [{"id": int(pid)} for pid in catalog["id"]]
+    queries = vectors[np.random.default_rng(1).integers(0, args.rows, args.queries)]
+
+    store = FAISS(NoEmbeddings(), rag_system.faiss.IndexFlatL2(args.dim), InMemoryDocstore(), {})
+    store.add_embeddings(zip(texts, vectors.tolist()), metadatas=metadatas, ids=ids)
+    del vectors, texts
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = {"pickle": os.path.join(tmp, "pickle"), "mmap": os.path.join(tmp, "mmap")}
+        store.save_local(paths["pickle"])
+        rag_system._save_vectorstore(store, paths["mmap"])
+        del store
+
+        ctx = mp.get_context("spawn")
+        print(f"{'格式':<8}{'打开(s)':>10}{'首次查询(ms)':>14}{'私有内存(MB)':>14}{'共享文件页(MB)':>16}")
+        for store_format, store_path in paths.items():
+            result_queue = ctx.Queue()
+            process = ctx.Process(target=_open_and_query, args=(store_format, store_path, queries, result_queue))
+            process.start()
+            r = result_queue.get()
+            process.join()
+            print(f"{store_format:<8}{r['open_seconds']:>10.3f}{r['first_query_ms']:>14.1f}"
+                  f"{r['anon_mb']:>14.0f}{r['file_mb']:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+本地假OpenAI兼容服务 - 测试与压测用，可注入延迟和故障
+
+支持 POST /v1/chat/completions（流式SSE和非流式），回复内容固定，按 ttft_ms / chunk_ms 控制节奏；
+fail_first 个请求返回 status_code_on_failure，slow_first 个请求的首token延迟为 slow_ttft_ms，
+之后的请求以 slow_ratio 的概率变慢（模拟长尾）。
+运行: python -m benchmarks.fake_openai_server --port 8900 --ttft-ms 300
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, reply: str = "嗯，这款多少钱一克？",
+                 ttft_ms: float = 50, chunk_ms: float = 5, prompt_cached_tokens: int = 0):
+        self.reply = reply
+        self.ttft_ms = ttft_ms
+        self.chunk_ms = chunk_ms
+        self.prompt_cached_tokens = prompt_cached_tokens
+        self.fail_first = 0
+        self.status_code_on_failure = 500
+        self.slow_first = 0
+        self.slow_ttft_ms = 5000
+        self.slow_ratio = 0.0
+
+        self.requests = 0
+        self.completed = 0
+        self.disconnected = 0  # 客户端中途断开（取消、对冲落败）
+        self.prompts = []
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _plan(self, prompt: str):
+        """为新请求决定行为：(失败状态码或None, 首token延迟ms)"""
+        with self._lock:
+            self.requests += 1
+            self.prompts.append(prompt)
+            n = self.requests
+        if n <= self.fail_first:
+            return self.status_code_on_failure, 0
+        if n <= self.fail_first + self.slow_first or random.random() < self.slow_ratio:
+            return None, self.slow_ttft_ms
+        return None, self.ttft_ms
+
+    def _usage(self, prompt: str):
+        return {
+            "prompt_tokens": len(prompt),
+            "completion_tokens": len(self.reply),
+            "total_tokens": len(prompt) + len(self.reply),
+            "prompt_tokens_details": {"cached_tokens": min(self.prompt_cached_tokens, len(prompt))},
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+                prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+                failure, ttft_ms = server._plan(prompt)
+                if failure is not None:
+                    self._send_json(failure, {"error": {"message": "injected failure", "type": "server_error"}})
+                    return
+                model = body.get("model", "fake-model")
+                try:
+                    time.sleep(ttft_ms / 1000)
+                    if body.get("stream"):
+                        self._stream(model, prompt, body)
+                    else:
+                        self._send_json(200, {
+                            "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                            "model": model,
+                            "choices": [{"index": 0, "finish_reason": "stop",
+                                         "message": {"role": "assistant", "content": server.reply}}],
+                            "usage": server._usage(prompt),
+                        })
+                except (BrokenPipeError, ConnectionResetError):
+                    with server._lock:
+                        server.disconnected += 1
+                    return
+                with server._lock:
+                    server.completed += 1
+
+            def _event(self, payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+            def _stream(self, model, prompt, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model}
+                for i, ch in enumerate(server.reply):
+                    if i:
+                        time.sleep(server.chunk_ms / 1000)
+                    delta = {"role": "assistant", "content": ch} if i == 0 else {"content": ch}
+                    self._event(json.dumps({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]},
+                                           ensure_ascii=False))
+                self._event(json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    self._event(json.dumps({**base, "choices": [], "usage": server._usage(prompt)}))
+                self._event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地假OpenAI兼容服务")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--chunk-ms", type=float, default=20)
+    args = parser.parse_args()
+    server = FakeOpenAIServer(port=args.port, ttft_ms=args.ttft_ms, chunk_ms=args.chunk_ms)
+    print(f"假OpenAI服务: {server.base_url}")
+    server._httpd.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+合成产品目录 - 用于基准测试，字段与 data/product_knowledge.csv 保持一致
+"""
+import numpy as np
+import pandas as pd
+
+SERIES = ["传承系列", "星动系列", "玲珑系列", "福运系列", "花语系列", "如意系列", "臻爱系列", "国潮系列"]
+NAME_PREFIX = ["满天星", "小蛮腰", "龙凤呈祥", "福牌转运珠", "古韵", "祥云", "并蒂莲", "锦鲤", "如意结", "平安扣",
+               "竹节", "缠枝", "流光", "月影", "海棠", "凤尾", "麒麟", "金蝉", "葫芦", "貔貅"]
+CRAFTS = ["古法金", "5G黄金", "CNC", "精雕", "足金", "镶嵌", "珐琅", "花丝", "錾刻", "硬金"]
+DESIGNERS = ["未知", "意大利设计师", "张小姐", "周大师", "李工", "法国设计工作室"]
+MEANINGS = ["传承经典，寓意福气延绵", "星光闪耀，抓住每个心动瞬间", "玲珑有致，展现女性柔美", "福运连连，好运相伴",
+            "龙凤和鸣，佳偶天成", "平安喜乐，岁岁无忧", "吉祥如意，万事顺遂", "花开富贵，美满幸福"]
+DESCRIPTIONS = ["一款经典的古法金手镯，设计简约大气，适合日常佩戴和收藏。",
+                "采用最新的5G黄金工艺，硬度更高，造型更精致，非常受年轻人欢迎。",
+                "设计灵感来源于女性的优美曲线，手镯线条流畅，非常显气质。",
+                "手镯上刻有福字，配有可转动的转运珠，寓意着时来运转。",
+                "一款适合婚嫁的重工手镯，图案栩栩如生，寓意美好姻缘。",
+                "限量发行的设计师款，每一只都有独立编号和证书。",
+                "轻巧的日常款式，克重友好，适合作为第一只黄金手镯。"]
+
+
+def make_catalog(n: int, seed: int = 0) -> pd.DataFrame:
+    """生成 n 行合成产品数据"""
+    rng = np.random.default_rng(seed)
+    prefix = rng.integers(0, len(NAME_PREFIX), n)
+    suffix = rng.integers(0, 1000, n)
+    weight = np.round(rng.uniform(5.0, 60.0, n), 1)
+    return pd.DataFrame({
+        "id": np.arange(1, n + 1),
+        "series": np.asarray(SERIES)[rng.integers(0, len(SERIES), n)],
+        "name": [f"{NAME_PREFIX[p]}{s:03d}号手镯" for p, s in zip(prefix, suffix)],
+        "weight_g": weight,
+        "craft": np.asarray(CRAFTS)[rng.integers(0, len(CRAFTS), n)],
+        "designer": np.asarray(DESIGNERS)[rng.integers(0, len(DESIGNERS), n)],
+        "meaning": np.asarray(MEANINGS)[rng.integers(0, len(MEANINGS), n)],
+        "price_yuan": (weight * rng.uniform(480, 620, n)).round(-2).astype(int),
+        "description": np.asarray(DESCRIPTIONS)[rng.integers(0, len(DESCRIPTIONS), n)],
+    })
@@ -7,10 +7,18 @@ DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
 
 # OpenAI API Configuration (as an alternative)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "YOUR_OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # 为空时使用官方地址
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
+
+# 短轮次使用的更快/更便宜的模型，格式 "后端:模型"（如 "openai:gpt-4o-mini"），为空时不启用
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL", "")
 
 # Vector Store Configuration
 PRODUCT_KNOWLEDGE_PATH = "data/product_knowledge.csv"
 VECTOR_STORE_PATH = "data/vector_store"
+EMBEDDING_CACHE_PATH = "data/embedding_cache"
+LLM_CACHE_PATH = "data/llm_cache.sqlite3"
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
 
 # Performance Configuration
 PERFORMANCE_CONFIG = {
@@ -18,19 +26,88 @@ PERFORMANCE_CONFIG = {
     "max_tokens": 500,              # 限制输出长度，提高响应速度
     "temperature": 0.7,             # 对话温度
     "evaluation_temperature": 0.1,  # 评估温度（更稳定）
-    "evaluation_max_tokens": 300,   # 评估输出长度限制
+    "evaluation_max_tokens": 400,   # 评估输出长度限制（JSON的键名也占token）
     
     # 缓存设置
     "keyword_search_cache_size": 128,  # 关键词搜索缓存大小
-    "conversation_memory_limit": 1000, # 对话内存限制
+    "query_cache_enabled": True,       # 检索结果缓存
+    "query_cache_size": 1024,          # 检索结果缓存条数
+    "query_cache_ttl_seconds": 3600,   # 检索结果缓存有效期（秒）
+    "query_cache_semantic_threshold": None,  # 语义命中的余弦相似度阈值（如0.97），None为只做精确命中
+    # LLM响应缓存：live 直接调用API不用缓存 / record 命中时复用、未命中调用API并记录 / replay 只用缓存，未命中报错
+    "llm_cache_mode": os.getenv("LLM_CACHE_MODE", "live"),
+    "conversation_memory_limit": 1000, # 对话历史的token预算（滚动摘要 + 最近对话原文）
+    "memory_summary_max_tokens": 200,  # 滚动摘要的token上限
+    "memory_summary_workers": 2,       # 后台生成摘要的线程数（所有会话共享）
     "history_context_limit": 10,       # 历史对话上下文轮数限制
     
     # RAG设置
     "rag_retrieval_count": 1,       # RAG检索数量（减少以提高速度）
+    "async_retrieval_workers": 4,   # 异步代理（ainvoke/astream）共享的检索线程数
+    "retrieval_mode": "hybrid",     # 检索模式：hybrid（BM25+FAISS融合）/ vector / keyword
+    "hybrid_candidate_budget": 10,  # 混合检索两路共享的候选总数
+    "rrf_k": 60,                    # 倒数排名融合常数
+    "faiss_index_type": "flat",     # FAISS索引类型：flat / ivf_flat / hnsw / ivf_pq / sq8 / sq_fp16
+    "faiss_nlist": 256,             # IVF聚类中心数
+    "faiss_nprobe": 8,              # IVF查询探测的聚类数
+    "faiss_hnsw_m": 32,             # HNSW每个节点的邻居数
+    "faiss_hnsw_ef_search": 64,     # HNSW查询时的候选集大小
+    "faiss_pq_m": 48,               # PQ子空间数（需整除向量维度，不整除时自动调整）
+    "faiss_max_training_points": 100000,  # 训练IVF/PQ时的最大抽样向量数
     "chunk_size": 200,              # 文档块大小
     "chunk_overlap": 20,            # 文档块重叠
     "bert_batch_size": 32,          # BERT编码批次大小
+    "ingestion_workers": 0,         # 构建向量存储时的编码进程数，0 为使用全部CPU核
+    "ingestion_chunk_rows": 10000,  # 流式读取产品目录CSV的分块行数
+    "ingestion_batch_size": 512,    # 每个编码任务的文档块数
+    "embedding_backend": "torch",   # 推理后端：torch / torch_int8 / onnx / onnx_int8（ONNX需安装 optimum[onnxruntime]）
+    "onnx_quantized_file": "onnx/model_quint8_avx2.onnx",  # onnx_int8 使用的模型文件（模型仓库内路径）
+    "embedding_cache_enabled": True,       # 启用embedding缓存
+    "embedding_cache_memory_size": 10000,  # 内存LRU缓存条数
+    "embedding_cache_dtype": "float16",    # 磁盘缓存精度（float16/float32）
+    "embedding_cache_read_only": False,    # 只读共享磁盘缓存（多worker进程时可开启）
+    "embedding_batching_enabled": True,    # 并发会话的查询embedding合并批处理
+    "embedding_batch_window_ms": 5,        # 批处理等待窗口（毫秒）
     
+    "warm_up_embedding_model": True,  # 服务启动时后台预热BERT模型和向量存储
+    "catalog_watch_interval_seconds": 30,  # 产品目录/索引版本的检查间隔（秒），0为关闭自动热更新
+    "index_versions_to_keep": 2,           # 保留的向量存储版本数
+
+    "opening_pool_size": 3,           # 每个客户角色预生成的开场白数量，0为关闭
+    "opening_pool_workers": 2,        # 预生成开场白的后台线程数
+    "opening_pool_retry_seconds": 30, # 预生成失败后的重试间隔（秒），连续失败时按指数增长
+    "opening_pool_retry_max_seconds": 1800,  # 重试间隔上限（秒）
+    "opening_pool_max_config_failures": 3,   # 连续这么多次鉴权/配置类错误（不可重试）后停止预生成该角色
+
+    # LLM网络设置（所有聊天模型共享一个连接池）
+    "llm_max_connections": 50,            # 连接池最大连接数
+    "llm_max_keepalive_connections": 20,  # 保持的空闲长连接数
+    "llm_keepalive_expiry_seconds": 30,   # 空闲长连接保留时间
+    "llm_connect_timeout_seconds": 5,     # 建立连接超时
+    "llm_read_timeout_seconds": 30,       # 读超时（两次收到数据之间的最长间隔）
+    "llm_pool_timeout_seconds": 10,       # 等待连接池空闲连接的超时
+    "llm_max_retries": 2,                 # 尚未产出token时的最大重试次数
+    "llm_retry_backoff_seconds": 0.5,     # 重试退避基数（指数增长，全抖动）
+    "llm_retry_backoff_max_seconds": 8,   # 重试退避上限
+    "llm_hedging_enabled": False,         # 首token超时未到时发送对冲请求
+    "llm_hedge_percentile": 95,           # 对冲截止时间取近期首token延迟的分位数
+    "llm_hedge_min_ms": 500,              # 对冲截止时间下限
+    "llm_hedge_max_ms": 5000,             # 对冲截止时间上限（样本不足时使用）
+    "llm_max_concurrency": 8,             # 同时进行的LLM请求上限（所有会话共享）
+    "llm_requests_per_minute": 300,       # 每分钟请求数预算，0为不限
+    "llm_tokens_per_minute": 300000,      # 每分钟token预算（prompt+输出），0为不限
+    "llm_queue_timeout_seconds": 60,      # 排队超过该时间放弃请求
+    "llm_scheduler_dir": os.getenv("LLM_SCHEDULER_DIR"),  # 设置后并发和速率预算在多个进程间共享
+    "llm_routing_enabled": True,          # 客户对话在已配置的后端之间按延迟和健康状况路由
+    "llm_router_window": 50,              # 每个后端参与评分的最近调用次数
+    "llm_router_error_penalty_ms": 2000,  # 评分中错误率的权重（错误率100%相当于慢2秒）
+    "llm_breaker_failure_threshold": 3,   # 连续失败多少次熔断
+    "llm_breaker_cooldown_seconds": 30,   # 熔断后多久发起恢复探测
+    "llm_fast_turn_max_chars": 12,        # 销售的话不超过该长度时使用 LLM_FAST_MODEL
+    "evaluation_repair_attempts": 2,      # 评估输出不是有效JSON时请求模型修复的最多次数
+    "batch_evaluation_concurrency": 4,    # 批量评估同时进行的评估数
+    "batch_evaluation_flush_every": 50,   # 批量评估每完成多少个写回一次报告和检查点
+
     # UI设置
     "enable_streaming": True,       # 启用流式输出
     "enable_verbose": False,        # 关闭详细日志
@@ -1,9 +1,117 @@
+import time
 import streamlit as st
-from src.core.agent_logic import create_agent, create_rag_agent
-from src.rag.rag_system import create_vector_store
-from src.chains.evaluation_chain import create_evaluation_chain
+from src.core.agent_logic import create_agent, create_rag_agent, get_llm_routing_stats
+from src.core.opening_pool import WELCOME_MESSAGES, get_opening_pool
+from src.prompts.persona_prompts import PERSONA_PROMPTS
+from src.rag.rag_system import (
+    create_vector_store, start_warm_up, get_resource_status, get_index_version_info, reload_product_index
+)
+from src.chains.evaluation_chain import (
+    EvaluationParseError, format_conversation_history, parse_or_repair_evaluation, report_to_markdown, stream_evaluation
+)
 from src.utils.report_manager import report_manager
+from src.data_models.models import SCORE_LABELS
 from src.utils.conversation_helper import get_conversation_tips, analyze_conversation_quality, get_next_step_suggestion
+from src.utils.cancellation import CancelToken, LLMCancelled
+from src.utils.llm_scheduler import get_scheduler
+from src.utils.metrics import get_llm_usage_stats, get_stream_outcomes, get_stream_stats
+from src.utils.llm_cache import get_response_cache
+from config import PERFORMANCE_CONFIG
+
+RESOURCE_LABELS = {
+    "embedding_model": "BERT模型",
+    "vector_store": "向量数据库",
+    "keyword_index": "关键词索引",
+    "attribute_index": "属性索引",
+}
+
+def show_resource_status():
+    """显示后台预热资源的就绪状态"""
+    for name, status in get_resource_status().items():
+        label = RESOURCE_LABELS.get(name, name)
+        if status["state"] == "ready":
+            load_seconds = status["load_seconds"] or 0
+            st.caption(f"✅ {label}已就绪（加载耗时 {load_seconds:.1f}秒）")
+        elif status["state"] == "failed":
+            st.caption(f"⚠️ {label}加载失败: {status['error']}")
+        else:
+            st.caption(f"⏳ {label}后台加载中，期间使用关键词匹配")
+    version_info = get_index_version_info()
+    st.caption(f"📦 索引版本: {version_info['version']}（已热更新 {version_info['swaps']} 次）")
+
+def show_chat_message(message):
+    """显示一条聊天消息；客户回复附带首字延迟和生成耗时"""
+    role_display = "👤 销售" if message["role"] == "salesperson" else "🤖 客户"
+    with st.chat_message("user" if message["role"] == "salesperson" else "assistant"):
+        st.markdown(f"**{role_display}**: {message['content']}")
+        if "ttft_ms" in message:
+            st.caption(f"⚡ 首字 {message['ttft_ms']:.0f}ms · 完整回复 {message['total_ms']:.0f}ms")
+
+def run_cancel_token() -> CancelToken:
+    """
+    会话的取消令牌：会话重新开始时取消（cancel_session_work）。
+    页面发起新的运行（点击了其他按钮等）时，Streamlit 会在下一次页面输出时中断当前运行
+    """
+    if "cancel_token" not in st.session_state:
+        st.session_state.cancel_token = CancelToken()
+    return st.session_state.cancel_token
+
+def cancel_session_work():
+    """取消当前会话排队和生成中的LLM请求（包括代理记忆的后台摘要）"""
+    token = st.session_state.pop("cancel_token", None)
+    if token is not None:
+        token.cancel("会话重新开始")
+    agent = st.session_state.get("agent")
+    if agent is not None and hasattr(agent, "close"):
+        agent.close()
+
+def rollback_salesperson_message(prompt):
+    """
+    客户回复没有完成（取消、页面中断或出错）时撤回刚加入的销售消息：
+    未完成的轮次不会写入代理记忆，对话记录也不保留，两者保持一致
+    """
+    messages = st.session_state.get("messages")
+    if messages and messages[-1] == {"role": "salesperson", "content": prompt}:
+        messages.pop()
+
+def stream_customer_reply(agent, placeholder, text):
+    """流式生成客户回复并逐步显示，返回完整回复和计时"""
+    response = ""
+    for chunk in agent.stream(text, cancel_token=run_cancel_token()):
+        response += chunk
+        placeholder.markdown(f"**🤖 客户**: {response}▌")
+    placeholder.markdown(f"**🤖 客户**: {response}")
+    return response, agent.last_timing
+
+def show_generation_stats():
+    """显示客户回复的首字延迟统计"""
+    stats = get_stream_stats().get("customer_reply")
+    if stats and stats["ttft_ms"]["count"]:
+        st.caption(f"⚡ 客户回复首字延迟 p50 {stats['ttft_ms']['p50']:.0f}ms / p95 {stats['ttft_ms']['p95']:.0f}ms，"
+                   f"完整回复 p50 {stats['total_ms']['p50']:.0f}ms")
+    usage = get_llm_usage_stats().get("customer_reply")
+    if usage and usage["input_tokens"]:
+        hit, miss = stats["ttft_ms_cache_hit"], stats["ttft_ms_cache_miss"]
+        st.caption(f"🧩 上下文缓存命中 {usage['cache_hit_rate']:.0%} 的输入token，"
+                   f"首字延迟 p50 命中 {hit['p50']:.0f}ms / 未命中 {miss['p50']:.0f}ms")
+    outcomes = get_stream_outcomes()
+    cancelled = sum(o["cancelled"] for o in outcomes.values())
+    if cancelled:
+        completed = sum(o["completed"] for o in outcomes.values())
+        st.caption(f"🛑 已取消 {cancelled} 次生成（完成 {completed} 次）")
+    for router in get_llm_routing_stats().values():
+        st.caption("🔀 LLM后端 " + "，".join(
+            f"{name} {'🟢' if b['state'] == 'closed' else '🔴'} p50 {b['ttft_ms_p50'] or 0:.0f}ms 错误率 {b['error_rate']:.0%}"
+            for name, b in router["backends"].items()))
+    queues = get_scheduler().stats()["queues"]
+    if any(q["granted"] or q["queued"] for q in queues.values()):
+        st.caption("🚦 LLM排队 " + "，".join(
+            f"{name} 排队{q['queued']} 等待p95 {q['wait_ms']['p95']:.0f}ms"
+            for name, q in queues.items() if q["granted"] or q["queued"]))
+    if PERFORMANCE_CONFIG["llm_cache_mode"] != "live":
+        cache_stats = get_response_cache().stats()
+        st.caption(f"🗄️ LLM响应缓存（{PERFORMANCE_CONFIG['llm_cache_mode']}）：命中 {cache_stats['hits']} 次，"
+                   f"节省 {cache_stats['saved_seconds']:.1f}秒")
 
 def show_simulation_page():
     """显示模拟对话页面"""
@@ -18,6 +126,7 @@ def show_simulation_page():
         
         if use_rag:
             st.info("首次使用需要下载BERT模型(约90MB)并创建向量索引，请耐心等待。")
+            show_resource_status()
             
             if st.button("初始化BERT向量数据库"):
                 try:
@@ -25,21 +134,26 @@ def show_simulation_page():
                     progress_bar = st.progress(0)
                     status_text = st.empty()
                     
-                    # 模拟初始化步骤
-                    status_text.text("🔄 正在检查环境...")
-                    progress_bar.progress(20)
-                    
-                    status_text.text("📥 正在下载BERT模型...")
-                    progress_bar.progress(40)
-                    
-                    status_text.text("🔧 正在初始化向量数据库...")
-                    progress_bar.progress(60)
-                    
-                    success = create_vector_store()
-                    
-                    progress_bar.progress(80)
-                    status_text.text("✅ 正在完成初始化...")
-                    
+                    embed_start = {}
+
+                    def report_progress(stage, done, total):
+                        """显示真实的导入进度"""
+                        if stage == "scan":
+                            if done == total:
+                                status_text.text(f"📥 已扫描 {done} 个产品，正在加载BERT模型...")
+                            else:
+                                status_text.text(f"📂 正在读取产品目录... 已扫描 {done} 个产品")
+                        elif stage == "embed":
+                            started = embed_start.setdefault("time", time.time())
+                            if total:
+                                progress_bar.progress(min(done / total, 1.0))
+                            rate = done / max(time.time() - started, 1e-6)
+                            status_text.text(f"🔧 正在向量化产品: {done}/{total}（{rate:.0f} 个/秒）")
+                        elif stage == "save":
+                            status_text.text("💾 正在保存向量索引...")
+
+                    status_text.text("🔄 正在检查产品目录...")
+                    success = create_vector_store(progress_callback=report_progress)
                     progress_bar.progress(100)
                     
                     if success:
@@ -58,6 +172,15 @@ def show_simulation_page():
                     st.error(f"向量数据库初始化失败: {str(e)}")
                     st.info("建议取消勾选'使用BERT向量数据库增强'，使用基础模式。")
 
+            if st.button("重新加载产品目录"):
+                # 后台构建新索引版本，完成后热切换，当前对话不受影响
+                if reload_product_index():
+                    st.info("已开始在后台更新产品索引，完成后自动切换。")
+                else:
+                    st.info("产品索引正在更新中，请稍候。")
+
+        show_generation_stats()
+
         st.title("场景选择")
         customer_persona = st.selectbox(
             "请选择您想练习的客户类型:",
@@ -65,7 +188,13 @@ def show_simulation_page():
             key="persona_selector"
         )
         
+        # 后台为当前模式预生成各角色的开场白（进程内每种模式只在首次显示页面时触发，之后取用时补充）
+        get_opening_pool().prefill(PERSONA_PROMPTS, use_rag)
+        
         if st.button("开始模拟"):
+            # 取消上一次模拟中仍在进行的生成
+            cancel_session_work()
+            
             # 优化状态管理：只清理必要的状态
             keys_to_keep = ['vector_store_ready']
             temp_storage = {k: st.session_state.get(k) for k in keys_to_keep if k in st.session_state}
@@ -82,17 +211,27 @@ def show_simulation_page():
             st.session_state.persona = customer_persona
             st.session_state.use_rag = use_rag
             
+            # 优先使用预生成的开场白（代理记忆中已有第一轮对话），无需等待LLM
+            opening = get_opening_pool().take(customer_persona, use_rag)
+            if opening is not None:
+                st.session_state.agent = opening.agent
+                st.session_state.messages = [
+                    {"role": "salesperson", "content": opening.welcome_message},
+                    {"role": "customer", "content": opening.reply},
+                ]
+                st.rerun()
+            
             try:
                 def create_agent_with_monitoring():
                     if use_rag:
-                        agent = create_rag_agent(customer_persona, use_deepseek=True)
+                        agent = create_rag_agent(customer_persona)
                         if hasattr(st.session_state, 'vector_store_ready') and st.session_state.vector_store_ready:
                             st.success("使用BERT向量数据库增强模式")
                         else:
                             st.info("使用关键词匹配增强模式（备选方案）")
                         return agent
                     else:
-                        agent = create_agent(customer_persona, use_deepseek=True)
+                        agent = create_agent(customer_persona)
                         st.info("使用基础对话模式")
                         return agent
                 
@@ -118,23 +257,17 @@ def show_simulation_page():
                 agent_status.empty()
                 
                 # 销售先说欢迎语
-                welcome_message = "您好，欢迎光临！随便看看，有喜欢的可以叫我。"
+                welcome_message = WELCOME_MESSAGES[0]
                 st.session_state.messages.append({"role": "salesperson", "content": welcome_message})
                 
                 # 立即生成客户的初始反应
                 def get_initial_customer_response():
                     agent = st.session_state.agent
-                    
-                    if hasattr(st.session_state, 'use_rag') and st.session_state.use_rag:
-                        # RAG agent
-                        return agent.invoke({"input": welcome_message, "history": ""})
-                    else:
-                        # Simple conversation agent
-                        return agent.predict(input=welcome_message)
+                    response = "".join(agent.stream(welcome_message, cancel_token=run_cancel_token()))
+                    return {"role": "customer", "content": response, **agent.last_timing}
                 
                 try:
-                    customer_response = get_initial_customer_response()
-                    st.session_state.messages.append({"role": "customer", "content": customer_response})
+                    st.session_state.messages.append(get_initial_customer_response())
                 except Exception as e:
                     # 如果AI生成失败，给一个默认的客户反应
                     default_responses = {
@@ -144,6 +277,7 @@ def show_simulation_page():
                     }
                     fallback_response = default_responses.get(customer_persona, "你好，我想看看手镯。")
                     st.session_state.messages.append({"role": "customer", "content": fallback_response})
+                    st.session_state.agent.memory.add_turn(welcome_message, fallback_response)
                 
                 st.rerun()
             except Exception as e:
@@ -155,6 +289,7 @@ def show_simulation_page():
             
             with col1:
                 if st.button("🔄 重新开始", help="清空当前对话，重新开始模拟"):
+                    cancel_session_work()
                     # 清理对话状态
                     conversation_keys = ['messages', 'agent', 'report', 'current_report_id']
                     for key in conversation_keys:
@@ -192,10 +327,18 @@ def show_simulation_page():
                     report_progress = st.progress(0)
                     report_status = st.empty()
                     
+                    report_placeholder = st.empty()
+                    
                     def generate_report():
-                        eval_chain = create_evaluation_chain()
-                        history = "\n".join([f"{m['role']}: {m['content']}" for m in st.session_state.messages])
-                        return eval_chain.invoke({"conversation_history": history})
+                        history = format_conversation_history(st.session_state.messages)
+                        cancel_token = run_cancel_token()
+                        output = ""
+                        for chunk in stream_evaluation(history, cancel_token=cancel_token):
+                            output += chunk
+                            report_placeholder.caption(f"正在生成评估... 已接收 {len(output)} 字")
+                        report_placeholder.empty()
+                        # 模型输出JSON，解析（必要时修复）为结构化评估后渲染为Markdown
+                        return parse_or_repair_evaluation(output, cancel_token=cancel_token)
                     
                     # 步骤1：分析对话
                     report_status.text("📊 正在分析对话内容...")
@@ -205,7 +348,8 @@ def show_simulation_page():
                     report_status.text("🤖 AI正在生成评估报告...")
                     report_progress.progress(50)
                     
-                    report = generate_report()
+                    evaluation = generate_report()
+                    report = report_to_markdown(evaluation)
                     st.session_state.report = report
                     
                     # 步骤3：保存报告
@@ -215,7 +359,8 @@ def show_simulation_page():
                     report_id = report_manager.save_report(
                         report_content=report,
                         persona=st.session_state.persona,
-                        conversation_history=st.session_state.messages
+                        conversation_history=st.session_state.messages,
+                        evaluation=evaluation
                     )
                     st.session_state.current_report_id = report_id
                     
@@ -230,6 +375,10 @@ def show_simulation_page():
                     report_status.empty()
                         
                     st.rerun()
+                except LLMCancelled:
+                    pass  # 页面已发起新的运行或会话已重新开始
+                except EvaluationParseError as e:
+                    st.error(f"评估结果格式无效，请重新生成: {e}")
                 except Exception as e:
                     st.error(f"生成报告失败: {str(e)}")
                     st.info("请检查您的DeepSeek API配置。")
@@ -262,9 +411,7 @@ def show_simulation_page():
         st.header("对话记录")
         if "messages" in st.session_state:
             for message in st.session_state.messages:
-                role_display = "👤 销售" if message["role"] == "salesperson" else "🤖 客户"
-                with st.chat_message("user" if message["role"] == "salesperson" else "assistant"):
-                    st.markdown(f"**{role_display}**: {message['content']}")
+                show_chat_message(message)
                     
     elif "messages" in st.session_state:
         # 对话进行中，显示聊天界面
@@ -287,9 +434,7 @@ def show_simulation_page():
         # 显示所有聊天消息
         with chat_placeholder.container():
             for message in st.session_state.messages:
-                role_display = "👤 销售" if message["role"] == "salesperson" else "🤖 客户"
-                with st.chat_message("user" if message["role"] == "salesperson" else "assistant"):
-                    st.markdown(f"**{role_display}**: {message['content']}")
+                show_chat_message(message)
         
         # 实时提示区域
         if len(st.session_state.messages) > 2:
@@ -323,52 +468,34 @@ def show_simulation_page():
             # 立即更新聊天显示
             with chat_placeholder.container():
                 for message in st.session_state.messages:
-                    role_display = "👤 销售" if message["role"] == "salesperson" else "🤖 客户"
-                    with st.chat_message("user" if message["role"] == "salesperson" else "assistant"):
-                        st.markdown(f"**{role_display}**: {message['content']}")
+                    show_chat_message(message)
 
-            # 显示AI思考状态
+            # 流式显示客户回复（对话历史由agent自身的滚动摘要记忆维护）
             thinking_placeholder = st.empty()
-            with thinking_placeholder:
-                with st.chat_message("assistant"):
-                    st.markdown("🤖 **客户**: 正在思考中...")
-
+            replied = False
             try:
-                def get_ai_response():
-                    agent = st.session_state.agent
-                    
-                    # Handle different agent types
-                    if hasattr(st.session_state, 'use_rag') and st.session_state.use_rag:
-                        # RAG agent
-                        history = "\n".join([f"{m['role']}: {m['content']}" for m in st.session_state.messages])
-                        return agent.invoke({"input": prompt, "history": history})
-                    else:
-                        # Simple conversation agent
-                        return agent.predict(input=prompt)
-                
-                # 获取AI回复
-                response = get_ai_response()
-                
-                # 清除思考状态
-                thinking_placeholder.empty()
+                with thinking_placeholder.container():
+                    with st.chat_message("assistant"):
+                        reply_placeholder = st.empty()
+                        reply_placeholder.markdown("🤖 **客户**: 正在思考中...")
+                        response, timing = stream_customer_reply(st.session_state.agent, reply_placeholder, prompt)
                 
                 # 添加客户回复到状态
-                st.session_state.messages.append({"role": "customer", "content": response})
-                
-                # 更新完整的聊天显示
-                with chat_placeholder.container():
-                    for message in st.session_state.messages:
-                        role_display = "👤 销售" if message["role"] == "salesperson" else "🤖 客户"
-                        with st.chat_message("user" if message["role"] == "salesperson" else "assistant"):
-                            st.markdown(f"**{role_display}**: {message['content']}")
+                st.session_state.messages.append({"role": "customer", "content": response, **timing})
+                replied = True
                         
                 # 重新运行以更新界面
                 st.rerun()
                 
+            except LLMCancelled:
+                thinking_placeholder.empty()  # 会话已重新开始
             except Exception as e:
                 thinking_placeholder.empty()
-                st.error(f"AI回复失败: {str(e)}")
+                st.error(f"AI回复失败（本轮已撤回，请重新发送）: {str(e)}")
                 st.info("请检查您的DeepSeek API配置和网络连接。")
+            finally:
+                if not replied:
+                    rollback_salesperson_message(prompt)
                 
     else:
         # 初始状态
@@ -412,6 +539,21 @@ def show_reports_page():
         st.info("暂无历史报告。完成模拟后会自动保存报告到这里。")
         return
     
+    # 评分汇总（直接读取索引中的数值评分）
+    scores = report_manager.get_score_table()
+    if not scores.empty:
+        st.subheader("评分汇总")
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("已评分报告", len(scores))
+        with col2:
+            st.metric(f"平均{SCORE_LABELS['comprehensive_score']}", f"{scores['comprehensive_score'].mean():.1f}/10")
+        by_persona = scores.groupby("persona")[list(SCORE_LABELS)].mean().round(1)
+        st.dataframe(by_persona.rename(columns=SCORE_LABELS).rename_axis("客户类型"))
+        unscored = len(reports) - len(scores)
+        if unscored:
+            st.caption(f"{unscored} 个旧报告没有评分字段，可运行 python -m src.utils.report_manager 回填")
+
     # 批量操作区域
     st.subheader("批量操作")
     col1, col2, col3 = st.columns([2, 1, 1])
@@ -507,10 +649,15 @@ def show_reports_page():
                     for i, message in enumerate(report_data['conversation_history'], 1):
                         role = "👤 销售" if message['role'] == 'salesperson' else "🤖 客户"
                         st.markdown(f"**{i}. {role}**: {message['content']}")
+                else:
+                    st.error("加载报告失败")
 
 def main():
     st.set_page_config(page_title="金牌陪练 - AI 销售模拟系统", layout="wide")
 
+    # 后台预热模型和索引（只在服务启动后的第一次运行时启动）
+    start_warm_up()
+
     st.title("金牌陪练 - AI 销售模拟与陪练系统")
     
     # 页面导航
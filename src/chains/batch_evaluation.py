@@ -0,0 +1,212 @@
+"""
+批量评估 - 修改评估标准（EVALUATION_PROMPT_TEMPLATE）后重新评估 data/reports 中保存的全部对话
+
+- 逐个读取报告文件（不一次性载入），最多 concurrency 个评估同时进行；
+  请求走共享调度队列的批量优先级，不挤占在线会话
+- 每 flush_every 个结果批量写回报告文件（索引只写一次），写回后再记入检查点文件
+- 检查点按评估提示词的哈希区分：同一标准下重新运行会跳过已完成的报告，修改标准后自动从头开始；
+  单个报告失败只记录不中断，下次运行时重试
+- Ctrl+C / SIGTERM 时取消排队和生成中的请求，写回已完成的结果后退出，再次运行同一命令即可继续
+
+运行: python -m src.chains.batch_evaluation --concurrency 8
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import signal
+import time
+from typing import Dict, Iterator, List, Optional
+
+from config import PERFORMANCE_CONFIG
+from src.chains.evaluation_chain import (
+    EVALUATION_PROMPT_TEMPLATE,
+    aevaluate_conversation,
+    format_conversation_history,
+    report_to_markdown,
+)
+from src.utils.cancellation import CancelToken, LLMCancelled
+from src.utils.llm_scheduler import PRIORITY_BATCH, llm_priority
+from src.utils.report_manager import ReportManager
+
+
+def rubric_version() -> str:
+    """当前评估标准的版本（评估提示词的哈希）"""
+    return hashlib.sha1(EVALUATION_PROMPT_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+
+
+def iter_report_ids(reports_dir: str) -> Iterator[str]:
+    """逐个产出目录中的报告ID（按目录顺序，不预先列出全部文件）"""
+    with os.scandir(reports_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith("report_") and entry.name.endswith(".json"):
+                yield entry.name[len("report_"):-len(".json")]
+
+
+class Checkpoint:
+    """追加写入的检查点文件，每行一个结果 {"id", "status": "done"/"failed", "error"}"""
+
+    def __init__(self, path: str, restart: bool = False):
+        self.path = path
+        self.done = set()
+        content = ""
+        if restart and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            for line in content.splitlines():
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # 中断时写了一半的行
+                if entry.get("status") == "done":
+                    self.done.add(entry["id"])
+        self._file = open(path, "a", encoding="utf-8")
+        if content and not content.endswith("\n"):
+            self._file.write("\n")
+
+    def record(self, entries: List[Dict]):
+        for entry in entries:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(entry["id"] for entry in entries if entry["status"] == "done")
+
+    def close(self):
+        self._file.close()
+
+
+class BatchEvaluator:
+    """按有界并发重新评估报告目录中的对话，结果批量写回，进度记在检查点文件"""
+
+    def __init__(self, manager: ReportManager, concurrency: int = None, flush_every: int = None,
+                 checkpoint_path: str = None, restart: bool = False, llm=None):
+        self.manager = manager
+        self.concurrency = concurrency or PERFORMANCE_CONFIG["batch_evaluation_concurrency"]
+        self.flush_every = flush_every or PERFORMANCE_CONFIG["batch_evaluation_flush_every"]
+        self.checkpoint_path = checkpoint_path or os.path.join(
+            manager.reports_dir, f"batch_evaluation_{rubric_version()}.jsonl")
+        self.restart = restart
+        self.llm = llm
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "skipped": 0, "cancelled": 0}
+        self._pending = []
+        self._flush_lock = None
+        self._checkpoint = None
+        self._start = None
+
+    async def run(self, limit: int = None, cancel_token: CancelToken = None) -> Dict:
+        """评估尚未完成的报告（最多 limit 个），返回统计；cancel_token 被取消时写回已完成的结果后返回"""
+        token = cancel_token or CancelToken()
+        self._checkpoint = Checkpoint(self.checkpoint_path, self.restart)
+        self._flush_lock = asyncio.Lock()
+        self._start = time.perf_counter()
+        queue = asyncio.Queue(maxsize=self.concurrency * 2)
+        try:
+            # 任一工作任务出错（如写回失败）时任务组取消其余任务和下面的生产循环，不会卡在 queue.put 上
+            async with asyncio.TaskGroup() as group:
+                # 优先级在创建任务前设置，任务复制当前上下文
+                with llm_priority(PRIORITY_BATCH):
+                    for _ in range(self.concurrency):
+                        group.create_task(self._worker(queue, token))
+                await self._produce(queue, token, limit)
+        except ExceptionGroup as errors:
+            raise errors.exceptions[0]
+        finally:
+            await self._flush()
+            self._checkpoint.close()
+        return self.stats
+
+    async def _produce(self, queue: asyncio.Queue, token: CancelToken, limit: Optional[int]):
+        for report_id in iter_report_ids(self.manager.reports_dir):
+            if token.cancelled or (limit is not None and self.stats["submitted"] >= limit):
+                break
+            if report_id in self._checkpoint.done:
+                self.stats["skipped"] += 1
+                continue
+            await queue.put(report_id)
+            self.stats["submitted"] += 1
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _worker(self, queue: asyncio.Queue, token: CancelToken):
+        while True:
+            report_id = await queue.get()
+            if report_id is None:
+                return
+            if token.cancelled:
+                self.stats["cancelled"] += 1
+                continue
+            await self._evaluate(report_id, token)
+            if len(self._pending) >= self.flush_every:
+                await self._flush()
+
+    async def _evaluate(self, report_id: str, token: CancelToken):
+        report_data = await asyncio.to_thread(self.manager.load_report, report_id)
+        try:
+            if report_data is None:
+                raise ValueError("报告文件不存在或无法读取")
+            history = format_conversation_history(report_data["conversation_history"])
+            evaluation = await aevaluate_conversation(history, cancel_token=token, llm=self.llm)
+        except LLMCancelled:
+            self.stats["cancelled"] += 1  # 不记入检查点，下次运行重新评估
+            return
+        except Exception as e:
+            print(f"报告 {report_id} 评估失败: {e}")
+            self.stats["failed"] += 1
+            self._pending.append((report_id, None, str(e)))
+            return
+        self.stats["completed"] += 1
+        self._pending.append((report_id, evaluation, None))
+
+    async def _flush(self):
+        """把已完成的结果写回报告文件和索引，再记入检查点"""
+        async with self._flush_lock:
+            pending, self._pending = self._pending, []
+            if not pending:
+                return
+            updates = [(report_id, evaluation, report_to_markdown(evaluation))
+                       for report_id, evaluation, _ in pending if evaluation is not None]
+            try:
+                await asyncio.to_thread(self.manager.update_evaluations, updates)
+                self._checkpoint.record([
+                    {"id": report_id, "status": "failed", "error": error} if evaluation is None
+                    else {"id": report_id, "status": "done"}
+                    for report_id, evaluation, error in pending
+                ])
+            except BaseException:
+                # 写回失败时放回待写列表，结束时再试一次，已完成的评估不丢失
+                self._pending[:0] = pending
+                raise
+            elapsed = time.perf_counter() - self._start
+            done = self.stats["completed"] + self.stats["failed"]
+            print(f"已写回 {len(updates)} 个结果；本次共完成 {self.stats['completed']}、失败 {self.stats['failed']}，"
+                  f"{done / elapsed:.2f} 个/秒")
+
+
+async def _run_cli(args) -> Dict:
+    token = CancelToken()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, token.cancel, "收到中断信号")
+    evaluator = BatchEvaluator(ReportManager(args.reports_dir), args.concurrency, args.flush_every,
+                               restart=args.restart)
+    print(f"评估标准版本 {rubric_version()}，并发 {evaluator.concurrency}，检查点 {evaluator.checkpoint_path}")
+    return await evaluator.run(args.limit, token)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="按当前评估标准批量重新评估已保存的报告")
+    parser.add_argument("--reports-dir", default="data/reports")
+    parser.add_argument("--concurrency", type=int, default=PERFORMANCE_CONFIG["batch_evaluation_concurrency"])
+    parser.add_argument("--flush-every", type=int, default=PERFORMANCE_CONFIG["batch_evaluation_flush_every"])
+    parser.add_argument("--limit", type=int, default=None, help="本次最多评估的报告数")
+    parser.add_argument("--restart", action="store_true", help="忽略检查点，重新评估全部报告")
+    args = parser.parse_args(argv)
+    stats = asyncio.run(_run_cli(args))
+    print(f"批量评估结束: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
-from langchain_openai import ChatOpenAI
+import json
+import re
+
 from langchain.prompts import PromptTemplate
 from langchain.schema.output_parser import StrOutputParser
+from pydantic import ValidationError
 
-from config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL
+from config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL, PERFORMANCE_CONFIG
+from src.data_models.models import SCORE_LABELS, EvaluationReport
+from src.utils.cancellation import CancelToken, llm_kwargs
+from src.utils.llm_cache import with_response_cache
+from src.utils.llm_client import ResilientChatModel, create_chat_model
+from src.utils.llm_scheduler import PRIORITY_REPORT, ScheduledChatModel
+from src.utils.metrics import atimed_stream, timed_stream
 
-# 简化的评估提示词模板，减少token消耗
+# 简化的评估提示词模板，减少token消耗；要求输出JSON，解析为 EvaluationReport
 EVALUATION_PROMPT_TEMPLATE = """
-你是销售培训师。请对以下销售对话进行快速评估（请控制在200字以内）:
+你是销售培训师。请对以下销售对话进行快速评估:
 
 对话记录说明：
 - salesperson: 销售人员的话术
@@ -14,51 +23,193 @@ EVALUATION_PROMPT_TEMPLATE = """
 
 {conversation_history}
 
-请按以下格式简洁回复:
-
-**综合评分**: X/10
+请只输出一个JSON对象，不要输出其他文字。各项评分为0-10的整数，综合评分为0-10的数字:
+{{"comprehensive_score": 7.5, "demand_mining_score": 7, "product_recommendation_score": 8,
+"objection_handling_score": 6, "trust_building_score": 7, "closing_score": 6,
+"strengths": ["1-2个关键优点"], "suggestions": ["2-3个具体建议"]}}
+"""
 
-**各项评分**:
-需求挖掘: X/10
-产品推荐: X/10  
-异议处理: X/10
-建立信任: X/10
-推动成交: X/10
+# 输出无法解析时的修复提示词
+REPAIR_PROMPT_TEMPLATE = """
+下面的评估输出不是符合要求的JSON（{error}）:
 
-**优点**: [1-2个关键优点]
+{output}
 
-**改进建议**: [2-3个具体建议]
+请只输出修正后的JSON对象，字段为 comprehensive_score（0-10的数字）、demand_mining_score、
+product_recommendation_score、objection_handling_score、trust_building_score、closing_score（0-10的整数）、
+strengths 和 suggestions（字符串列表），不要输出其他文字。
 """
 
-# 缓存评估链实例
+
+class EvaluationParseError(ValueError):
+    """评估输出（修复后仍）无法解析为 EvaluationReport"""
+
+
+# 缓存评估链实例（及其中的提示词和模型，取消令牌需要绑定到模型上）
 _evaluation_chain = None
+_evaluation_prompt = None
+_evaluation_llm = None
 
 def create_evaluation_chain():
     """
     Creates a chain that evaluates a conversation history using DeepSeek.
     使用缓存避免重复创建
     """
-    global _evaluation_chain
+    global _evaluation_chain, _evaluation_prompt, _evaluation_llm
     
     if _evaluation_chain is None:
-        prompt = PromptTemplate(
+        _evaluation_prompt = PromptTemplate(
             template=EVALUATION_PROMPT_TEMPLATE,
             input_variables=["conversation_history"]
         )
         
-        llm = ChatOpenAI(
-            model_name=DEEPSEEK_MODEL,
-            openai_api_key=DEEPSEEK_API_KEY,
-            openai_api_base=DEEPSEEK_BASE_URL,
+        llm = create_chat_model(
+            DEEPSEEK_MODEL,
+            DEEPSEEK_API_KEY,
+            DEEPSEEK_BASE_URL,
             temperature=0.1,  # 降低温度，提高稳定性和速度
-            max_tokens=300,   # 限制输出长度
-            streaming=True    # 启用流式输出
+            max_tokens=PERFORMANCE_CONFIG["evaluation_max_tokens"],  # 限制输出长度
+            streaming=True,   # 启用流式输出
+            stream_usage=True # 流式输出末尾返回token用量
         )
+        _evaluation_llm = with_response_cache(ScheduledChatModel(ResilientChatModel(llm), PRIORITY_REPORT))
 
         _evaluation_chain = (
-            prompt
-            | llm
+            _evaluation_prompt
+            | _evaluation_llm
             | StrOutputParser()
         )
     
-    return _evaluation_chain 
\ No newline at end of file
+    return _evaluation_chain
+
+def stream_evaluation(conversation_history: str, timing=None, cancel_token: CancelToken = None):
+    """
+    逐块产出评估报告，首token延迟和总耗时记录在 timing 和 get_stream_stats()["evaluation"]；
+    cancel_token 被取消时停止排队或生成（抛出 LLMCancelled）
+    """
+    chain = create_evaluation_chain()
+    if cancel_token is not None:
+        chain = _evaluation_prompt | _evaluation_llm.bind(cancel_token=cancel_token) | StrOutputParser()
+    return timed_stream(chain.stream({"conversation_history": conversation_history}), "evaluation", timing)
+
+
+def parse_evaluation(text: str) -> EvaluationReport:
+    """把模型输出解析为 EvaluationReport（容忍代码块标记和JSON前后的多余文字），失败抛出 EvaluationParseError"""
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0:
+        raise EvaluationParseError("输出中没有JSON对象")
+    if end < start:
+        raise EvaluationParseError("JSON不完整（输出可能被截断）")
+    try:
+        return EvaluationReport.model_validate(json.loads(text[start:end + 1]))
+    except json.JSONDecodeError as e:
+        raise EvaluationParseError(f"JSON格式错误: {e}") from e
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+        raise EvaluationParseError(f"字段校验失败: {errors}") from e
+
+
+def _parse_or_repair_prompt(text: str, attempt: int):
+    """解析成功返回 (report, None)；失败且还能修复时返回 (None, 修复提示词)，修复次数用完时抛出 EvaluationParseError"""
+    try:
+        return parse_evaluation(text), None
+    except EvaluationParseError as e:
+        if attempt >= PERFORMANCE_CONFIG["evaluation_repair_attempts"]:
+            raise
+        print(f"评估输出解析失败（第{attempt + 1}次）: {e}，请求模型修复")
+        return None, REPAIR_PROMPT_TEMPLATE.format(error=e, output=text)
+
+
+def _default_llm():
+    create_evaluation_chain()
+    return _evaluation_llm
+
+
+def format_conversation_history(messages) -> str:
+    """评估提示词中的对话记录，每行为 role: content"""
+    return "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+
+
+def parse_or_repair_evaluation(text: str, cancel_token: CancelToken = None, llm=None) -> EvaluationReport:
+    """
+    解析评估输出；失败时把输出和错误发回模型修复，最多 evaluation_repair_attempts 次，
+    仍失败抛出 EvaluationParseError
+    """
+    llm = llm or _default_llm()
+    attempt = 0
+    while True:
+        report, prompt = _parse_or_repair_prompt(text, attempt)
+        if report is not None:
+            return report
+        text = llm.invoke(prompt, **llm_kwargs(cancel_token)).content
+        attempt += 1
+
+
+async def aparse_or_repair_evaluation(text: str, cancel_token: CancelToken = None, llm=None) -> EvaluationReport:
+    """parse_or_repair_evaluation 的异步版本"""
+    llm = llm or _default_llm()
+    attempt = 0
+    while True:
+        report, prompt = _parse_or_repair_prompt(text, attempt)
+        if report is not None:
+            return report
+        text = (await llm.ainvoke(prompt, **llm_kwargs(cancel_token))).content
+        attempt += 1
+
+
+def evaluate_conversation(conversation_history: str, timing=None, cancel_token: CancelToken = None) -> EvaluationReport:
+    """流式生成评估并解析（必要时修复）为 EvaluationReport"""
+    text = "".join(stream_evaluation(conversation_history, timing, cancel_token))
+    return parse_or_repair_evaluation(text, cancel_token)
+
+
+async def aevaluate_conversation(conversation_history: str, timing=None, cancel_token: CancelToken = None,
+                                 llm=None) -> EvaluationReport:
+    """异步评估（批量评估用），llm 默认为评估链的模型；耗时记录在 get_stream_stats()["evaluation"]"""
+    llm = llm or _default_llm()
+    prompt = EVALUATION_PROMPT_TEMPLATE.format(conversation_history=conversation_history)
+    chunks = llm.astream(prompt, **llm_kwargs(cancel_token))
+    text = "".join([chunk async for chunk in atimed_stream(chunks, "evaluation", timing)])
+    return await aparse_or_repair_evaluation(text, cancel_token, llm)
+
+
+def report_to_markdown(report: EvaluationReport) -> str:
+    """把结构化评估渲染为页面展示和导出用的Markdown"""
+    scores = report.scores()
+    lines = [f"**{SCORE_LABELS['comprehensive_score']}**: {scores.pop('comprehensive_score'):g}/10", "", "**各项评分**:"]
+    lines += [f"{SCORE_LABELS[name]}: {value}/10  " for name, value in scores.items()]
+    lines += ["", "**优点**:"] + [f"- {item}" for item in report.strengths]
+    lines += ["", "**改进建议**:"] + [f"{i}. {item}" for i, item in enumerate(report.suggestions, 1)]
+    return "\n".join(lines)
+
+
+def _markdown_section(text: str, title: str, next_title: str = None) -> str:
+    pattern = rf"{title}\**\s*[:：]?\**(.*?)" + (rf"\**{next_title}" if next_title else r"\Z")
+    match = re.search(pattern, text, re.S)
+    return match.group(1) if match else ""
+
+
+def _markdown_items(section: str):
+    items = []
+    for line in re.split(r"[\n；;]", section):
+        item = re.sub(r"^\s*(?:[-*•]|\d+[.、)）])\s*", "", line).strip().strip("[]【】").strip()
+        if item:
+            items.append(item)
+    return items
+
+
+def parse_markdown_report(text: str) -> EvaluationReport:
+    """解析旧版Markdown格式的评估报告（回填历史报告的评分用），评分不全时抛出 EvaluationParseError"""
+    data = {}
+    for name, label in SCORE_LABELS.items():
+        match = re.search(rf"{label}\**\s*[:：]\s*\**\s*(\d+(?:\.\d+)?)\s*(?:/|分|$)", text, re.M)
+        if not match:
+            raise EvaluationParseError(f"没有找到{label}")
+        value = float(match.group(1))
+        data[name] = value if name == "comprehensive_score" else round(value)
+    data["strengths"] = _markdown_items(_markdown_section(text, "优点", "改进建议"))
+    data["suggestions"] = _markdown_items(_markdown_section(text, "改进建议"))
+    try:
+        return EvaluationReport.model_validate(data)
+    except ValidationError as e:
+        raise EvaluationParseError(f"字段校验失败: {e}") from e
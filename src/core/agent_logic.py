@@ -1,41 +1,207 @@
-from langchain.chains import ConversationChain
-from langchain.memory import ConversationBufferMemory
-from langchain_openai import ChatOpenAI
+import asyncio
+import threading
+import time
+
 from langchain.prompts import PromptTemplate
 
-from src.prompts.persona_prompts import PERSONA_PROMPTS
-from src.rag.rag_system import query_vector_store
-from config import DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL, OPENAI_API_KEY
+from src.memory.conversation_memory import create_conversation_memory
+from src.prompts.memory_prompts import SUMMARY_PROMPT
+from src.prompts.persona_prompts import PERSONA_PROMPTS, PERSONA_RAG_PROMPTS, PERSONA_RETRIEVAL_FILTERS
+from src.rag.rag_system import aquery_vector_store, query_vector_store
+from src.utils.cancellation import CancelToken, llm_kwargs
+from src.utils.llm_cache import with_response_cache
+from src.utils.llm_client import ResilientChatModel, create_chat_model
+from src.utils.llm_router import Backend, LLMRouter
+from src.utils.llm_scheduler import PRIORITY_BATCH, ScheduledChatModel, llm_priority
+from src.utils.metrics import atimed_stream, record_usage, timed_stream
+from config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL, DEEPSEEK_MODEL, LLM_FAST_MODEL, OPENAI_API_KEY, OPENAI_BASE_URL,
+    OPENAI_MODEL, PERFORMANCE_CONFIG,
+)
 
 # 全局LLM实例缓存，避免重复创建
 _llm_cache = {}
+_llm_cache_lock = threading.Lock()
+# 已创建的路由（用于展示各后端状态）
+_routers = {}
 
-def get_llm(use_deepseek: bool = True, temperature: float = 0.7):
-    """获取缓存的LLM实例，避免重复创建"""
-    cache_key = f"{'deepseek' if use_deepseek else 'openai'}_{temperature}"
-    
-    if cache_key not in _llm_cache:
-        if use_deepseek:
-            _llm_cache[cache_key] = ChatOpenAI(
-                model_name=DEEPSEEK_MODEL,
-                openai_api_key=DEEPSEEK_API_KEY,
-                openai_api_base=DEEPSEEK_BASE_URL,
-                temperature=temperature,
-                streaming=True,  # 启用流式输出
-                max_tokens=500,  # 限制输出长度，提高响应速度
-            )
-        else:
-            _llm_cache[cache_key] = ChatOpenAI(
-                model_name="gpt-3.5-turbo",
-                openai_api_key=OPENAI_API_KEY,
-                temperature=temperature,
-                streaming=True,
-                max_tokens=500,
-            )
-    
+def _is_configured(api_key: str) -> bool:
+    return bool(api_key) and not api_key.startswith("YOUR_")
+
+def _provider_credentials(provider: str):
+    """后端的 (API密钥, 接口地址)"""
+    if provider == "deepseek":
+        return DEEPSEEK_API_KEY, DEEPSEEK_BASE_URL
+    if provider == "openai":
+        return OPENAI_API_KEY, OPENAI_BASE_URL
+    raise ValueError(f"未知的LLM后端: {provider}")
+
+def _create_backend(provider: str, model: str, temperature: float) -> Backend:
+    """创建一个可路由的后端：共享连接池 + 重试/对冲"""
+    api_key, base_url = _provider_credentials(provider)
+    llm = create_chat_model(
+        model,
+        api_key,
+        base_url,
+        temperature=temperature,
+        streaming=True,  # 启用流式输出
+        stream_usage=True,  # 流式输出末尾返回token用量（含上下文缓存命中数）
+        max_tokens=500,  # 限制输出长度，提高响应速度
+    )
+    return Backend(f"{provider}:{model}", ResilientChatModel(llm))
+
+def _default_backends(temperature: float):
+    """DeepSeek为主后端，配置了OpenAI密钥时加入OpenAI"""
+    backends = [_create_backend("deepseek", DEEPSEEK_MODEL, temperature)]
+    if _is_configured(OPENAI_API_KEY):
+        backends.append(_create_backend("openai", OPENAI_MODEL, temperature))
+    return backends
+
+def _finish_llm(cache_key: str, backends):
+    """多个后端时加上路由，再加全局调度（默认为交互优先级）和响应缓存"""
+    if len(backends) == 1:
+        llm = backends[0].llm
+    else:
+        llm = _routers[cache_key] = LLMRouter(backends, name=cache_key)
+    _llm_cache[cache_key] = with_response_cache(ScheduledChatModel(llm))
     return _llm_cache[cache_key]
 
-def create_agent(persona_name: str, use_deepseek: bool = True):
+def get_llm(use_deepseek: bool = None, temperature: float = 0.7):
+    """
+    获取缓存的LLM实例，避免重复创建；按配置的 llm_cache_mode 加上响应缓存。
+    use_deepseek 为 None 时在已配置的后端之间路由，True/False 固定使用 DeepSeek/OpenAI
+    """
+    if use_deepseek is None and not PERFORMANCE_CONFIG["llm_routing_enabled"]:
+        use_deepseek = True
+    route = "auto" if use_deepseek is None else "deepseek" if use_deepseek else "openai"
+    cache_key = f"{route}_{temperature}"
+    
+    with _llm_cache_lock:
+        if cache_key not in _llm_cache:
+            if route == "auto":
+                backends = _default_backends(temperature)
+            elif route == "deepseek":
+                backends = [_create_backend("deepseek", DEEPSEEK_MODEL, temperature)]
+            else:
+                backends = [_create_backend("openai", OPENAI_MODEL, temperature)]
+            _finish_llm(cache_key, backends)
+        return _llm_cache[cache_key]
+
+def _parse_fast_model(spec: str):
+    """解析 LLM_FAST_MODEL（"后端:模型"），返回 (后端, 模型)；格式不对、后端未知或未配置密钥时抛出 ValueError"""
+    provider, sep, model = spec.partition(":")
+    if not sep or not provider or not model:
+        raise ValueError(f"格式应为 \"后端:模型\"（如 \"openai:gpt-4o-mini\"），实际为 \"{spec}\"")
+    api_key, _ = _provider_credentials(provider)
+    if not _is_configured(api_key):
+        raise ValueError(f"后端 {provider} 未配置API密钥")
+    return provider, model
+
+def get_fast_llm(temperature: float = 0.7):
+    """
+    短轮次使用的模型（LLM_FAST_MODEL 优先，失败时切换到默认后端）；未配置时返回None。
+    配置无效时打印一次警告并返回None，短轮次也使用主模型
+    """
+    if not LLM_FAST_MODEL:
+        return None
+    cache_key = f"fast_{temperature}"
+    with _llm_cache_lock:
+        if cache_key not in _llm_cache:
+            try:
+                provider, model = _parse_fast_model(LLM_FAST_MODEL)
+            except ValueError as e:
+                print(f"LLM_FAST_MODEL 配置无效，短轮次改用主模型: {e}")
+                _llm_cache[cache_key] = None
+            else:
+                _finish_llm(cache_key, [_create_backend(provider, model, temperature)] + _default_backends(temperature))
+        return _llm_cache[cache_key]
+
+def get_llm_routing_stats():
+    """各路由的后端状态、延迟和错误率"""
+    return {name: router.stats() for name, router in _routers.items()}
+
+def _pick_llm(llm, fast_llm, input: str):
+    """销售的话很短时（如"好的"、"还有别的吗"）使用更快的模型"""
+    if fast_llm is not None and len(input.strip()) <= PERFORMANCE_CONFIG["llm_fast_turn_max_chars"]:
+        return fast_llm
+    return llm
+
+def _response_text(response) -> str:
+    """提取LLM返回的文本内容"""
+    if hasattr(response, 'content'):
+        return response.content
+    return str(response)
+
+def _create_memory(persona_name: str, use_deepseek: bool = None):
+    """创建按token预算的滚动摘要记忆，较早的对话由LLM在后台摘要"""
+    summary_llm = get_llm(use_deepseek, temperature=0.3)
+    memory = None
+
+    def summarize(previous_summary, lines):
+        formatted_prompt = SUMMARY_PROMPT.format(summary=previous_summary or "无", new_lines="\n".join(lines))
+        # 后台摘要不与客户对话抢占LLM预算；会话结束（memory.close()）时取消
+        with llm_priority(PRIORITY_BATCH):
+            response = summary_llm.invoke(formatted_prompt, **llm_kwargs(memory.cancel_token))
+        record_usage("memory_summary", getattr(response, "usage_metadata", None))
+        return _response_text(response)
+
+    # "预算敏感型 (王女士)" -> "王女士"
+    memory = create_conversation_memory(summarize, human_prefix="销售", ai_prefix=persona_name.split(" ")[1].strip("()"))
+    return memory
+
+class SimpleConversationChain:
+    """
+    轻量级对话链：角色提示词 + 滚动摘要记忆。
+    cancel_token 被取消时停止排队或生成（抛出 LLMCancelled），本轮不写入记忆
+    """
+
+    def __init__(self, llm, prompt: PromptTemplate, memory, fast_llm=None):
+        self.llm = llm
+        self.fast_llm = fast_llm
+        self.prompt = prompt
+        self.memory = memory
+        self.last_timing = {}
+
+    def stream(self, input: str, cancel_token: CancelToken = None):
+        """逐块产出客户回复；完整回复生成后才写入记忆，首token延迟等记录在 last_timing"""
+        timing = self.last_timing = {}
+        start = time.perf_counter()
+        formatted_prompt = self.prompt.format(history=self.memory.render(), input=input)
+        llm = _pick_llm(self.llm, self.fast_llm, input)
+        chunks = []
+        for text in timed_stream(llm.stream(formatted_prompt, **llm_kwargs(cancel_token)), "customer_reply",
+                                 timing, start):
+            chunks.append(text)
+            yield text
+        self.memory.add_turn(input, "".join(chunks))
+
+    def predict(self, input: str, cancel_token: CancelToken = None) -> str:
+        return "".join(self.stream(input, cancel_token))
+
+    def invoke(self, inputs, cancel_token: CancelToken = None) -> str:
+        return self.predict(inputs.get("input", ""), cancel_token)
+
+    async def astream(self, input: str, cancel_token: CancelToken = None):
+        """stream 的异步版本：由事件循环驱动，一个事件循环可同时服务多个会话"""
+        timing = self.last_timing = {}
+        start = time.perf_counter()
+        formatted_prompt = self.prompt.format(history=self.memory.render(), input=input)
+        llm = _pick_llm(self.llm, self.fast_llm, input)
+        chunks = []
+        async for text in atimed_stream(llm.astream(formatted_prompt, **llm_kwargs(cancel_token)), "customer_reply",
+                                        timing, start):
+            chunks.append(text)
+            yield text
+        self.memory.add_turn(input, "".join(chunks))
+
+    async def ainvoke(self, inputs, cancel_token: CancelToken = None) -> str:
+        return "".join([text async for text in self.astream(inputs.get("input", ""), cancel_token)])
+
+    def close(self):
+        """会话结束：取消记忆中进行中和排队中的摘要"""
+        self.memory.close()
+
+def create_agent(persona_name: str, use_deepseek: bool = None):
     """
     Creates a simple LangChain agent for a given customer persona.
     """
@@ -44,82 +210,97 @@ def create_agent(persona_name: str, use_deepseek: bool = True):
 
     prompt = PERSONA_PROMPTS[persona_name]
     llm = get_llm(use_deepseek, temperature=0.7)
+    fast_llm = get_fast_llm(temperature=0.7) if use_deepseek is None else None
 
-    # 使用更轻量的内存管理
-    memory = ConversationBufferMemory(
-        ai_prefix=persona_name.split(" ")[1],
-        max_token_limit=1000,  # 限制内存长度
-        return_messages=False   # 减少内存开销
-    )
-    
-    conversation = ConversationChain(
-        llm=llm,
-        prompt=prompt,
-        memory=memory,
-        verbose=False  # 关闭详细日志，提高性能
-    )
-
-    return conversation
+    return SimpleConversationChain(llm, prompt, _create_memory(persona_name, use_deepseek), fast_llm)
 
-def create_rag_agent(persona_name: str, use_deepseek: bool = True):
+def create_rag_agent(persona_name: str, use_deepseek: bool = None):
     """
     Creates a simple RAG-powered agent using keyword matching.
     """
     if persona_name not in PERSONA_PROMPTS:
         raise ValueError(f"Unknown persona: {persona_name}")
 
-    base_prompt = PERSONA_PROMPTS[persona_name]
-    
-    # 简化的提示词模板
-    enhanced_template = base_prompt.template + """
-
-相关产品信息:
-{context}
-
-请简洁地以您的角色身份回应（控制在100字以内）：
-"""
-
-    prompt = PromptTemplate(
-        template=enhanced_template,
-        input_variables=["history", "input", "context"]
-    )
+    # 角色设定在前、产品信息在后，保持跨轮次、跨会话稳定的prompt前缀
+    prompt = PERSONA_RAG_PROMPTS[persona_name]
+    retrieval_filters = PERSONA_RETRIEVAL_FILTERS.get(persona_name)
 
     # 使用缓存的LLM实例
     llm = get_llm(use_deepseek, temperature=0.7)
+    fast_llm = get_fast_llm(temperature=0.7) if use_deepseek is None else None
+    memory = _create_memory(persona_name, use_deepseek)
 
-    def rag_chain_invoke(inputs):
-        """优化的RAG链调用函数"""
-        user_input = inputs.get("input", "")
-        history = inputs.get("history", "")
-        
-        # 限制历史记录长度，提高性能
-        history_lines = history.split('\n')
-        if len(history_lines) > 10:  # 只保留最近10轮对话
-            history = '\n'.join(history_lines[-10:])
+    def context_of(relevant_docs):
+        return relevant_docs[0].page_content if relevant_docs else "暂无相关产品信息"
+
+    def rag_chain_stream(user_input, timing, cancel_token):
+        """优化的RAG链：检索后流式生成回复"""
+        start = time.perf_counter()
         
         # 获取相关产品信息（减少检索数量）
-        relevant_docs = query_vector_store(user_input, k=1)  # 只检索1个最相关的
-        context = relevant_docs[0].page_content if relevant_docs else "暂无相关产品信息"
+        relevant_docs = query_vector_store(user_input, k=1, filters=retrieval_filters)  # 只检索1个最相关的
+        context = context_of(relevant_docs)
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
         
         # 格式化提示（简化）
         formatted_prompt = prompt.format(
-            history=history,
+            history=memory.render(),
             input=user_input,
             context=context
         )
         
-        # 调用LLM
-        response = llm.invoke(formatted_prompt)
-        
-        # 提取文本内容
-        if hasattr(response, 'content'):
-            return response.content
-        else:
-            return str(response)
+        # 流式调用LLM，首token延迟包含检索耗时
+        chunks = []
+        turn_llm = _pick_llm(llm, fast_llm, user_input)
+        for text in timed_stream(turn_llm.stream(formatted_prompt, **llm_kwargs(cancel_token)), "customer_reply",
+                                 timing, start):
+            chunks.append(text)
+            yield text
+        memory.add_turn(user_input, "".join(chunks))
+
+    async def rag_chain_astream(user_input, timing, cancel_token):
+        """异步RAG链：检索在共享线程池中进行，同时组装prompt的其余部分（历史记忆、输入）"""
+        start = time.perf_counter()
+        retrieval = asyncio.ensure_future(aquery_vector_store(user_input, k=1, filters=retrieval_filters))
+        try:
+            partial_prompt = prompt.partial(history=memory.render(), input=user_input)
+            relevant_docs = await retrieval
+        finally:
+            retrieval.cancel()
+        formatted_prompt = partial_prompt.format(context=context_of(relevant_docs))
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled()
+
+        chunks = []
+        turn_llm = _pick_llm(llm, fast_llm, user_input)
+        async for text in atimed_stream(turn_llm.astream(formatted_prompt, **llm_kwargs(cancel_token)),
+                                        "customer_reply", timing, start):
+            chunks.append(text)
+            yield text
+        memory.add_turn(user_input, "".join(chunks))
     
     # 创建轻量级调用包装器
     class SimpleRAGChain:
-        def invoke(self, inputs):
-            return rag_chain_invoke(inputs)
+        def __init__(self):
+            self.memory = memory
+            self.last_timing = {}
+
+        def stream(self, input: str, cancel_token: CancelToken = None):
+            self.last_timing = {}
+            return rag_chain_stream(input, self.last_timing, cancel_token)
+
+        def invoke(self, inputs, cancel_token: CancelToken = None):
+            return "".join(self.stream(inputs.get("input", ""), cancel_token))
+
+        def astream(self, input: str, cancel_token: CancelToken = None):
+            self.last_timing = {}
+            return rag_chain_astream(input, self.last_timing, cancel_token)
+
+        async def ainvoke(self, inputs, cancel_token: CancelToken = None):
+            return "".join([text async for text in self.astream(inputs.get("input", ""), cancel_token)])
+
+        def close(self):
+            self.memory.close()
     
-    return SimpleRAGChain() 
\ No newline at end of file
+    return SimpleRAGChain()
@@ -0,0 +1,192 @@
+"""
+客户开场白预生成池 - "开始模拟"时直接取用，不再同步等待LLM
+
+每个 (角色, 是否RAG) 保留若干个已完成第一轮对话的代理（记忆中已有欢迎语和客户回复），
+被取走后在后台线程中补充。生成失败时按指数增长的间隔重试；连续出现鉴权、配置等不可重试的错误
+（如未配置API密钥）时停止预生成该角色。池空时调用方退回同步生成。
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Optional
+
+from config import PERFORMANCE_CONFIG
+from src.core.agent_logic import create_agent, create_rag_agent
+from src.utils.llm_client import is_retryable
+from src.utils.llm_scheduler import PRIORITY_BATCH, llm_priority
+
+# 销售的欢迎语轮换使用，开场更多样（开启LLM响应缓存时相同prompt会得到相同回复）
+WELCOME_MESSAGES = (
+    "您好，欢迎光临！随便看看，有喜欢的可以叫我。",
+    "您好，欢迎光临！今天想看看什么样的首饰？",
+    "欢迎光临！这边是我们的黄金手镯专柜，您可以随意试戴。",
+    "您好！我们店里新到了一批手镯，需要我给您介绍一下吗？",
+)
+
+_opening_pool = None
+_opening_pool_lock = threading.Lock()
+
+
+class Opening:
+    """一个已完成第一轮对话的代理"""
+
+    __slots__ = ("agent", "welcome_message", "reply", "timing", "created_at")
+
+    def __init__(self, agent, welcome_message: str, reply: str, timing: Dict):
+        self.agent = agent
+        self.welcome_message = welcome_message
+        self.reply = reply
+        self.timing = timing
+        self.created_at = time.time()
+
+
+class OpeningPool:
+    """
+    agent_factory(角色名, 是否RAG) -> 新代理（需有 stream() 和 last_timing）。
+    fill() 在后台补足各角色的开场白，prefill() 每种模式只补足一次（页面每次重新运行都会调用），
+    之后由 take() 取走时补充；take() 立即返回一个开场白或None
+    """
+
+    def __init__(self, agent_factory: Callable[[str, bool], object], size: int = 3, workers: int = 2,
+                 retry_seconds: float = 30.0, retry_max_seconds: float = 1800.0, max_config_failures: int = 3):
+        self.agent_factory = agent_factory
+        self.size = size
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.max_config_failures = max_config_failures
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="opening-pool")
+        self._lock = threading.Lock()
+        self._ready: Dict[tuple, deque] = {}
+        self._pending: Dict[tuple, int] = {}
+        self._retry_after: Dict[tuple, float] = {}
+        self._failure_streak: Dict[tuple, int] = {}
+        self._config_failure_streak: Dict[tuple, int] = {}
+        self._disabled = set()
+        self._prefilled = set()
+        self._welcome_index = 0
+
+        self.generated = 0
+        self.failures = 0
+        self.hits = 0
+        self.misses = 0
+
+    def fill(self, persona_names: Iterable[str], use_rag: bool = False):
+        """为各角色安排后台生成，补足到 size 个（已在生成中的计入）"""
+        for persona_name in persona_names:
+            key = (persona_name, use_rag)
+            with self._lock:
+                if key in self._disabled or time.time() < self._retry_after.get(key, 0):
+                    continue
+                missing = self.size - len(self._ready.get(key, ())) - self._pending.get(key, 0)
+                if missing <= 0:
+                    continue
+                self._pending[key] = self._pending.get(key, 0) + missing
+            for _ in range(missing):
+                self._executor.submit(self._generate, key)
+
+    def prefill(self, persona_names: Iterable[str], use_rag: bool = False):
+        """首次调用时为各角色补足开场白（每种模式只执行一次）"""
+        with self._lock:
+            if use_rag in self._prefilled:
+                return
+            self._prefilled.add(use_rag)
+        self.fill(persona_names, use_rag)
+
+    def _next_welcome(self) -> str:
+        with self._lock:
+            message = WELCOME_MESSAGES[self._welcome_index % len(WELCOME_MESSAGES)]
+            self._welcome_index += 1
+            return message
+
+    def _generate(self, key: tuple):
+        persona_name, use_rag = key
+        try:
+            agent = self.agent_factory(persona_name, use_rag)
+            welcome_message = self._next_welcome()
+            # 预生成不与正在进行的对话抢占LLM预算
+            with llm_priority(PRIORITY_BATCH):
+                reply = "".join(agent.stream(welcome_message))
+            opening = Opening(agent, welcome_message, reply, dict(agent.last_timing))
+        except Exception as e:
+            self._on_failure(key, e)
+            return
+        with self._lock:
+            self._pending[key] -= 1
+            self._ready.setdefault(key, deque()).append(opening)
+            self.generated += 1
+            self._failure_streak.pop(key, None)
+            self._config_failure_streak.pop(key, None)
+
+    def _on_failure(self, key: tuple, error: Exception):
+        """
+        记录失败：每一轮失败后重试间隔翻倍（不超过上限），同一轮并发生成的其余失败不再延长间隔、不重复打印；
+        连续 max_config_failures 次不可重试的错误（鉴权失败、未配置密钥等）后不再为该角色预生成
+        """
+        persona_name = key[0]
+        now = time.time()
+        message = None
+        with self._lock:
+            self._pending[key] -= 1
+            self.failures += 1
+            if key in self._disabled:
+                return
+            if is_retryable(error):
+                self._config_failure_streak.pop(key, None)
+            else:
+                self._config_failure_streak[key] = self._config_failure_streak.get(key, 0) + 1
+            if self._config_failure_streak.get(key, 0) >= self.max_config_failures:
+                self._disabled.add(key)
+                message = f"预生成开场白连续失败（{persona_name}）: {error}，停止预生成，请检查API密钥等配置后重启"
+            elif now >= self._retry_after.get(key, 0):
+                streak = self._failure_streak[key] = self._failure_streak.get(key, 0) + 1
+                delay = min(self.retry_max_seconds, self.retry_seconds * 2 ** (streak - 1))
+                self._retry_after[key] = now + delay
+                message = f"预生成开场白失败（{persona_name}）: {error}，{delay:g}秒后重试"
+        if message:
+            print(message)
+
+    def take(self, persona_name: str, use_rag: bool = False) -> Optional[Opening]:
+        """取一个开场白（不等待）并在后台补充；池空时返回None"""
+        key = (persona_name, use_rag)
+        with self._lock:
+            ready = self._ready.get(key)
+            opening = ready.popleft() if ready else None
+            if opening is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        self.fill([persona_name], use_rag)
+        return opening
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "ready": {f"{name}{' RAG' if use_rag else ''}": len(q) for (name, use_rag), q in self._ready.items()},
+                "pending": sum(self._pending.values()),
+                "generated": self.generated,
+                "failures": self.failures,
+                "disabled": sorted(f"{name}{' RAG' if use_rag else ''}" for name, use_rag in self._disabled),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def get_opening_pool() -> OpeningPool:
+    """进程内所有会话共享的开场白池"""
+    global _opening_pool
+    with _opening_pool_lock:
+        if _opening_pool is None:
+            def create(persona_name, use_rag):
+                factory = create_rag_agent if use_rag else create_agent
+                return factory(persona_name)
+
+            _opening_pool = OpeningPool(
+                create,
+                size=PERFORMANCE_CONFIG["opening_pool_size"],
+                workers=PERFORMANCE_CONFIG["opening_pool_workers"],
+                retry_seconds=PERFORMANCE_CONFIG["opening_pool_retry_seconds"],
+                retry_max_seconds=PERFORMANCE_CONFIG["opening_pool_retry_max_seconds"],
+                max_config_failures=PERFORMANCE_CONFIG["opening_pool_max_config_failures"],
+            )
+        return _opening_pool
@@ -1,19 +1,33 @@
 from pydantic import BaseModel, Field
 from typing import List
 
+# 评分字段及其中文名（报告导出、仪表盘汇总和旧报告解析共用）
+SCORE_LABELS = {
+    "comprehensive_score": "综合评分",
+    "demand_mining_score": "需求挖掘",
+    "product_recommendation_score": "产品推荐",
+    "objection_handling_score": "异议处理",
+    "trust_building_score": "建立信任",
+    "closing_score": "推动成交",
+}
+
 class EvaluationReport(BaseModel):
     """
     Data model for the final evaluation report.
     """
-    comprehensive_score: float = Field(..., description="综合评分 (满分10分)")
-    demand_mining_score: int = Field(..., description="需求挖掘分数")
-    product_recommendation_score: int = Field(..., description="产品推荐分数")
-    objection_handling_score: int = Field(..., description="异议处理分数")
-    trust_building_score: int = Field(..., description="建立信任分数")
-    closing_score: int = Field(..., description="推动成交分数")
+    comprehensive_score: float = Field(..., ge=0, le=10, description="综合评分 (满分10分)")
+    demand_mining_score: int = Field(..., ge=0, le=10, description="需求挖掘分数")
+    product_recommendation_score: int = Field(..., ge=0, le=10, description="产品推荐分数")
+    objection_handling_score: int = Field(..., ge=0, le=10, description="异议处理分数")
+    trust_building_score: int = Field(..., ge=0, le=10, description="建立信任分数")
+    closing_score: int = Field(..., ge=0, le=10, description="推动成交分数")
     strengths: List[str] = Field(..., description="本次对话中的优点")
     suggestions: List[str] = Field(..., description="具体的改进建议")
 
+    def scores(self) -> dict:
+        """各项评分（报告文件和索引中保存的数值字段）"""
+        return {name: getattr(self, name) for name in SCORE_LABELS}
+
 class ChatMessage(BaseModel):
     """
     Data model for a single chat message.
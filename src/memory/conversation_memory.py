@@ -0,0 +1,235 @@
+"""
+按token预算的滚动摘要对话记忆 - 两种客户代理共用
+
+- 每条对话在加入时计算一次token数，之后只做加减，不重复计数
+- 最近的对话原文保留；超出预算的较早对话在后台线程中折叠进滚动摘要，不阻塞当前回合
+- 生成的历史（摘要 + 放得下的最近对话）始终不超过 token_budget，摘要尚未完成时也一样
+"""
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from config import PERFORMANCE_CONFIG
+from src.utils.cancellation import CancelToken
+
+# 中日韩字符与全角标点
+_CJK = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+_summary_executor = None
+_summary_executor_lock = threading.Lock()
+
+
+def count_tokens(text: str) -> int:
+    """
+    估算token数：中日韩字符和全角标点各计1个，其余非空白字符每4个计1个。
+    对DeepSeek/OpenAI的中文分词偏保守（实际通常更少），不依赖需要联网下载的分词表
+    """
+    cjk = len(_CJK.findall(text))
+    other = sum(1 for ch in text if not ch.isspace()) - cjk
+    return cjk + (other + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """保留文本末尾不超过 max_tokens 的部分（摘要越靠后越新）"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high) // 2
+        if count_tokens(text[mid:]) <= max_tokens:
+            high = mid
+        else:
+            low = mid + 1
+    return text[low:]
+
+
+def _get_summary_executor() -> ThreadPoolExecutor:
+    """所有会话共享的摘要线程池"""
+    global _summary_executor
+    with _summary_executor_lock:
+        if _summary_executor is None:
+            _summary_executor = ThreadPoolExecutor(
+                max_workers=PERFORMANCE_CONFIG["memory_summary_workers"], thread_name_prefix="memory-summary"
+            )
+        return _summary_executor
+
+
+class _Line:
+    __slots__ = ("text", "tokens")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = count_tokens(text) + 1  # 换行
+
+
+class RollingSummaryMemory:
+    """
+    滚动摘要记忆。
+    summarize(之前的摘要, 待折叠的对话行列表) -> 新摘要，由调用方提供（通常是一次LLM调用）
+    """
+
+    def __init__(self, summarize: Callable[[str, List[str]], str], token_budget: int = 1000,
+                 summary_max_tokens: int = 200, human_prefix: str = "销售", ai_prefix: str = "客户",
+                 background: bool = True):
+        self.summarize = summarize
+        self.token_budget = token_budget
+        self.summary_max_tokens = min(summary_max_tokens, token_budget // 2)
+        self.human_prefix = human_prefix
+        self.ai_prefix = ai_prefix
+        self.background = background
+
+        self.summary = ""
+        self.summary_tokens = 0
+        self._lines: List[_Line] = []   # 尚未折叠进摘要的对话行，从旧到新
+        self._line_tokens = 0
+        self._pending: Optional[Future] = None
+        self._generation = 0  # clear() 后丢弃进行中的摘要
+        # 当前这一代摘要调用的取消令牌，summarize 可传给LLM；clear()/close() 时取消
+        self.cancel_token = CancelToken()
+        self._lock = threading.Lock()
+
+        self.turns = 0
+        self.summary_calls = 0
+        self.summary_failures = 0
+        self.summary_seconds = 0.0
+        self.lines_folded = 0
+
+    def add_turn(self, human: str, ai: str):
+        """记录一轮对话；需要时在后台折叠较早的对话"""
+        with self._lock:
+            for line in (f"{self.human_prefix}：{human}", f"{self.ai_prefix}：{ai}"):
+                entry = _Line(line)
+                self._lines.append(entry)
+                self._line_tokens += entry.tokens
+            self.turns += 1
+        self._maybe_summarize()
+
+    def _fold_count(self) -> int:
+        """
+        需要折叠的最早对话行数。原文超过预算中摘要之外的部分时，折叠到其一半以下，
+        使每次摘要调用处理多轮对话；最近一轮（2行）始终保留原文
+        """
+        recent_budget = self.token_budget - self.summary_max_tokens
+        if self._line_tokens <= recent_budget:
+            return 0
+        target = recent_budget // 2
+        tokens, count = self._line_tokens, 0
+        while count < len(self._lines) - 2 and tokens > target:
+            tokens -= self._lines[count].tokens
+            count += 1
+        return count
+
+    def _maybe_summarize(self):
+        with self._lock:
+            if self._pending is not None:
+                return
+            count = self._fold_count()
+            if count == 0:
+                return
+            lines = [line.text for line in self._lines[:count]]
+            previous = self.summary
+            generation = self._generation
+            self._pending = Future()
+        if self.background:
+            _get_summary_executor().submit(self._fold, previous, lines, count, generation)
+        else:
+            self._fold(previous, lines, count, generation)
+
+    def _fold(self, previous: str, lines: List[str], count: int, generation: int):
+        start = time.perf_counter()
+        try:
+            summary = self.summarize(previous, lines)
+            failed = False
+        except Exception as e:
+            print(f"对话摘要生成失败: {e}，保留截断的原文")
+            summary = " ".join(([previous] if previous else []) + lines)
+            failed = True
+        summary = truncate_to_tokens(summary.strip(), self.summary_max_tokens)
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+            if generation != self._generation:
+                pending.set_result(None)
+                return
+            self.summary = summary
+            self.summary_tokens = count_tokens(summary) + 1 if summary else 0
+            folded = self._lines[:count]
+            del self._lines[:count]
+            self._line_tokens -= sum(line.tokens for line in folded)
+            self.lines_folded += count
+            self.summary_calls += 1
+            self.summary_failures += failed
+            self.summary_seconds += time.perf_counter() - start
+        pending.set_result(summary)
+        # 摘要期间又有对话超出预算时继续折叠
+        self._maybe_summarize()
+
+    def render(self) -> str:
+        """prompt中的对话历史：摘要 + 从新到旧放得下的最近对话，总token数不超过预算"""
+        with self._lock:
+            remaining = self.token_budget
+            parts = []
+            if self.summary:
+                parts.append(f"（之前的对话摘要）{self.summary}")
+                remaining -= self.summary_tokens
+            recent = []
+            for line in reversed(self._lines):
+                if line.tokens > remaining:
+                    break
+                recent.append(line.text)
+                remaining -= line.tokens
+            return "\n".join(parts + recent[::-1])
+
+    def wait(self, timeout: Optional[float] = None):
+        """等待进行中的摘要完成（测试与基准测试用）"""
+        while True:
+            with self._lock:
+                pending = self._pending
+            if pending is None:
+                return
+            pending.result(timeout)
+
+    def close(self):
+        """会话结束：取消进行中和排队中的摘要调用"""
+        with self._lock:
+            self._generation += 1
+            token = self.cancel_token
+        token.cancel("会话已结束")
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            token, self.cancel_token = self.cancel_token, CancelToken()
+            self.summary = ""
+            self.summary_tokens = 0
+            self._lines.clear()
+            self._line_tokens = 0
+            self.turns = 0
+        token.cancel("对话已清空")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "history_tokens": min(self.token_budget, self.summary_tokens + self._line_tokens),
+                "summary_tokens": self.summary_tokens,
+                "unsummarized_lines": len(self._lines),
+                "summary_calls": self.summary_calls,
+                "summary_failures": self.summary_failures,
+                "summary_seconds": self.summary_seconds,
+                "lines_folded": self.lines_folded,
+            }
+
+
+def create_conversation_memory(summarize: Callable[[str, List[str]], str], human_prefix: str = "销售",
+                               ai_prefix: str = "客户") -> RollingSummaryMemory:
+    """按 PERFORMANCE_CONFIG 创建对话记忆"""
+    return RollingSummaryMemory(
+        summarize,
+        token_budget=PERFORMANCE_CONFIG["conversation_memory_limit"],
+        summary_max_tokens=PERFORMANCE_CONFIG["memory_summary_max_tokens"],
+        human_prefix=human_prefix,
+        ai_prefix=ai_prefix,
+    )
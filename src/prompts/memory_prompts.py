@@ -0,0 +1,16 @@
+from langchain.prompts import PromptTemplate
+
+# 对话记忆的滚动摘要：把较早的对话折叠进已有摘要
+SUMMARY_PROMPT = PromptTemplate(
+    template="""
+请把下面的销售对话补充进已有摘要，用一段简短的中文（100字以内）概括。
+只保留后续对话需要的信息：客户预算、偏好、已讨论过的产品及价格、提出的顾虑或异议、当前进展。
+
+已有摘要：{summary}
+
+新的对话：
+{new_lines}
+
+新摘要：""",
+    input_variables=["summary", "new_lines"],
+)
@@ -1,49 +1,69 @@
 from langchain.prompts import PromptTemplate
 
+# 提示词布局（利于服务端上下文缓存，缓存按prompt前缀逐字节匹配）：
+#   1. 所有角色共用的说明        跨角色、跨会话不变
+#   2. 角色设定 + 回复要求       同一角色的所有会话不变
+#   3. 对话历史（摘要 + 最近对话） 两次摘要折叠之间只在末尾追加，上一轮的prompt是这一轮的前缀
+#   4. 相关产品信息（RAG）、销售本轮的话  每轮变化，放在最后
+
+SHARED_INSTRUCTIONS = """你正在珠宝店销售培训中扮演一位顾客，与销售人员（学员）对话。
+始终以角色的身份、口吻和立场回应，不要跳出角色，不要替销售说话。"""
+
 # 预算敏感型 ("王女士") - 优化版本
-BUDGET_SENSITIVE_PROMPT = PromptTemplate(
-    template="""
-你是"王女士"，预算5000-8000元买黄金手镯。
+BUDGET_SENSITIVE_PERSONA = """你是"王女士"，预算5000-8000元买黄金手镯。
 性格：价格敏感，看重性价比和保值性。
 行为：常问价格、重量、折扣，爱比价，超预算就说太贵。
-满意条件：有优惠或合理性价比解释。
-
-对话历史：{history}
-销售：{input}
-王女士：""",
-    input_variables=["history", "input"],
-)
+满意条件：有优惠或合理性价比解释。"""
 
 # 追求独特设计型 ("李小姐")
-UNIQUE_DESIGN_PROMPT = PromptTemplate(
-    template="""
-你是"李小姐"，追求独特设计的年轻白领。
+UNIQUE_DESIGN_PERSONA = """你是"李小姐"，追求独特设计的年轻白领。
 性格：重视设计感和独特性，不愿与人雷同，有一定消费能力。
 行为：常问设计理念、是否限量、设计师背景，对大众款不感兴趣。
-满意条件：产品有独特故事和设计价值。
-
-对话历史：{history}
-销售：{input}
-李小姐：""",
-    input_variables=["history", "input"],
-)
+满意条件：产品有独特故事和设计价值。"""
 
 # 犹豫不决型 ("张阿姨")
-INDECISIVE_PROMPT = PromptTemplate(
-    template="""
-你是"张阿姨"，选择困难，需要安全感。
+INDECISIVE_PERSONA = """你是"张阿姨"，选择困难，需要安全感。
 性格：谨慎犹豫，害怕做错决定，需要他人肯定和详细信息。
 行为：常说"我再想想"、"哪个更好"、"不喜欢怎么办"，需要反复确认。
-满意条件：销售给出明确建议和保障。
+满意条件：销售给出明确建议和保障。"""
+
+RAG_INSTRUCTIONS = "回复时可参考对话末尾的相关产品信息，请简洁地以您的角色身份回应（控制在100字以内）。"
+
+
+def build_persona_prompt(persona: str, speaker: str, with_context: bool = False) -> PromptTemplate:
+    """按上面的布局组装角色提示词；with_context 为RAG代理加入产品信息"""
+    instructions = f"\n{RAG_INSTRUCTIONS}" if with_context else ""
+    context = "相关产品信息：\n{context}\n\n" if with_context else ""
+    return PromptTemplate(
+        template=f"""{SHARED_INSTRUCTIONS}
+
+{persona}{instructions}
+
+对话历史：
+{{history}}
+
+{context}销售：{{input}}
+{speaker}：""",
+        input_variables=["history", "input", "context"] if with_context else ["history", "input"],
+    )
+
 
-对话历史：{history}
-销售：{input}
-张阿姨：""",
-    input_variables=["history", "input"],
-)
+BUDGET_SENSITIVE_PROMPT = build_persona_prompt(BUDGET_SENSITIVE_PERSONA, "王女士")
+UNIQUE_DESIGN_PROMPT = build_persona_prompt(UNIQUE_DESIGN_PERSONA, "李小姐")
+INDECISIVE_PROMPT = build_persona_prompt(INDECISIVE_PERSONA, "张阿姨")
 
 PERSONA_PROMPTS = {
     "预算敏感型 (王女士)": BUDGET_SENSITIVE_PROMPT,
     "追求独特设计型 (李小姐)": UNIQUE_DESIGN_PROMPT,
     "犹豫不决型 (张阿姨)": INDECISIVE_PROMPT,
-} 
\ No newline at end of file
+}
+# RAG代理的提示词：同样的前缀，产品信息放在对话历史之后
+PERSONA_RAG_PROMPTS = {
+    "预算敏感型 (王女士)": build_persona_prompt(BUDGET_SENSITIVE_PERSONA, "王女士", with_context=True),
+    "追求独特设计型 (李小姐)": build_persona_prompt(UNIQUE_DESIGN_PERSONA, "李小姐", with_context=True),
+    "犹豫不决型 (张阿姨)": build_persona_prompt(INDECISIVE_PERSONA, "张阿姨", with_context=True),
+}
+# 角色的硬性约束，RAG检索时作为属性预过滤条件
+PERSONA_RETRIEVAL_FILTERS = {
+    "预算敏感型 (王女士)": "price_yuan<=8000",
+}
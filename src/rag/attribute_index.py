@@ -0,0 +1,138 @@
+import re
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# 数值字段（范围查询）与类别字段（等值/集合查询）
+NUMERIC_FIELDS = ("price_yuan", "weight_g")
+CATEGORICAL_FIELDS = ("series", "designer", "craft")
+
+_OPERATORS = ("<=", ">=", "==", "<", ">", "=", "in")
+_CONDITION_PATTERN = re.compile(r"(\w+)\s*(<=|>=|==|<|>|=|\bin\b)\s*(\{[^}]*\}|[^,]+)")
+
+Condition = Tuple[str, str, object]
+
+
+def parse_filters(spec: Union[str, Iterable, None]) -> Tuple[Condition, ...]:
+    """
+    解析过滤条件，返回可哈希的条件元组（可作为缓存键）。
+    支持字符串 "price_yuan<=8000, series in {星动系列, 玲珑系列}"
+    或条件列表 [("price_yuan", "<=", 8000), ("series", "in", {...})]
+    """
+    if not spec:
+        return ()
+    if isinstance(spec, str):
+        raw = []
+        for field, op, value in _CONDITION_PATTERN.findall(spec):
+            value = value.strip()
+            if op == "in":
+                value = {v.strip().strip("'\"") for v in value.strip("{}").split(",") if v.strip()}
+            else:
+                value = value.strip("'\"")
+            raw.append((field, op, value))
+    else:
+        raw = list(spec)
+
+    conditions = []
+    for field, op, value in raw:
+        op = "==" if op == "=" else op
+        if op not in _OPERATORS:
+            raise ValueError(f"不支持的过滤运算符: {op}")
+        if field in NUMERIC_FIELDS and op != "in":
+            value = float(value)
+        elif op == "in":
+            value = frozenset(str(v) for v in value)
+        else:
+            value = str(value)
+        conditions.append((field, op, value))
+    return tuple(sorted(conditions, key=lambda c: (c[0], c[1])))
+
+
+class AttributeIndex:
+    """
+    产品属性列式索引：数值字段为排序数组（二分查找范围），类别字段为位图。
+    过滤结果为与产品目录行顺序一致的布尔掩码，供检索前预过滤使用。
+    """
+
+    def __init__(self, n_rows: int):
+        self.n_rows = n_rows
+        # 字段 -> (排序后的取值, 对应的行号)
+        self.sorted_values: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # 字段 -> {取值: 压缩位图(np.packbits)}
+        self.bitmaps: Dict[str, Dict[str, np.ndarray]] = {}
+
+    @classmethod
+    def from_dataframe(cls, df, numeric_fields=NUMERIC_FIELDS, categorical_fields=CATEGORICAL_FIELDS):
+        """从产品DataFrame构建索引"""
+        index = cls(len(df))
+        for field in numeric_fields:
+            if field in df.columns:
+                index.add_numeric(field, df[field].to_numpy(dtype=np.float64))
+        for field in categorical_fields:
+            if field in df.columns:
+                index.add_categorical(field, df[field].astype(str).to_numpy())
+        return index
+
+    def add_numeric(self, field: str, values: np.ndarray):
+        order = np.argsort(values, kind="stable")
+        self.sorted_values[field] = (values[order], order.astype(np.int64))
+
+    def add_categorical(self, field: str, values: np.ndarray):
+        codes, categories = pd.factorize(values)
+        self.bitmaps[field] = {
+            str(category): np.packbits(codes == code) for code, category in enumerate(categories)
+        }
+
+    def _empty(self) -> np.ndarray:
+        return np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+
+    def _range_bitmap(self, field: str, op: str, value: float) -> np.ndarray:
+        values, rows = self.sorted_values[field]
+        if op == "<=":
+            selected = rows[:np.searchsorted(values, value, side="right")]
+        elif op == "<":
+            selected = rows[:np.searchsorted(values, value, side="left")]
+        elif op == ">=":
+            selected = rows[np.searchsorted(values, value, side="left"):]
+        elif op == ">":
+            selected = rows[np.searchsorted(values, value, side="right"):]
+        else:  # ==
+            selected = rows[np.searchsorted(values, value, side="left"):np.searchsorted(values, value, side="right")]
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[selected] = True
+        return np.packbits(mask)
+
+    def _category_bitmap(self, field: str, op: str, value) -> np.ndarray:
+        bitmaps = self.bitmaps[field]
+        if op == "==":
+            return bitmaps.get(value, self._empty())
+        if op != "in":
+            raise ValueError(f"类别字段 {field} 只支持 == 和 in")
+        result = self._empty()
+        for category in value:
+            if category in bitmaps:
+                result |= bitmaps[category]
+        return result
+
+    def mask(self, filters) -> Optional[np.ndarray]:
+        """
+        计算过滤条件（AND）对应的行掩码，无条件时返回None
+        """
+        conditions = parse_filters(filters)
+        if not conditions:
+            return None
+        result = None
+        for field, op, value in conditions:
+            if field in self.sorted_values and op != "in":
+                bitmap = self._range_bitmap(field, op, value)
+            elif field in self.sorted_values:
+                bitmap = self._empty()
+                for v in value:
+                    bitmap |= self._range_bitmap(field, "==", float(v))
+            elif field in self.bitmaps:
+                bitmap = self._category_bitmap(field, op, value)
+            else:
+                raise ValueError(f"未建立索引的字段: {field}")
+            result = bitmap.copy() if result is None else result & bitmap
+        return np.unpackbits(result, count=self.n_rows).astype(bool)
@@ -0,0 +1,72 @@
+import os
+import json
+import hashlib
+from typing import Dict, List
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+class DuplicateProductIdError(ValueError):
+    """产品目录中有重复的产品id（文档块id和向量位置到目录行的映射都要求id唯一）"""
+
+    def __init__(self, catalog_path: str, duplicate_ids: List[str]):
+        self.duplicate_ids = duplicate_ids
+        shown = ", ".join(map(str, duplicate_ids[:10])) + (" 等" if len(duplicate_ids) > 10 else "")
+        super().__init__(f"产品目录 {catalog_path} 中有 {len(duplicate_ids)} 个重复的产品id: {shown}，请去重后再导入")
+
+
+def product_embedding_content(row) -> str:
+    """向量化的产品文本（简化内容，减少token数量）"""
+    return f"{row['name']} {row['series']} {row['craft']} 价格{row['price_yuan']}元 {row['meaning']}"
+
+
+def content_hash(content: str) -> str:
+    """单行内容哈希"""
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def file_fingerprint(path: str) -> str:
+    """产品目录文件指纹"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def diff_catalog(old_rows: Dict[str, Dict], new_hashes: Dict[str, str]):
+    """
+    对比清单中记录的行与当前目录的 {产品id: 内容哈希}
+    返回 (新增id列表, 变更id列表, 删除id列表)
+    """
+    added = [pid for pid in new_hashes if pid not in old_rows]
+    changed = [pid for pid in new_hashes if pid in old_rows and old_rows[pid]["hash"] != new_hashes[pid]]
+    removed = [pid for pid in old_rows if pid not in new_hashes]
+    return added, changed, removed
+
+
+def load_manifest(store_path: str) -> Dict:
+    """读取向量存储清单，不存在时返回空字典"""
+    path = os.path.join(store_path, MANIFEST_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"读取向量存储清单失败: {e}")
+        return {}
+
+
+def save_manifest(store_path: str, manifest: Dict):
+    """原子写入向量存储清单"""
+    path = os.path.join(store_path, MANIFEST_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def chunk_ids(product_id: str, n_chunks: int) -> List[str]:
+    """产品文档块在docstore中的稳定id"""
+    return [f"{product_id}-{i}" for i in range(n_chunks)]
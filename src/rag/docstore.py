@@ -0,0 +1,154 @@
+"""
+偏移索引docstore：文档按FAISS向量位置顺序存储，打开时只做mmap，不反序列化全部文档，
+同一主机上的多个worker进程通过操作系统页缓存共享数据。
+
+文件：
+  docstore.jsonl            每行一条记录 {"id", "page_content", "metadata"}
+  docstore.offsets.npy      int64[n+1]，第i条记录在 docstore.jsonl 中的字节范围
+  docstore.product_ids.npy  int64[n]，metadata["id"]（产品id）列，预过滤时无需解码文档
+"""
+import json
+import os
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Union
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain.docstore.document import Document
+
+DOCSTORE_FILENAME = "docstore.jsonl"
+OFFSETS_FILENAME = "docstore.offsets.npy"
+PRODUCT_IDS_FILENAME = "docstore.product_ids.npy"
+DOCSTORE_FILES = (DOCSTORE_FILENAME, OFFSETS_FILENAME, PRODUCT_IDS_FILENAME)
+
+
+class DocstoreWriter:
+    """
+    流式写入docstore：记录按向量位置顺序逐条追加到临时文件，内存中只保留偏移和产品id列（每条16字节）。
+    close() 时写出偏移和产品id列，再逐个替换正式文件：已mmap旧文件的进程继续读取旧inode，不受影响。
+    用作上下文管理器时，出错则丢弃临时文件
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets = array("q", [0])
+        self._product_ids = array("q")
+        self._tmp_data = os.path.join(path, DOCSTORE_FILENAME + ".tmp")
+        self._file = open(self._tmp_data, "wb")
+
+    def __len__(self):
+        return len(self._product_ids)
+
+    def add(self, record: Dict):
+        """追加一条记录 {"id", "page_content", "metadata"}"""
+        line = json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n"
+        self.add_raw(line, record["metadata"].get("id", -1))
+
+    def add_raw(self, line: bytes, product_id: int):
+        """追加一条已编码的记录（从旧版本复制时无需解码）"""
+        self._file.write(line)
+        self._offsets.append(self._offsets[-1] + len(line))
+        self._product_ids.append(int(product_id))
+
+    def close(self):
+        self._file.close()
+        tmp_offsets = os.path.join(self.path, "docstore.offsets.tmp.npy")
+        tmp_product_ids = os.path.join(self.path, "docstore.product_ids.tmp.npy")
+        np.save(tmp_offsets, np.frombuffer(self._offsets, dtype=np.int64))
+        np.save(tmp_product_ids, np.frombuffer(self._product_ids, dtype=np.int64))
+        os.replace(self._tmp_data, os.path.join(self.path, DOCSTORE_FILENAME))
+        os.replace(tmp_offsets, os.path.join(self.path, OFFSETS_FILENAME))
+        os.replace(tmp_product_ids, os.path.join(self.path, PRODUCT_IDS_FILENAME))
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self._tmp_data):
+            os.remove(self._tmp_data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def write_docstore(path: str, records: Iterator[Dict]):
+    """按顺序流式写入记录（{"id", "page_content", "metadata"}）"""
+    with DocstoreWriter(path) as writer:
+        for record in records:
+            writer.add(record)
+
+
+def docstore_exists(path: str) -> bool:
+    return all(os.path.exists(os.path.join(path, name)) for name in DOCSTORE_FILES)
+
+
+class MmapDocstore(Docstore):
+    """
+    只读docstore，以向量位置（int）为键，解码只发生在被查询的记录上
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILENAME), mmap_mode="r")
+        self.product_ids = np.load(os.path.join(path, PRODUCT_IDS_FILENAME), mmap_mode="r")
+        data_path = os.path.join(path, DOCSTORE_FILENAME)
+        # 空文件不能mmap
+        self._data = np.memmap(data_path, dtype=np.uint8, mode="r") if os.path.getsize(data_path) else b""
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def raw(self, position: int) -> bytes:
+        """第 position 条记录的原始字节（含换行）"""
+        start, end = int(self._offsets[position]), int(self._offsets[position + 1])
+        return bytes(self._data[start:end])
+
+    def record(self, position: int) -> Dict:
+        return json.loads(self.raw(position))
+
+    def records(self) -> Iterator[Dict]:
+        for position in range(len(self)):
+            yield self.record(position)
+
+    def search(self, search: Union[int, str]) -> Union[Document, str]:
+        try:
+            position = int(search)
+        except (TypeError, ValueError):
+            return f"ID {search} not found."
+        if not 0 <= position < len(self):
+            return f"ID {search} not found."
+        record = self.record(position)
+        return Document(page_content=record["page_content"], metadata=record["metadata"])
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        raise NotImplementedError("MmapDocstore 是只读的，增量同步请使用可写加载")
+
+    def delete(self, ids: List) -> None:
+        raise NotImplementedError("MmapDocstore 是只读的，增量同步请使用可写加载")
+
+
+class PositionIds(Mapping):
+    """
+    只读加载时的 index_to_docstore_id：向量位置即docstore键，
+    无需为每个进程构建百万级的字典
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+
+    def __getitem__(self, position):
+        position = int(position)
+        if not 0 <= position < self._size:
+            raise KeyError(position)
+        return position
+
+    def __iter__(self):
+        return iter(range(self._size))
+
+    def __len__(self):
+        return self._size
@@ -0,0 +1,48 @@
+from sentence_transformers import SentenceTransformer
+
+# 句向量模型推理后端
+# torch: PyTorch float32（默认）
+# torch_int8: PyTorch 动态int8量化（Linear层），无需额外依赖
+# onnx: ONNX Runtime（需要 optimum[onnxruntime]）
+# onnx_int8: ONNX Runtime 加载int8量化模型文件
+EMBEDDING_BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+
+
+def embedding_model_id(model_name: str, backend: str) -> str:
+    """
+    模型标识（用作embedding缓存键），不同后端的数值略有差异，缓存需分开
+    """
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+
+def loaded_backend(model, requested: str) -> str:
+    """模型实际使用的后端（ONNX回退到PyTorch时为 torch），不是 load_sentence_model 加载的模型时为 requested"""
+    return getattr(model, "embedding_backend", requested)
+
+
+def load_sentence_model(model_name: str, backend: str = "torch", onnx_quantized_file: str = None):
+    """
+    按后端加载 SentenceTransformer，返回的对象都提供相同的 encode 接口。
+    ONNX依赖缺失或模型文件不可用时回退到 PyTorch；实际使用的后端记在 embedding_backend 属性上，
+    缓存键应按它区分（见 loaded_backend）。
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"不支持的embedding后端: {backend}，可选: {', '.join(EMBEDDING_BACKENDS)}")
+
+    if backend in ("onnx", "onnx_int8"):
+        model_kwargs = {"file_name": onnx_quantized_file} if backend == "onnx_int8" and onnx_quantized_file else None
+        try:
+            model = SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        except Exception as e:
+            print(f"ONNX后端加载失败（{e}），回退到PyTorch。请安装: pip install optimum[onnxruntime]")
+            model, backend = SentenceTransformer(model_name, device="cpu"), "torch"
+    elif backend == "torch_int8":
+        import torch
+
+        model = SentenceTransformer(model_name, device="cpu")
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    else:
+        model = SentenceTransformer(model_name)
+
+    model.embedding_backend = backend
+    return model
@@ -0,0 +1,88 @@
+import time
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from src.utils.metrics import Histogram
+
+# 批次大小分桶
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class EmbeddingBatcher:
+    """
+    查询embedding微批处理服务。
+    并发会话提交的查询在 window_ms 时间窗口内合并为一次 encode 调用（最多 max_batch_size 条），
+    每个调用方通过 Future 拿回自己的向量。
+    """
+
+    def __init__(self, encode: Callable[[List[str]], np.ndarray], max_batch_size: int = 32, window_ms: float = 5.0):
+        self.encode = encode
+        self.max_batch_size = max_batch_size
+        self.window_ms = window_ms
+        self.latency_ms = Histogram()
+        self.batch_size = Histogram(buckets=BATCH_SIZE_BUCKETS)
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        """提交一条查询，返回Future"""
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future, time.perf_counter()))
+        return future
+
+    def embed(self, text: str, timeout: float = None) -> np.ndarray:
+        """同步获取单条查询的向量"""
+        return self.submit(text).result(timeout=timeout)
+
+    def _collect_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window_ms / 1000.0
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            self.batch_size.observe(len(batch))
+            texts = [text for text, _, _ in batch]
+            try:
+                vectors = self.encode(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            now = time.perf_counter()
+            for (_, future, submitted), vector in zip(batch, vectors):
+                self.latency_ms.observe((now - submitted) * 1000)
+                future.set_result(vector)
+
+    def stats(self) -> Dict:
+        """延迟与批次大小直方图"""
+        return {
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": self._queue.qsize(),
+            "latency_ms": self.latency_ms.snapshot(),
+            "batch_size": self.batch_size.snapshot(),
+        }
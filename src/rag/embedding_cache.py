@@ -0,0 +1,256 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows 下不做跨进程写锁
+    fcntl = None
+
+KEY_SIZE = 16  # sha1 摘要前16字节
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """归一化文本：NFKC、去首尾空白、合并连续空白"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> bytes:
+    """缓存键：(模型名, 归一化文本) 的哈希"""
+    return hashlib.sha1(f"{model_name}\0{normalize_text(text)}".encode("utf-8")).digest()[:KEY_SIZE]
+
+
+class DiskEmbeddingStore:
+    """
+    追加写入的磁盘向量存储，目录结构:
+        meta.json    模型名、维度、数据类型
+        vectors.bin  定长向量，np.memmap 只读映射
+        keys.bin     与 vectors.bin 逐行对应的键
+
+    写入时先追加向量再追加键，读者只会看到完整的记录，
+    因此多个进程可以只读共享同一目录（页面由操作系统页缓存共享）。
+    """
+
+    def __init__(self, path: str, model_name: str, dtype: str = "float16", read_only: bool = False):
+        self.path = path
+        self.model_name = model_name
+        self.dtype = np.dtype(dtype)
+        self.read_only = read_only
+        self.dim: Optional[int] = None
+        self._index: Dict[bytes, int] = {}
+        self._keys_read = 0
+        self._vectors = None
+        self._lock = threading.Lock()
+
+        if not read_only:
+            os.makedirs(path, exist_ok=True)
+        self._load_meta()
+        self.refresh()
+
+    @property
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    @property
+    def _keys_path(self):
+        return os.path.join(self.path, "keys.bin")
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.path, "vectors.bin")
+
+    def _load_meta(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model_name") != self.model_name:
+            raise ValueError(f"缓存目录 {self.path} 属于模型 {meta.get('model_name')}，与 {self.model_name} 不符")
+        self.dim = int(meta["dim"])
+        self.dtype = np.dtype(meta["dtype"])
+
+    def __len__(self):
+        return len(self._index)
+
+    def refresh(self):
+        """读取其他进程新追加的记录"""
+        if self.dim is None:
+            self._load_meta()
+        if self.dim is None or not os.path.exists(self._keys_path):
+            return
+        with self._lock:
+            n_rows = os.path.getsize(self._keys_path) // KEY_SIZE
+            if n_rows <= self._keys_read:
+                return
+            with open(self._keys_path, "rb") as f:
+                f.seek(self._keys_read * KEY_SIZE)
+                data = f.read((n_rows - self._keys_read) * KEY_SIZE)
+            # 先换上覆盖新行的映射再登记键：get() 不加锁，查到的行一定在当前映射范围内
+            self._vectors = np.memmap(self._vectors_path, dtype=self.dtype, mode="r", shape=(n_rows, self.dim))
+            for i in range(len(data) // KEY_SIZE):
+                self._index[data[i * KEY_SIZE:(i + 1) * KEY_SIZE]] = self._keys_read + i
+            self._keys_read = n_rows
+
+    def get(self, key: bytes) -> Optional[np.ndarray]:
+        row = self._index.get(key)
+        if row is None:
+            return None
+        # 先查键后取映射（refresh 的顺序相反）
+        return np.asarray(self._vectors[row], dtype=np.float32)
+
+    def put_many(self, keys: Sequence[bytes], vectors: np.ndarray):
+        """追加写入一批向量"""
+        if self.read_only or len(keys) == 0:
+            return
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype)
+        with self._lock:
+            if self.dim is None:
+                self._load_meta()
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                tmp_path = self._meta_path + ".tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump({"model_name": self.model_name, "dim": self.dim, "dtype": self.dtype.name}, f)
+                os.replace(tmp_path, self._meta_path)
+
+            with open(os.path.join(self.path, "write.lock"), "a") as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # 以 keys.bin 为准对齐 vectors.bin，丢弃上次异常退出时残留的半条记录
+                    n_rows = os.path.getsize(self._keys_path) // KEY_SIZE if os.path.exists(self._keys_path) else 0
+                    row_bytes = self.dim * self.dtype.itemsize
+                    with open(self._vectors_path, "ab") as f:
+                        f.truncate(n_rows * row_bytes)
+                        f.write(vectors.tobytes())
+                    with open(self._keys_path, "ab") as f:
+                        f.truncate(n_rows * KEY_SIZE)
+                        f.write(b"".join(keys))
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        self.refresh()
+
+
+class EmbeddingCache:
+    """
+    两级embedding缓存：内存LRU + 磁盘memmap。
+    键为 (模型名, 归一化文本哈希)，统计命中率和节省的编码时间。
+    """
+
+    def __init__(self, model_name: str, path: Optional[str] = None, memory_size: int = 10000,
+                 dtype: str = "float16", read_only: bool = False):
+        self.model_name = model_name
+        self.memory_size = memory_size
+        self.dtype = np.dtype(dtype)
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.disk = DiskEmbeddingStore(path, model_name, dtype, read_only) if path else None
+        if self.disk is not None:
+            self.dtype = self.disk.dtype
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+
+    def _memory_get(self, key: bytes) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+            return vector
+
+    def _memory_put(self, key: bytes, vector: np.ndarray):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+    def peek(self, text: str) -> Optional[np.ndarray]:
+        """只查缓存不编码，未命中返回None（不计入未命中次数）"""
+        key = cache_key(self.model_name, text)
+        vector = self._memory_get(key)
+        if vector is not None:
+            self.memory_hits += 1
+            return vector
+        if self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._memory_put(key, vector)
+        return vector
+
+    def get_or_encode(self, texts: List[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """
+        返回 texts 对应的向量，未命中的文本合并为一次 encode 调用
+        """
+        keys = [cache_key(self.model_name, t) for t in texts]
+        results: List[Optional[np.ndarray]] = [None] * len(texts)
+        missing: Dict[bytes, List[int]] = OrderedDict()
+
+        pending = []
+        for i, key in enumerate(keys):
+            vector = self._memory_get(key)
+            if vector is not None:
+                self.memory_hits += 1
+                results[i] = vector
+            else:
+                pending.append(i)
+
+        if pending and self.disk is not None:
+            # 先读取其他进程新写入的记录
+            self.disk.refresh()
+        for i in pending:
+            vector = self.disk.get(keys[i]) if self.disk is not None else None
+            if vector is not None:
+                self.disk_hits += 1
+                self._memory_put(keys[i], vector)
+                results[i] = vector
+            else:
+                missing.setdefault(keys[i], []).append(i)
+
+        if missing:
+            miss_texts = [texts[positions[0]] for positions in missing.values()]
+            start = time.perf_counter()
+            encoded = np.asarray(encode(miss_texts), dtype=np.float32)
+            self.encode_seconds += time.perf_counter() - start
+            self.misses += len(miss_texts)
+
+            # 按存储精度回写，保证命中与未命中返回的数值一致
+            encoded = encoded.astype(self.dtype).astype(np.float32)
+            for (key, positions), vector in zip(missing.items(), encoded):
+                self._memory_put(key, vector)
+                for i in positions:
+                    results[i] = vector
+            if self.disk is not None:
+                self.disk.put_many(list(missing.keys()), encoded)
+
+        return np.stack(results) if results else np.zeros((0, 0), dtype=np.float32)
+
+    def stats(self) -> Dict:
+        """命中率统计，estimated_seconds_saved 按平均单条编码耗时估算"""
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        per_text = self.encode_seconds / self.misses if self.misses else 0.0
+        return {
+            "model_name": self.model_name,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "encode_seconds": self.encode_seconds,
+            "estimated_seconds_saved": hits * per_text,
+        }
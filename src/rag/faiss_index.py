@@ -0,0 +1,119 @@
+import os
+import faiss
+import numpy as np
+
+# 支持的索引类型
+# flat: 精确检索；ivf_flat: 倒排聚类；hnsw: 图索引；ivf_pq: 倒排+乘积量化；
+# sq8 / sq_fp16: 标量量化（int8 / float16 存储）的精确扫描
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq8", "sq_fp16")
+
+# 不支持 remove_ids 的索引类型，增量同步时有删除需全量重建
+NON_REMOVABLE_INDEX_TYPES = ("hnsw",)
+
+# 需要聚类训练的索引类型：导入时先缓存至多 max_training_points 个向量再训练；
+# 其余类型用第一批向量创建（sq8 的训练只估计每维的取值范围）
+CLUSTERED_INDEX_TYPES = ("ivf_flat", "ivf_pq")
+
+# 需要训练的索引类型至少需要的训练向量数（每个聚类中心约39个点）
+_MIN_TRAIN_POINTS_PER_CENTROID = 39
+_PQ_MIN_TRAIN_POINTS = 256 * _MIN_TRAIN_POINTS_PER_CENTROID // 4
+
+
+def _pq_subquantizers(dim: int, m: int) -> int:
+    """PQ子空间数需整除维度，取不超过 m 的最大因子"""
+    m = max(1, min(m, dim))
+    while dim % m:
+        m -= 1
+    return m
+
+
+def resolve_index_type(index_type: str, n_vectors: int, nlist: int) -> str:
+    """
+    向量数不足以训练时退化为 flat，避免产生质量很差的聚类/码本
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的FAISS索引类型: {index_type}，可选: {', '.join(INDEX_TYPES)}")
+    if index_type in ("ivf_flat", "ivf_pq") and n_vectors < nlist * _MIN_TRAIN_POINTS_PER_CENTROID:
+        return "flat"
+    if index_type == "ivf_pq" and n_vectors < _PQ_MIN_TRAIN_POINTS:
+        return "flat"
+    return index_type
+
+
+def factory_string(index_type: str, dim: int, nlist: int = 256, hnsw_m: int = 32, pq_m: int = 48) -> str:
+    """索引类型 -> faiss.index_factory 描述串"""
+    return {
+        "flat": "Flat",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "hnsw": f"HNSW{hnsw_m}",
+        # np: 跳过多义码(polysemous)训练，训练时间可缩短一个数量级
+        "ivf_pq": f"IVF{nlist},PQ{_pq_subquantizers(dim, pq_m)}x8np",
+        "sq8": "SQ8",
+        "sq_fp16": "SQfp16",
+    }[index_type]
+
+
+def create_faiss_index(training_vectors: np.ndarray, index_type: str = "flat", nlist: int = 256,
+                       hnsw_m: int = 32, pq_m: int = 48, nprobe: int = 8, ef_search: int = 64,
+                       max_training_points: int = 100000):
+    """
+    创建并训练（未添加向量的）FAISS索引，L2距离，与 langchain FAISS 默认一致。
+    训练向量超过 max_training_points 时随机抽样。
+    返回 (索引, 实际使用的索引类型)
+    """
+    training_vectors = np.ascontiguousarray(training_vectors, dtype=np.float32)
+    n, dim = training_vectors.shape
+    if n > max_training_points:
+        sample = np.random.default_rng(0).choice(n, max_training_points, replace=False)
+        training_vectors = training_vectors[np.sort(sample)]
+    resolved = resolve_index_type(index_type, n, nlist)
+    if resolved != index_type:
+        print(f"向量数({n})不足以训练 {index_type} 索引，改用 {resolved}")
+
+    index = faiss.index_factory(dim, factory_string(resolved, dim, nlist, hnsw_m, pq_m), faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(training_vectors)
+    configure_search(index, nprobe=nprobe, ef_search=ef_search)
+    return index, resolved
+
+
+def configure_search(index, nprobe: int = 8, ef_search: int = 64):
+    """设置查询期参数（IVF 的 nprobe、HNSW 的 efSearch）"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = ef_search
+
+
+def search_parameters(index, selector):
+    """按索引类型构造带ID过滤器的查询参数（IVF/HNSW需要各自的参数类型）"""
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        return faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+    if hasattr(index, "hnsw"):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+
+def write_index(index, path: str):
+    """先写临时文件再原子替换，已mmap旧文件的进程不受影响"""
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def read_index(path: str, index_type: str = None, mmap: bool = True):
+    """
+    读取FAISS索引。mmap=True 时以只读方式映射向量数据：
+    ivf_*: 倒排表（IO_FLAG_MMAP）；其余: IndexFlatCodes 的编码（IO_FLAG_MMAP_IFC，HNSW的图结构仍读入内存）。
+    mmap打开的索引不可修改，增量同步需 mmap=False
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    flag = faiss.IO_FLAG_MMAP if index_type and index_type.startswith("ivf") else faiss.IO_FLAG_MMAP_IFC
+    try:
+        return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError as e:
+        print(f"以mmap方式读取索引失败（{e}），改为完整读取")
+        return faiss.read_index(path)
@@ -0,0 +1,106 @@
+"""
+向量存储的版本化目录布局：
+
+  <store_path>/CURRENT               当前版本名（原子替换）
+  <store_path>/versions/<版本名>/     index.faiss、docstore.*、manifest.json、catalog.csv（构建所用的目录快照）
+
+新版本在独立目录中构建完成后才切换 CURRENT，读者不会看到构建到一半的索引。
+"""
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只做进程内互斥
+    fcntl = None
+
+CURRENT_FILENAME = "CURRENT"
+VERSIONS_DIRNAME = "versions"
+CATALOG_SNAPSHOT_FILENAME = "catalog.csv"
+
+_build_thread_lock = threading.Lock()
+
+
+@contextmanager
+def build_lock(store_path: str):
+    """构建互斥：同一存储同时只有一个构建（跨线程、跨进程）"""
+    os.makedirs(store_path, exist_ok=True)
+    with _build_thread_lock, open(os.path.join(store_path, "build.lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def build_in_progress() -> bool:
+    """本进程是否有构建正在进行"""
+    return _build_thread_lock.locked()
+
+
+def current_version_path(store_path: str) -> Optional[str]:
+    """
+    当前版本目录；没有版本时返回None。
+    兼容版本化之前的布局：索引文件直接位于 store_path 下时返回 store_path
+    """
+    try:
+        with open(os.path.join(store_path, CURRENT_FILENAME), "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        name = ""
+    if name:
+        path = os.path.join(store_path, VERSIONS_DIRNAME, name)
+        if os.path.isdir(path):
+            return path
+    if os.path.exists(os.path.join(store_path, "index.faiss")):
+        return store_path
+    return None
+
+
+def new_version_path(store_path: str, fingerprint: str) -> str:
+    """创建新版本目录，版本名按时间排序"""
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1e6) % 1000000:06d}-{fingerprint[:8]}"
+    path = os.path.join(store_path, VERSIONS_DIRNAME, name)
+    os.makedirs(path)
+    return path
+
+
+def publish_version(store_path: str, version_path: str):
+    """原子切换 CURRENT 到指定版本"""
+    tmp_path = os.path.join(store_path, CURRENT_FILENAME + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_path))
+    os.replace(tmp_path, os.path.join(store_path, CURRENT_FILENAME))
+
+
+def list_versions(store_path: str) -> List[str]:
+    """全部版本目录，按从旧到新排序"""
+    root = os.path.join(store_path, VERSIONS_DIRNAME)
+    if not os.path.isdir(root):
+        return []
+    return [os.path.join(root, name) for name in sorted(os.listdir(root))]
+
+
+def prune_versions(store_path: str, keep: int = 2, in_use: Iterable[str] = ()) -> List[str]:
+    """
+    删除旧版本，保留最新的 keep 个、当前版本和仍在使用的版本。
+    已mmap这些文件的其他进程不受影响（文件在最后一个映射释放后才真正回收）
+    返回被删除的目录
+    """
+    protected = {os.path.abspath(p) for p in in_use if p}
+    current = current_version_path(store_path)
+    if current:
+        protected.add(os.path.abspath(current))
+    versions = list_versions(store_path)
+    removed = []
+    for path in versions[:max(0, len(versions) - keep)]:
+        if os.path.abspath(path) not in protected:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+    return removed
@@ -0,0 +1,122 @@
+"""
+产品目录流式导入：分块读取CSV、生成器产出文档块、多进程并行编码。
+任意时刻只有当前CSV块和有限个在途批次驻留内存。
+"""
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional, Set
+
+import numpy as np
+import pandas as pd
+from langchain.docstore.document import Document
+
+from src.rag.catalog import chunk_ids, content_hash, product_embedding_content
+
+
+def iter_catalog_rows(csv_path: str, chunk_rows: int = 10000) -> Iterator[dict]:
+    """分块读取产品目录，逐行产出字典"""
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+        yield from chunk.to_dict("records")
+
+
+def iter_catalog_hashes(csv_path: str, chunk_rows: int = 10000) -> Iterator[tuple]:
+    """逐行产出 (产品id, 内容哈希)，用于增量差异和进度总数"""
+    for row in iter_catalog_rows(csv_path, chunk_rows):
+        yield str(row["id"]), content_hash(product_embedding_content(row))
+
+
+def iter_product_documents(csv_path: str, text_splitter, chunk_rows: int = 10000,
+                           product_ids: Optional[Set[str]] = None) -> Iterator[tuple]:
+    """
+    逐个产品产出 (产品id, 内容哈希, 文档块列表, 文档块id列表)
+    product_ids: 只处理这些产品（增量同步），None 为全部
+    """
+    for row in iter_catalog_rows(csv_path, chunk_rows):
+        pid = str(row["id"])
+        if product_ids is not None and pid not in product_ids:
+            continue
+        content = product_embedding_content(row)
+        docs = text_splitter.split_documents([Document(page_content=content, metadata={"id": int(row["id"])})])
+        yield pid, content_hash(content), docs, chunk_ids(pid, len(docs))
+
+
+def iter_document_batches(products: Iterable[tuple], batch_size: int = 512) -> Iterator[tuple]:
+    """
+    将产品文档流按文档块数分批，产出 (文档块列表, id列表, 清单行)。
+    同一产品的文档块不会拆到两个批次
+    """
+    docs, ids, rows = [], [], {}
+    for pid, digest, product_docs, product_chunk_ids in products:
+        docs.extend(product_docs)
+        ids.extend(product_chunk_ids)
+        rows[pid] = {"hash": digest, "chunk_ids": product_chunk_ids}
+        if len(docs) >= batch_size:
+            yield docs, ids, rows
+            docs, ids, rows = [], [], {}
+    if rows:
+        yield docs, ids, rows
+
+
+def ordered_parallel_map(fn: Callable, items: Iterable, workers: int = 1,
+                         max_in_flight: Optional[int] = None) -> Iterator[tuple]:
+    """
+    并发执行 fn(item)，按输入顺序产出 (item, 结果)。
+    在途任务数不超过 max_in_flight（默认 2*workers），输入为生成器时内存占用有界
+    """
+    if workers <= 1:
+        for item in items:
+            yield item, fn(item)
+        return
+
+    max_in_flight = max_in_flight or 2 * workers
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion") as executor:
+        pending = deque()
+        for item in items:
+            pending.append((item, executor.submit(fn, item)))
+            if len(pending) >= max_in_flight:
+                done_item, future = pending.popleft()
+                yield done_item, future.result()
+        while pending:
+            done_item, future = pending.popleft()
+            yield done_item, future.result()
+
+
+# 编码进程内的模型（由 _init_encoder_worker 加载）
+_worker_model = None
+_worker_batch_size = 32
+
+
+def _init_encoder_worker(model_name: str, backend: str, onnx_quantized_file: str, batch_size: int):
+    global _worker_model, _worker_batch_size
+    import torch
+    from src.rag.embedding_backends import load_sentence_model
+
+    # 每个进程单线程推理，由进程数决定并行度，避免线程超额订阅
+    torch.set_num_threads(1)
+    _worker_model = load_sentence_model(model_name, backend, onnx_quantized_file)
+    _worker_batch_size = batch_size
+
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    vectors = _worker_model.encode(texts, batch_size=_worker_batch_size, show_progress_bar=False)
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def create_encoder_pool(workers: int, model_name: str, backend: str = "torch",
+                        onnx_quantized_file: str = None, batch_size: int = 32) -> ProcessPoolExecutor:
+    """
+    创建编码进程池，每个进程加载一份模型。
+    使用 spawn 启动，避免 fork 已初始化的 PyTorch 线程池
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_encoder_worker,
+        initargs=(model_name, backend, onnx_quantized_file, batch_size),
+    )
+
+
+def encode_in_pool(pool: ProcessPoolExecutor, texts: List[str]) -> np.ndarray:
+    """在编码进程池中编码一批文本"""
+    return pool.submit(_encode_in_worker, list(texts)).result()
@@ -0,0 +1,184 @@
+import re
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# 参与关键词索引的字段及权重（名称、系列重复计数以提高权重）
+INDEXED_FIELDS = {
+    "name": 2,
+    "series": 2,
+    "craft": 1,
+    "meaning": 1,
+    "description": 1,
+}
+
+# 生成产品描述文本所需的字段
+PRODUCT_FIELDS = ("name", "series", "craft", "meaning", "price_yuan", "weight_g", "description")
+
+# 中文连续字符 或 英文/数字词（如 5g、cnc、18.2）
+_TOKEN_PATTERN = re.compile(r"[\u4e00-\u9fff]+|[a-z0-9]+(?:\.[0-9]+)?")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    分词：中文使用单字 + 二元组(bigram)，英文/数字按整词切分。
+    无需词典即可处理"星动手镯"这类不含空格的中文查询。
+    """
+    tokens = []
+    for run in _TOKEN_PATTERN.findall(str(text).lower()):
+        if "\u4e00" <= run[0] <= "\u9fff":
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def format_product_content(row) -> str:
+    """生成检索结果中返回给LLM的产品描述文本"""
+    return (
+        f"产品名称: {row['name']}, 系列: {row['series']}, 工艺: {row['craft']}, "
+        f"寓意: {row['meaning']}, 价格: {row['price_yuan']}元, 重量: {row['weight_g']}克, "
+        f"描述: {row['description']}"
+    )
+
+
+class KeywordIndex:
+    """
+    基于倒排索引的BM25关键词检索。
+
+    索引在加载时一次性构建（CSR格式：按词项排列的倒排表），每个倒排表按BM25
+    贡献值降序存储。查询时每个词项最多读取 max_postings_per_term 条记录，
+    因此单次查询的代价与商品库大小无关。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_postings_per_term: int = 256):
+        self.k1 = k1
+        self.b = b
+        self.max_postings_per_term = max_postings_per_term
+        self.vocab: Dict[str, int] = {}
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings_doc = np.zeros(0, dtype=np.int32)
+        self.postings_weight = np.zeros(0, dtype=np.float32)
+        self.doc_ids: List = []
+        self.page_contents: List[str] = []
+
+    def __len__(self):
+        return len(self.doc_ids)
+
+    @classmethod
+    def from_dataframe(cls, df, **kwargs) -> "KeywordIndex":
+        """从产品DataFrame构建索引"""
+        index = cls(**kwargs)
+        columns = {field: df[field].astype(str).tolist() for field in INDEXED_FIELDS}
+        page_contents = [
+            format_product_content(dict(zip(PRODUCT_FIELDS, values)))
+            for values in zip(*(df[field].tolist() for field in PRODUCT_FIELDS))
+        ]
+        index.build(columns, doc_ids=[int(i) for i in df["id"].tolist()], page_contents=page_contents)
+        return index
+
+    def build(self, columns: Dict[str, Sequence[str]], doc_ids: Sequence, page_contents: Sequence[str]):
+        """构建倒排索引，columns 为 {字段名: 每个文档的字段值}"""
+        n_docs = len(doc_ids)
+        self.doc_ids = list(doc_ids)
+        self.page_contents = list(page_contents)
+        self.vocab = {}
+        vocab = self.vocab
+
+        # 系列、工艺等字段取值高度重复，按取值缓存分词结果
+        field_cache: Dict[str, array] = {}
+
+        def field_token_ids(value: str) -> array:
+            ids = field_cache.get(value)
+            if ids is None:
+                ids = array("i", [vocab.setdefault(t, len(vocab)) for t in tokenize(value)])
+                field_cache[value] = ids
+            return ids
+
+        token_ids = array("i")
+        doc_lengths = np.zeros(n_docs, dtype=np.int64)
+        weighted_columns = [(columns[field], weight) for field, weight in INDEXED_FIELDS.items() if field in columns]
+        for doc_idx in range(n_docs):
+            length = 0
+            for values, weight in weighted_columns:
+                ids = field_token_ids(values[doc_idx])
+                for _ in range(weight):
+                    token_ids.extend(ids)
+                length += len(ids) * weight
+            doc_lengths[doc_idx] = length
+
+        if n_docs == 0 or not vocab:
+            self.offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+            return
+
+        posting_docs = np.repeat(np.arange(n_docs, dtype=np.int64), doc_lengths)
+        keys = np.frombuffer(token_ids, dtype=np.int32).astype(np.int64) * n_docs + posting_docs
+        keys, tf = np.unique(keys, return_counts=True)
+        terms = keys // n_docs
+        docs = keys % n_docs
+
+        df = np.bincount(terms, minlength=len(vocab))
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        avgdl = max(float(doc_lengths.mean()), 1.0)
+        norm = self.k1 * (1.0 - self.b + self.b * doc_lengths[docs] / avgdl)
+        weights = idf[terms] * tf * (self.k1 + 1.0) / (tf + norm)
+
+        # 按词项分组，组内按贡献值降序，便于查询时截断
+        order = np.lexsort((-weights, terms))
+        self.postings_doc = docs[order].astype(np.int32)
+        self.postings_weight = weights[order].astype(np.float32)
+        self.offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+        np.cumsum(df, out=self.offsets[1:])
+
+    def _term_postings(self, tid: int, allowed: Optional[np.ndarray]):
+        """读取词项贡献最高的倒排记录；有过滤掩码时跳过不满足条件的文档"""
+        start, end = int(self.offsets[tid]), int(self.offsets[tid + 1])
+        limit = self.max_postings_per_term
+        if allowed is None:
+            end = min(end, start + limit)
+            return self.postings_doc[start:end], self.postings_weight[start:end]
+
+        # 预过滤：按贡献值顺序分段扫描，直到凑够 limit 条满足条件的记录
+        doc_parts, weight_parts, found = [], [], 0
+        step = limit * 4
+        while start < end and found < limit:
+            stop = min(end, start + step)
+            docs = self.postings_doc[start:stop]
+            keep = allowed[docs]
+            doc_parts.append(docs[keep])
+            weight_parts.append(self.postings_weight[start:stop][keep])
+            found += len(doc_parts[-1])
+            start, step = stop, step * 2
+        if not doc_parts:
+            return self.postings_doc[:0], self.postings_weight[:0]
+        return np.concatenate(doc_parts)[:limit], np.concatenate(weight_parts)[:limit]
+
+    def search(self, query: str, k: int = 2, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        返回 [(文档下标, BM25得分)]，按得分降序
+        allowed: 可选的布尔掩码（与文档顺序一致），只在满足条件的文档中检索
+        """
+        term_ids = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not term_ids or k <= 0:
+            return []
+
+        doc_parts, weight_parts = [], []
+        for tid in term_ids:
+            docs, weights = self._term_postings(tid, allowed)
+            doc_parts.append(docs)
+            weight_parts.append(weights)
+
+        docs = np.concatenate(doc_parts)
+        if len(docs) == 0:
+            return []
+        candidates, inverse = np.unique(docs, return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(weight_parts))
+
+        if len(candidates) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(candidates[i]), float(scores[i])) for i in top]
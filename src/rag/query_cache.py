@@ -0,0 +1,194 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+from src.rag.embedding_cache import normalize_text
+
+# 查询首尾的标点不影响检索结果
+_EDGE_PUNCTUATION = re.compile(r"^[\s\W_]+|[\s\W_]+$")
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询：NFKC（全角标点转半角）、小写、合并空白、去首尾标点"""
+    return _EDGE_PUNCTUATION.sub("", normalize_text(query).lower())
+
+
+class _Entry:
+    __slots__ = ("value", "expires_at", "slot")
+
+    def __init__(self, value, expires_at: float, slot: Optional[int]):
+        self.value = value
+        self.expires_at = expires_at
+        self.slot = slot
+
+
+class RetrievalCache:
+    """
+    检索结果缓存：
+    - 精确命中：归一化查询 + 检索参数 作为字典键，O(1)
+    - 语义命中（可选）：查询向量与已缓存查询的余弦相似度不低于阈值时复用结果
+    - 容量(LRU)与TTL淘汰；invalidate() 在索引重建后清空缓存
+    - 单飞(single-flight)：相同查询并发到达时只计算一次，其余调用方等待同一结果
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 3600, semantic_threshold: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+
+        # 语义索引：固定槽位的归一化向量矩阵
+        self._vectors: Optional[np.ndarray] = None
+        self._slot_keys = [None] * max_size
+        self._slot_groups = np.full(max_size, -1, dtype=np.int64)
+        self._free_slots = list(range(max_size - 1, -1, -1))
+        self._group_codes: Dict[Hashable, int] = {}
+
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        if entry.slot is not None:
+            self._slot_groups[entry.slot] = -1
+            self._slot_keys[entry.slot] = None
+            self._free_slots.append(entry.slot)
+
+    def _lookup_exact(self, key, now: float):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _lookup_semantic(self, group: Hashable, vector: np.ndarray, now: float):
+        code = self._group_codes.get(group)
+        if code is None or self._vectors is None:
+            return None
+        candidates = np.flatnonzero(self._slot_groups == code)
+        if len(candidates) == 0:
+            return None
+        similarities = self._vectors[candidates] @ vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.semantic_threshold:
+            return None
+        return self._lookup_exact(self._slot_keys[candidates[best]], now)
+
+    def _store(self, key, group: Hashable, value, vector: Optional[np.ndarray]):
+        if key in self._entries:
+            self._remove(key)
+        while len(self._entries) >= self.max_size:
+            self._remove(next(iter(self._entries)))
+
+        slot = None
+        if vector is not None:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_size, len(vector)), dtype=np.float32)
+            slot = self._free_slots.pop()
+            self._vectors[slot] = vector
+            self._slot_keys[slot] = key
+            self._slot_groups[slot] = self._group_codes.setdefault(group, len(self._group_codes))
+        self._entries[key] = _Entry(value, time.monotonic() + self.ttl_seconds, slot)
+
+    @property
+    def generation(self) -> int:
+        """每次 invalidate() 加一"""
+        return self._generation
+
+    def get_or_compute(self, query: str, params: Hashable, compute: Callable[[], object],
+                       embed: Optional[Callable[[str], np.ndarray]] = None, generation: Optional[int] = None):
+        """
+        返回缓存结果，未命中时调用 compute()。
+        params: 其余检索参数（k、模式、过滤条件），只在相同参数间复用结果
+        embed: 计算查询向量的函数；提供且设置了 semantic_threshold 时启用语义命中
+        generation: compute() 所用数据对应的 generation，调用方应在取得索引版本之前读取；
+            之后发生过 invalidate() 时结果不写入缓存，也不与其他 generation 的查询合并
+        """
+        normalized = normalize_query(query)
+        key = (normalized, params)
+        now = time.monotonic()
+
+        with self._lock:
+            if generation is None:
+                generation = self._generation
+            entry = self._lookup_exact(key, now)
+            if entry is not None:
+                self.exact_hits += 1
+                return entry.value
+            flight_key = (generation, key)
+            future = self._inflight.get(flight_key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[flight_key] = future
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+
+        try:
+            vector = None
+            if embed is not None and self.semantic_threshold is not None:
+                vector = np.asarray(embed(query), dtype=np.float32)
+                norm = np.linalg.norm(vector)
+                vector = vector / norm if norm > 0 else None
+
+            entry = None
+            if vector is not None:
+                with self._lock:
+                    entry = self._lookup_semantic(params, vector, now)
+                    if entry is not None:
+                        self.semantic_hits += 1
+            if entry is not None:
+                value = entry.value
+            else:
+                value = compute()
+                with self._lock:
+                    self.misses += 1
+                    # 计算期间索引被重建的结果不写入缓存
+                    if generation == self._generation:
+                        self._store(key, params, value, vector)
+        except BaseException as e:
+            with self._lock:
+                self._inflight.pop(flight_key, None)
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            self._inflight.pop(flight_key, None)
+        future.set_result(value)
+        return value
+
+    def invalidate(self):
+        """清空缓存（索引重建后调用）"""
+        with self._lock:
+            self._generation += 1
+            for key in list(self._entries):
+                self._remove(key)
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0,
+        }
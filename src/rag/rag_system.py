@@ -1,155 +1,807 @@
 import os
+import asyncio
 import pandas as pd
 import numpy as np
+import faiss
 from langchain.docstore.document import Document
 from langchain.text_splitter import CharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain.embeddings.base import Embeddings
-from sentence_transformers import SentenceTransformer
 from typing import List
 import time
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 
-from config import PRODUCT_KNOWLEDGE_PATH, VECTOR_STORE_PATH
+from config import (
+    PRODUCT_KNOWLEDGE_PATH, VECTOR_STORE_PATH, EMBEDDING_CACHE_PATH, EMBEDDING_MODEL_NAME, PERFORMANCE_CONFIG
+)
+from src.rag.keyword_index import KeywordIndex
+from src.rag.attribute_index import AttributeIndex, parse_filters
+from src.rag.faiss_index import (
+    CLUSTERED_INDEX_TYPES, NON_REMOVABLE_INDEX_TYPES, configure_search, create_faiss_index, read_index, search_parameters, write_index
+)
+from src.rag.docstore import DocstoreWriter, MmapDocstore, PositionIds, docstore_exists, write_docstore
+from src.rag.embedding_cache import EmbeddingCache
+from src.rag.embedding_backends import embedding_model_id, load_sentence_model, loaded_backend
+from src.rag.embedding_batcher import EmbeddingBatcher
+from src.rag.query_cache import RetrievalCache
+from src.utils.resource_manager import ResourceManager
+from src.utils.hot_swap import HotSwapReference
+from src.rag.catalog import DuplicateProductIdError, diff_catalog, file_fingerprint, load_manifest, save_manifest
+from src.rag.index_versions import (
+    CATALOG_SNAPSHOT_FILENAME, build_in_progress, build_lock, current_version_path, new_version_path,
+    prune_versions, publish_version
+)
+from src.rag.ingestion import (
+    create_encoder_pool, encode_in_pool, iter_catalog_hashes, iter_document_batches, iter_product_documents,
+    ordered_parallel_map
+)
 
 # 全局缓存
+resource_manager = ResourceManager()
 _bert_model = None
-_vectorstore = None
-_product_data = None
+_index_versions = None  # 当前索引版本（见 _new_index_versions），可在运行中热切换
+_watcher_thread = None
+_embedding_caches = {}
+_embedding_batchers = {}
+_retrieval_executor = None
+_retrieval_executor_lock = threading.Lock()
+_query_cache = RetrievalCache(
+    max_size=PERFORMANCE_CONFIG["query_cache_size"],
+    ttl_seconds=PERFORMANCE_CONFIG["query_cache_ttl_seconds"],
+    semantic_threshold=PERFORMANCE_CONFIG["query_cache_semantic_threshold"],
+) if PERFORMANCE_CONFIG["query_cache_enabled"] else None
+
+def get_embedding_cache(model_name: str):
+    """获取模型对应的embedding缓存（进程内共享）"""
+    if not PERFORMANCE_CONFIG["embedding_cache_enabled"]:
+        return None
+    if model_name not in _embedding_caches:
+        _embedding_caches[model_name] = EmbeddingCache(
+            model_name,
+            path=os.path.join(EMBEDDING_CACHE_PATH, model_name.replace("/", "__")),
+            memory_size=PERFORMANCE_CONFIG["embedding_cache_memory_size"],
+            dtype=PERFORMANCE_CONFIG["embedding_cache_dtype"],
+            read_only=PERFORMANCE_CONFIG["embedding_cache_read_only"],
+        )
+    return _embedding_caches[model_name]
+
+def get_embedding_cache_stats():
+    """所有embedding缓存的命中率统计"""
+    return [cache.stats() for cache in _embedding_caches.values()]
+
+def get_embedding_batcher(model_name: str, encode):
+    """获取模型对应的查询embedding批处理服务（进程内所有会话共享）"""
+    if not PERFORMANCE_CONFIG["embedding_batching_enabled"]:
+        return None
+    if model_name not in _embedding_batchers:
+        _embedding_batchers[model_name] = EmbeddingBatcher(
+            encode,
+            max_batch_size=PERFORMANCE_CONFIG["bert_batch_size"],
+            window_ms=PERFORMANCE_CONFIG["embedding_batch_window_ms"],
+        )
+    return _embedding_batchers[model_name]
+
+def get_embedding_batcher_stats():
+    """查询embedding批处理的延迟与批次大小直方图"""
+    return {name: batcher.stats() for name, batcher in _embedding_batchers.items()}
+
+def _load_bert_model(model_name: str = EMBEDDING_MODEL_NAME):
+    """加载BERT模型；并发调用只加载一次，其余线程等待同一次加载"""
+    def loader():
+        global _bert_model
+        if _bert_model is None:
+            backend = PERFORMANCE_CONFIG["embedding_backend"]
+            print(f"正在加载BERT模型: {model_name}（后端: {backend}）")
+            _bert_model = load_sentence_model(model_name, backend, PERFORMANCE_CONFIG["onnx_quantized_file"])
+            print("BERT模型加载完成")
+        return _bert_model
+
+    if _bert_model is not None:
+        return _bert_model
+    return resource_manager.load("embedding_model", loader)
 
 class BertEmbeddings(Embeddings):
     """
     基于BERT的embedding类，使用sentence-transformers，带缓存优化
     """
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        global _bert_model
-        if _bert_model is None:
-            print(f"正在加载BERT模型: {model_name}")
-            _bert_model = SentenceTransformer(model_name)
-            print("BERT模型加载完成")
-        self.model = _bert_model
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        self.model = _load_bert_model(model_name)
+        self.model_name = model_name
+        # 缓存按 模型+实际使用的推理后端 区分（ONNX加载失败回退到PyTorch时与torch共用缓存）
+        self.backend = loaded_backend(self.model, PERFORMANCE_CONFIG["embedding_backend"])
+        model_id = embedding_model_id(model_name, self.backend)
+        self.cache = get_embedding_cache(model_id)
+        self.batcher = get_embedding_batcher(model_id, self._embed)
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts, batch_size=PERFORMANCE_CONFIG["bert_batch_size"], show_progress_bar=False
+        )
+
+    def _embed(self, texts: List[str], encode=None) -> np.ndarray:
+        """encode: 缓存未命中时的编码函数，默认使用本进程的模型（批量导入时交给编码进程池）"""
+        encode = encode or self._encode
+        if self.cache is None:
+            return np.asarray(encode(texts), dtype=np.float32)
+        return self.cache.get_or_encode(texts, encode)
     
     def embed_documents(self, texts: List[str]) -> List[List[float]]:
         """为文档生成embeddings"""
-        embeddings = self.model.encode(texts, batch_size=32, show_progress_bar=False)
-        return embeddings.tolist()
+        return self._embed(texts).tolist()
     
     def embed_query(self, text: str) -> List[float]:
-        """为查询生成embedding"""
-        embedding = self.model.encode([text], show_progress_bar=False)
-        return embedding[0].tolist()
-
-@lru_cache(maxsize=128)
-def _cached_keyword_search(query: str, k: int = 2):
-    """缓存的关键词搜索"""
-    global _product_data
-    
-    if _product_data is None:
-        try:
-            _product_data = pd.read_csv(PRODUCT_KNOWLEDGE_PATH)
-        except Exception as e:
-            print(f"加载产品数据失败: {e}")
-            return [Document(page_content="产品信息加载失败", metadata={"id": 0})]
-    
-    relevant_products = []
-    query_lower = query.lower()
-    
-    # 优化的关键词匹配
-    keywords = ['手镯', '黄金', '价格', '克', '折扣', '工艺', '设计', '传承', '星动', '玲珑', '福运']
-    
-    for _, row in _product_data.iterrows():
-        product_text = f"{row['name']} {row['series']} {row['craft']} {row['meaning']} {row['description']}".lower()
-        
-        # 快速关键词匹配评分
-        score = sum(1 for keyword in keywords if keyword in query_lower and keyword in product_text)
-        
-        # 简单的文本包含检查
-        if score > 0 or any(word in product_text for word in query_lower.split()[:3]):  # 只检查前3个词
-            content = f"产品名称: {row['name']}, 系列: {row['series']}, 工艺: {row['craft']}, 寓意: {row['meaning']}, 价格: {row['price_yuan']}元, 重量: {row['weight_g']}克, 描述: {row['description']}"
-            relevant_products.append(Document(page_content=content, metadata={"id": row['id'], "score": score}))
+        """为查询生成embedding，缓存未命中时交给批处理服务与其他会话合并编码"""
+        if self.cache is not None:
+            cached = self.cache.peek(text)
+            if cached is not None:
+                return cached.tolist()
+        if self.batcher is None:
+            return self._embed([text])[0].tolist()
+        return np.asarray(self.batcher.embed(text)).tolist()
+
+class IndexVersion:
+    """
+    一个产品目录版本的检索状态：产品数据、关键词/属性索引、向量存储及其检索缓存。
+    各资源在版本内单飞加载；热切换后，旧版本在最后一个使用它的查询结束时 close()
+    """
+    def __init__(self, catalog_path: str, store_path: str = None):
+        self.catalog_path = catalog_path
+        self.store_path = store_path
+        self.name = os.path.basename(store_path) if store_path else "catalog"
+        self.resources = ResourceManager()
+        self._product_data = None
+        self._keyword_index = None
+        self._attribute_index = None
+        self._vectorstore = None
+        self._vector_rows = None
+        # 检索缓存随版本一起释放
+        cache_size = PERFORMANCE_CONFIG["keyword_search_cache_size"]
+        self.filter_mask = lru_cache(maxsize=cache_size)(self._filter_mask)
+        self.keyword_documents = lru_cache(maxsize=cache_size)(self._keyword_documents)
+
+    def product_data(self):
+        """加载产品数据"""
+        if self._product_data is None:
+            product_data = pd.read_csv(self.catalog_path)
+            duplicated = product_data["id"].duplicated()
+            if duplicated.any():
+                raise DuplicateProductIdError(self.catalog_path, product_data["id"][duplicated].unique().tolist())
+            self._product_data = product_data
+        return self._product_data
+
+    def keyword_index(self):
+        """获取关键词倒排索引，首次调用时构建"""
+        def loader():
+            if self._keyword_index is None:
+                start_time = time.time()
+                self._keyword_index = KeywordIndex.from_dataframe(self.product_data())
+                print(f"关键词索引构建完成: {len(self._keyword_index)} 个产品，耗时: {time.time() - start_time:.2f}秒")
+            return self._keyword_index
+
+        if self._keyword_index is not None:
+            return self._keyword_index
+        return self.resources.load("keyword_index", loader)
+
+    def attribute_index(self):
+        """获取产品属性索引（价格/重量/系列/设计师），首次调用时构建"""
+        def loader():
+            if self._attribute_index is None:
+                self._attribute_index = AttributeIndex.from_dataframe(self.product_data())
+            return self._attribute_index
+
+        if self._attribute_index is not None:
+            return self._attribute_index
+        return self.resources.load("attribute_index", loader)
+
+    def _filter_mask(self, filters):
+        """过滤条件对应的产品行掩码（filters 为 parse_filters 的结果）"""
+        return self.attribute_index().mask(filters)
+
+    def _keyword_documents(self, query: str, k: int = 2, filters=()):
+        """BM25关键词检索，返回命中的产品文档（可能为空）"""
+        index = self.keyword_index()
+        return tuple(
+            Document(page_content=index.page_contents[i], metadata={"id": index.doc_ids[i], "score": score})
+            for i, score in index.search(query, k, allowed=self.filter_mask(filters))
+        )
+
+    def has_vectorstore(self) -> bool:
+        return self.store_path is not None and _vectorstore_exists(self.store_path)
+
+    @property
+    def loaded_vectorstore(self):
+        """已加载的向量存储（未加载时为None，不触发加载）"""
+        return self._vectorstore
+
+    def vectorstore(self, wait: bool = True):
+        """
+        懒加载向量存储，不存在时返回None。
+        wait=False 时若其他线程（如后台预热）正在加载则立即返回None，由调用方降级处理
+        """
+        if self._vectorstore is not None:
+            return self._vectorstore
+        if not self.has_vectorstore():
+            return None
+        return self.resources.load("vector_store", self._open_vectorstore, wait=wait)
+
+    def _open_vectorstore(self):
+        """从磁盘加载向量存储（供资源管理器调用）"""
+        if self._vectorstore is None:
+            print(f"正在加载向量存储（版本 {self.name}）...")
+            embeddings = BertEmbeddings()
+            index_type = load_manifest(self.store_path).get("resolved_index_type")
+            vectorstore = _read_vectorstore(self.store_path, embeddings, index_type)
+            configure_search(
+                vectorstore.index,
+                nprobe=PERFORMANCE_CONFIG["faiss_nprobe"],
+                ef_search=PERFORMANCE_CONFIG["faiss_hnsw_ef_search"],
+            )
+            # 预先计算预过滤所需的向量行号映射
+            self._vector_rows = _vector_rows_of(vectorstore, self.product_data())
+            self._vectorstore = vectorstore
+            print("向量存储加载完成")
+        return self._vectorstore
+
+    def vector_rows(self):
+        """FAISS向量位置 -> 产品目录行号（找不到的产品为-1），用于预过滤"""
+        return self._vector_rows
+
+    def warm_up(self, include_vectorstore: bool = True):
+        """加载本版本的全部索引（切换前在后台调用，切换后的查询不必等待）"""
+        self.keyword_index()
+        self.attribute_index()
+        if include_vectorstore:
+            self.vectorstore()
+
+    def close(self):
+        """释放本版本持有的索引与缓存（版本被替换且使用它的查询全部结束后调用）"""
+        self.filter_mask.cache_clear()
+        self.keyword_documents.cache_clear()
+        self._vectorstore = None
+        self._vector_rows = None
+        self._keyword_index = None
+        self._attribute_index = None
+        self._product_data = None
+        print(f"索引版本 {self.name} 已释放")
+
+def _index_version_for(store_path: str = None) -> IndexVersion:
+    """版本目录对应的检索状态；没有向量存储时只包含产品目录"""
+    if store_path is None:
+        return IndexVersion(PRODUCT_KNOWLEDGE_PATH)
+    snapshot = os.path.join(store_path, CATALOG_SNAPSHOT_FILENAME)
+    return IndexVersion(snapshot if os.path.exists(snapshot) else PRODUCT_KNOWLEDGE_PATH, store_path)
+
+def _new_index_versions():
+    """索引版本引用：首次使用时打开已发布的版本，被替换的版本在查询全部结束后释放"""
+    return HotSwapReference(
+        loader=lambda: _index_version_for(current_version_path(VECTOR_STORE_PATH)),
+        on_retired=lambda version: version.close(),
+    )
+
+_index_versions = _new_index_versions()
+
+def _cached_keyword_search(version: IndexVersion, query: str, k: int = 2, filters=()):
+    """缓存的关键词搜索（基于BM25倒排索引）"""
+    try:
+        relevant_products = list(version.keyword_documents(query, k, parse_filters(filters)))
+    except Exception as e:
+        print(f"加载产品数据失败: {e}")
+        return [Document(page_content="产品信息加载失败", metadata={"id": 0})]
     
-    # 按得分排序并返回前k个
-    relevant_products.sort(key=lambda x: x.metadata.get('score', 0), reverse=True)
-    return relevant_products[:k] if relevant_products else [Document(page_content="暂无相关产品信息", metadata={"id": 0})]
+    return relevant_products if relevant_products else [Document(page_content="暂无相关产品信息", metadata={"id": 0})]
 
-def create_vector_store():
+def reciprocal_rank_fusion(result_lists, k: int, rrf_k: int = 60):
     """
-    使用BERT embeddings创建FAISS向量存储，带性能优化
+    倒数排名融合(RRF)，按产品id去重。
+    同一产品在多个结果列表中出现时保留第一个列表中的文档（关键词结果包含完整产品信息）。
     """
-    if os.path.exists(VECTOR_STORE_PATH):
-        print("向量存储已存在，跳过创建")
-        return True
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        seen = set()
+        for rank, doc in enumerate(results):
+            product_id = doc.metadata.get("id")
+            # 同一列表中同一产品的多个文档块只计一次
+            if product_id in seen:
+                continue
+            seen.add(product_id)
+            scores[product_id] = scores.get(product_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+            documents.setdefault(product_id, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [
+        Document(page_content=documents[pid].page_content, metadata={**documents[pid].metadata, "rrf_score": scores[pid]})
+        for pid in ranked
+    ]
+
+def _ingestion_workers() -> int:
+    """编码进程数，0 表示使用全部CPU核"""
+    return max(1, PERFORMANCE_CONFIG["ingestion_workers"] or os.cpu_count() or 1)
+
+def _encode_batches(batches, embeddings):
+    """
+    并行编码文档批次，按顺序产出 ((文档块, id, 清单行), 向量)。
+    多进程时缓存查找仍在主进程进行，只有未命中的文本发送到编码进程
+    """
+    workers = _ingestion_workers()
+
+    def texts_of(batch):
+        return [doc.page_content for doc in batch[0]]
+
+    if workers <= 1:
+        yield from ordered_parallel_map(lambda batch: embeddings._embed(texts_of(batch)), batches)
+        return
+
+    print(f"使用 {workers} 个进程并行编码")
+    with create_encoder_pool(
+        workers,
+        embeddings.model_name,
+        embeddings.backend,
+        PERFORMANCE_CONFIG["onnx_quantized_file"],
+        PERFORMANCE_CONFIG["bert_batch_size"],
+    ) as pool:
+        def encode(batch):
+            return embeddings._embed(texts_of(batch), encode=lambda texts: encode_in_pool(pool, texts))
+
+        yield from ordered_parallel_map(encode, batches, workers)
+
+def _new_index(vectors: np.ndarray, index_type: str):
+    """用已缓存的向量训练所选类型的FAISS索引并写入这些向量，返回 (索引, 实际类型)"""
+    index, resolved_index_type = create_faiss_index(
+        vectors,
+        index_type,
+        nlist=PERFORMANCE_CONFIG["faiss_nlist"],
+        hnsw_m=PERFORMANCE_CONFIG["faiss_hnsw_m"],
+        pq_m=PERFORMANCE_CONFIG["faiss_pq_m"],
+        nprobe=PERFORMANCE_CONFIG["faiss_nprobe"],
+        ef_search=PERFORMANCE_CONFIG["faiss_hnsw_ef_search"],
+        max_training_points=PERFORMANCE_CONFIG["faiss_max_training_points"],
+    )
+    index.add(vectors)
+    return index, resolved_index_type
+
+def _ingest_batches(batches, embeddings, writer: DocstoreWriter, index=None, index_type: str = "flat",
+                    on_batch=None):
+    """
+    编码文档批次：向量逐批写入索引，文档逐条追加到 docstore（不在内存中保留文档）。
+    index 为None时新建索引：ivf_* 先缓存至多 faiss_max_training_points 个向量（不含文档）用于训练，
+    其余类型用第一批向量创建，之后逐批添加。
+    on_batch(产品数, 文档块数): 每批写入后的回调
+    返回 (索引, 新建索引的实际类型（增量时为None）, 清单行)
+    """
+    manifest_rows = {}
+    buffered, buffered_count = [], 0
+    resolved_index_type = None
+    for (docs, ids, rows), vectors in _encode_batches(batches, embeddings):
+        manifest_rows.update(rows)
+        for doc, doc_id in zip(docs, ids):
+            writer.add({"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata})
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if index is not None:
+            index.add(vectors)
+        else:
+            buffered.append(vectors)
+            buffered_count += len(vectors)
+            if (index_type not in CLUSTERED_INDEX_TYPES
+                    or buffered_count >= PERFORMANCE_CONFIG["faiss_max_training_points"]):
+                index, resolved_index_type = _new_index(np.concatenate(buffered), index_type)
+                buffered = []
+        if on_batch is not None:
+            on_batch(len(rows), len(docs))
+
+    if index is None:
+        if not buffered:
+            raise ValueError("产品目录为空，无法创建向量存储")
+        index, resolved_index_type = _new_index(np.concatenate(buffered), index_type)
+    return index, resolved_index_type, manifest_rows
+
+def _copy_unchanged(previous_path: str, index, stale_product_ids, writer: DocstoreWriter):
+    """
+    增量同步：从索引中删除变更/下架产品的向量，其余文档按原顺序原样复制到新docstore
+    （remove_ids 后剩余向量保持原顺序，与复制的文档逐位置对应）
+    """
+    old_docstore = MmapDocstore(previous_path)
+    stale = np.isin(old_docstore.product_ids, np.asarray(stale_product_ids, dtype=np.int64))
+    if stale.any():
+        index.remove_ids(np.flatnonzero(stale).astype(np.int64))
+    for position in np.flatnonzero(~stale):
+        writer.add_raw(old_docstore.raw(position), old_docstore.product_ids[position])
+
+def _vectorstore_exists(store_path: str) -> bool:
+    return os.path.exists(os.path.join(store_path, "index.faiss")) and docstore_exists(store_path)
+
+def _save_vectorstore(vectorstore, store_path: str):
+    """保存为 index.faiss + 偏移索引docstore，文档按向量位置顺序写入（不使用pickle）"""
+    os.makedirs(store_path, exist_ok=True)
+
+    def records():
+        for position in range(vectorstore.index.ntotal):
+            doc_id = vectorstore.index_to_docstore_id[position]
+            doc = vectorstore.docstore.search(doc_id)
+            yield {"id": doc_id, "page_content": doc.page_content, "metadata": doc.metadata}
+
+    write_docstore(store_path, records())
+    write_index(vectorstore.index, os.path.join(store_path, "index.faiss"))
+    # 删除旧版 save_local 生成的pickle文件
+    legacy_path = os.path.join(store_path, "index.pkl")
+    if os.path.exists(legacy_path):
+        os.remove(legacy_path)
+
+def _read_vectorstore(store_path: str, embeddings, index_type: str = None):
+    """
+    以mmap方式只读打开索引和docstore，供查询进程使用，多进程共享页缓存
+    （增量同步不修改旧版本，见 _copy_unchanged）
+    """
+    index = read_index(os.path.join(store_path, "index.faiss"), index_type)
+    docstore = MmapDocstore(store_path)
+    return FAISS(embeddings, index, docstore, PositionIds(len(docstore)))
+
+def create_vector_store(force: bool = False, csv_path: str = None, store_path: str = None, progress_callback=None):
+    """
+    使用BERT embeddings创建或增量同步FAISS向量存储。
+    清单(manifest.json)记录每行内容哈希和目录指纹，重建时只向量化新增/变更的行，
+    并删除已下架的行。force=True 时全量重建。
+    导入是流式的：分块读取CSV，文档批次在进程池中并行编码后逐批写入索引。
+    每次构建写入新的版本目录（含目录快照），完成后才发布；构建的是当前服务的存储时，
+    预热新版本并热切换，进行中的查询继续使用旧版本。
+    progress_callback(stage, done, total): 进度回调，stage 为 "scan"（扫描目录）/"embed"（向量化）/"save"
+    """
+    csv_path = csv_path or PRODUCT_KNOWLEDGE_PATH
+    store_path = store_path or VECTOR_STORE_PATH
+    report = progress_callback or (lambda stage, done, total: None)
 
     try:
-        start_time = time.time()
-        print("开始创建向量存储...")
-        
-        # 加载产品数据
-        df = pd.read_csv(PRODUCT_KNOWLEDGE_PATH)
-        print(f"已加载 {len(df)} 个产品")
-        
-        # 创建文档
-        documents = []
-        for _, row in df.iterrows():
-            # 简化内容，减少token数量
-            content = f"{row['name']} {row['series']} {row['craft']} 价格{row['price_yuan']}元 {row['meaning']}"
-            documents.append(Document(page_content=content, metadata={"id": row['id']}))
-
-        # 较小的chunk_size，提高查询精度
-        text_splitter = CharacterTextSplitter(chunk_size=200, chunk_overlap=20)
-        docs = text_splitter.split_documents(documents)
-        print(f"创建了 {len(docs)} 个文档块")
-        
-        # 使用BERT embeddings
-        embeddings = BertEmbeddings()
-        print("正在生成embeddings...")
-        
-        # 创建并保存FAISS向量存储
-        vectorstore = FAISS.from_documents(docs, embeddings)
-        vectorstore.save_local(VECTOR_STORE_PATH)
-        
-        elapsed_time = time.time() - start_time
-        print(f"向量存储已保存到: {VECTOR_STORE_PATH}，耗时: {elapsed_time:.2f}秒")
-        
+        with build_lock(store_path):
+            version_path = _build_vector_store_version(force, csv_path, store_path, report)
+        if version_path is not None and os.path.abspath(store_path) == os.path.abspath(VECTOR_STORE_PATH):
+            _swap_index_version(version_path)
         return True
         
     except Exception as e:
         print(f"创建向量存储失败: {e}")
         return False
 
-def query_vector_store(query: str, k: int = 2):
+def _build_vector_store_version(force: bool, csv_path: str, store_path: str, report):
+    """构建并发布新版本，返回版本目录；已是最新时返回None"""
+    start_time = time.time()
+    previous_path = current_version_path(store_path)
+    fingerprint = file_fingerprint(csv_path)
+    manifest = {} if force or previous_path is None else load_manifest(previous_path)
+    has_index = previous_path is not None and _vectorstore_exists(previous_path)
+
+    if has_index and manifest.get("fingerprint") == fingerprint:
+        print("向量存储已是最新，跳过创建")
+        return None
+
+    # 在新版本目录中构建，使用目录快照保证索引与关键词/属性数据一致
+    version_path = new_version_path(store_path, fingerprint)
+    try:
+        catalog_path = os.path.join(version_path, CATALOG_SNAPSHOT_FILENAME)
+        shutil.copyfile(csv_path, catalog_path)
+        fingerprint = file_fingerprint(catalog_path)
+        _build_vector_store_files(catalog_path, fingerprint, previous_path if has_index else None,
+                                  manifest, version_path, report)
+    except BaseException:
+        shutil.rmtree(version_path, ignore_errors=True)
+        raise
+
+    publish_version(store_path, version_path)
+    removed = prune_versions(
+        store_path,
+        keep=PERFORMANCE_CONFIG["index_versions_to_keep"],
+        in_use=[previous_path, version_path],
+    )
+    elapsed_time = time.time() - start_time
+    print(f"向量存储版本已发布: {version_path}，耗时: {elapsed_time:.2f}秒，清理旧版本 {len(removed)} 个")
+    return version_path
+
+def _build_vector_store_files(catalog_path: str, fingerprint: str, previous_path, manifest,
+                              version_path: str, report):
+    """在版本目录中生成索引、docstore和清单；previous_path 为可增量同步的上一版本"""
+    # 第一遍只计算内容哈希：得到产品总数与增量差异
+    chunk_rows = PERFORMANCE_CONFIG["ingestion_chunk_rows"]
+    hashes = {}
+    duplicate_ids = []
+    for pid, digest in iter_catalog_hashes(catalog_path, chunk_rows):
+        if pid in hashes:
+            duplicate_ids.append(pid)
+            continue
+        hashes[pid] = digest
+        if len(hashes) % chunk_rows == 0:
+            report("scan", len(hashes), 0)
+    if duplicate_ids:
+        # 重复的id会产生相同的文档块id，检索时也无法把向量位置映射回唯一的目录行
+        raise DuplicateProductIdError(catalog_path, sorted(set(duplicate_ids), key=duplicate_ids.index))
+    report("scan", len(hashes), len(hashes))
+    print(f"已加载 {len(hashes)} 个产品")
+
+    # 较小的chunk_size，提高查询精度
+    text_splitter = CharacterTextSplitter(
+        chunk_size=PERFORMANCE_CONFIG["chunk_size"],
+        chunk_overlap=PERFORMANCE_CONFIG["chunk_overlap"]
+    )
+    embeddings = BertEmbeddings()
+
+    index_type = PERFORMANCE_CONFIG["faiss_index_type"]
+    index = None
+    manifest_rows = {}
+    targets = None  # 需要向量化的产品，None 为全部
+    with DocstoreWriter(version_path) as writer:
+        if previous_path is not None and manifest.get("rows") is not None and manifest.get("index_type") == index_type:
+            # 增量同步
+            old_rows = manifest["rows"]
+            added, changed, removed = diff_catalog(old_rows, hashes)
+            print(f"增量同步: 新增 {len(added)}，变更 {len(changed)}，删除 {len(removed)}")
+
+            stale_products = changed + removed
+            if stale_products and manifest.get("resolved_index_type") in NON_REMOVABLE_INDEX_TYPES:
+                print(f"{manifest['resolved_index_type']} 索引不支持删除，改为全量重建")
+            else:
+                resolved_index_type = manifest["resolved_index_type"]
+                index = read_index(os.path.join(previous_path, "index.faiss"), resolved_index_type, mmap=False)
+                _copy_unchanged(previous_path, index, [int(pid) for pid in stale_products], writer)
+                targets = set(added + changed)
+                manifest_rows = {pid: old_rows[pid] for pid in hashes if pid in old_rows and pid not in targets}
+
+        if index is None:
+            print(f"开始创建向量存储（索引类型: {index_type}）...")
+        total = len(hashes) if targets is None else len(targets)
+        progress = {"products": 0, "chunks": 0}
+
+        def on_batch(n_products, n_chunks):
+            progress["products"] += n_products
+            progress["chunks"] += n_chunks
+            report("embed", progress["products"], total)
+
+        report("embed", 0, total)
+        if total or index is None:
+            print("正在生成embeddings...")
+            products = iter_product_documents(catalog_path, text_splitter, chunk_rows, targets)
+            batches = iter_document_batches(products, PERFORMANCE_CONFIG["ingestion_batch_size"])
+            index, new_index_type, rows = _ingest_batches(batches, embeddings, writer, index, index_type, on_batch)
+            resolved_index_type = new_index_type or resolved_index_type
+            manifest_rows.update(rows)
+            print(f"向量化 {progress['products']} 个产品，{progress['chunks']} 个文档块")
+        report("save", 0, 1)
+
+    write_index(index, os.path.join(version_path, "index.faiss"))
+    save_manifest(version_path, {
+        "fingerprint": fingerprint,
+        "index_type": index_type,
+        "resolved_index_type": resolved_index_type,
+        "rows": manifest_rows,
+    })
+    report("save", 1, 1)
+
+def _swap_index_version(store_path: str = None):
+    """
+    预热指定版本后原子切换当前索引版本，并使检索结果缓存失效。
+    进行中的查询继续使用旧版本，旧版本在它们结束后释放
+    """
+    old = _index_versions.peek()
+    version = _index_version_for(store_path)
+    # 旧版本已加载向量存储（或配置了预热）时一并预热，切换后的首个查询不必等待加载
+    include_vectorstore = (
+        (old is not None and old.loaded_vectorstore is not None) or PERFORMANCE_CONFIG["warm_up_embedding_model"]
+    )
+    version.warm_up(include_vectorstore=include_vectorstore)
+    _index_versions.swap(version)
+    if _query_cache is not None:
+        _query_cache.invalidate()
+    print(f"索引已切换到版本 {version.name}")
+    return version
+
+def reload_product_index(csv_path: str = None, background: bool = True) -> bool:
+    """
+    管理入口：产品目录更新后构建新索引版本并热切换。
+    没有向量存储时只重新加载产品目录（关键词/属性索引）。已有构建在进行时返回False
+    """
+    if build_in_progress():
+        print("索引构建已在进行中")
+        return False
+
+    def run():
+        if current_version_path(VECTOR_STORE_PATH) is not None:
+            create_vector_store(csv_path=csv_path)
+        else:
+            _swap_index_version(None)
+
+    if background:
+        threading.Thread(target=run, name="index-reload", daemon=True).start()
+    else:
+        run()
+    return True
+
+def start_catalog_watcher(interval: float = None) -> bool:
+    """
+    后台轮询产品目录文件和已发布的版本（CURRENT），变化时重建或切换索引（只启动一次）。
+    其他进程发布的新版本也会被切换过来。返回本次是否启动了监视
+    """
+    global _watcher_thread
+    interval = interval or PERFORMANCE_CONFIG["catalog_watch_interval_seconds"]
+    if not interval or _watcher_thread is not None:
+        return False
+
+    def catalog_stat():
+        try:
+            stat = os.stat(PRODUCT_KNOWLEDGE_PATH)
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def run():
+        last_stat = catalog_stat()
+        while True:
+            time.sleep(interval)
+            try:
+                stat = catalog_stat()
+                if stat != last_stat:
+                    last_stat = stat
+                    print("检测到产品目录变更，开始更新索引")
+                    reload_product_index(background=False)
+                elif not build_in_progress():
+                    published = current_version_path(VECTOR_STORE_PATH)
+                    if published != _index_versions.current.store_path:
+                        print(f"检测到新发布的索引版本: {published}")
+                        _swap_index_version(published)
+            except Exception as e:
+                print(f"索引更新检查失败: {e}")
+
+    _watcher_thread = threading.Thread(target=run, name="catalog-watcher", daemon=True)
+    _watcher_thread.start()
+    return True
+
+def get_index_version_info():
+    """当前索引版本与切换统计，供UI展示"""
+    return {"version": _index_versions.current.name, **_index_versions.stats()}
+
+def start_warm_up():
+    """
+    服务启动时在后台线程预热BERT模型、关键词/属性索引和向量存储（只启动一次），
+    并按配置启动产品目录监视。预热期间的检索请求不会阻塞：向量存储未就绪时降级为关键词检索
+    """
+    def warm(method):
+        def loader():
+            with _index_versions.acquire() as version:
+                return getattr(version, method)()
+        return loader
+
+    loaders = {
+        "keyword_index": warm("keyword_index"),
+        "attribute_index": warm("attribute_index"),
+    }
+    if PERFORMANCE_CONFIG["warm_up_embedding_model"]:
+        loaders["embedding_model"] = _load_bert_model
+        if _index_versions.current.has_vectorstore():
+            loaders["vector_store"] = warm("vectorstore")
+    start_catalog_watcher()
+    return resource_manager.warm_up(loaders)
+
+def get_resource_status():
+    """后台资源的就绪状态与加载耗时，供UI展示（索引类资源取当前版本的状态）"""
+    return {**resource_manager.status(), **_index_versions.current.resources.status()}
+
+def _vector_rows_of(vectorstore, product_data):
+    """FAISS向量位置 -> 产品目录行号（找不到的产品为-1），用于预过滤"""
+    if isinstance(vectorstore.docstore, MmapDocstore):
+        # 直接读取docstore的产品id列，无需解码文档
+        product_ids = np.asarray(vectorstore.docstore.product_ids)
+    else:
+        product_ids = np.array([
+            vectorstore.docstore.search(vectorstore.index_to_docstore_id[position]).metadata.get("id", -1)
+            for position in range(vectorstore.index.ntotal)
+        ], dtype=np.int64)
+    return pd.Index(product_data["id"]).get_indexer(product_ids)
+
+def _filtered_similarity_search(version: IndexVersion, vectorstore, query: str, k: int, allowed: np.ndarray):
     """
-    查询FAISS向量存储以找到相关产品，带缓存优化
+    带预过滤的FAISS相似性搜索：只在满足条件的向量中搜索（IDSelectorBitmap），
+    而不是先取top-k再过滤
     """
-    global _vectorstore
+    rows = version.vector_rows()
+    allowed_vectors = (rows >= 0) & allowed[np.maximum(rows, 0)]
+    if not allowed_vectors.any():
+        return []
+
+    bitmap = np.packbits(allowed_vectors, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(allowed_vectors), faiss.swig_ptr(bitmap))
+    params = search_parameters(vectorstore.index, selector)
+    embedding = np.asarray([vectorstore._embed_query(query)], dtype=np.float32)
+    if vectorstore._normalize_L2:
+        faiss.normalize_L2(embedding)
+    _, indices = vectorstore.index.search(embedding, k, params=params)
+    return [
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[i])
+        for i in indices[0] if i != -1
+    ]
+
+def query_vector_store(query: str, k: int = 2, mode: str = None, filters=None):
+    """
+    查询产品知识，带缓存优化
+    mode: "hybrid"（BM25 + FAISS 倒数排名融合，默认）、"vector"（仅FAISS）、"keyword"（仅BM25）
+    filters: 属性过滤条件，如 "price_yuan<=8000, series in {星动系列, 玲珑系列}"，在检索前预过滤
+    整个查询使用开始时的索引版本，期间发生的热切换不影响本次结果
+    """
+    mode = mode or PERFORMANCE_CONFIG["retrieval_mode"]
+    filters = parse_filters(filters)
+    # 先读缓存代数再取索引版本：取到旧版本时，切换后的 invalidate() 必然使代数不同，旧结果不会写入缓存
+    generation = _query_cache.generation if _query_cache is not None else None
+    with _index_versions.acquire() as version:
+        if _query_cache is None:
+            return _search_products(version, query, k, mode, filters)
+
+        # 向量存储已加载时才启用语义命中（复用同一embedding模型及其缓存）
+        vectorstore = version.loaded_vectorstore
+        embed = vectorstore._embed_query if mode != "keyword" and vectorstore is not None else None
+        results = _query_cache.get_or_compute(
+            query, (k, mode, filters), lambda: _search_products(version, query, k, mode, filters), embed=embed,
+            generation=generation,
+        )
+        return list(results)
+
+def _get_retrieval_executor() -> ThreadPoolExecutor:
+    """异步检索共享的线程池：并发会话不再各占一个线程，同时进行的查询经 EmbeddingBatcher 合并编码"""
+    global _retrieval_executor
+    with _retrieval_executor_lock:
+        if _retrieval_executor is None:
+            _retrieval_executor = ThreadPoolExecutor(
+                max_workers=PERFORMANCE_CONFIG["async_retrieval_workers"], thread_name_prefix="retrieval"
+            )
+        return _retrieval_executor
+
+async def aquery_vector_store(query: str, k: int = 2, mode: str = None, filters=None):
+    """query_vector_store 的异步版本：在共享线程池中检索，不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_retrieval_executor(), query_vector_store, query, k, mode, filters)
+
+def get_query_cache_stats():
+    """检索结果缓存的命中统计"""
+    return _query_cache.stats() if _query_cache is not None else {}
+
+def _search_products(version: IndexVersion, query: str, k: int, mode: str, filters):
+    """执行检索（不经过结果缓存）"""
+    if mode == "keyword":
+        return _cached_keyword_search(version, query, k, filters)
     
     try:
-        # 懒加载向量存储
-        if _vectorstore is None:
-            if not os.path.exists(VECTOR_STORE_PATH):
+        vectorstore = version.vectorstore(wait=False)
+        if vectorstore is None:
+            if version.resources.is_loading("vector_store"):
+                print("向量存储加载中，暂时使用关键词搜索")
+            else:
                 print("向量存储不存在，使用关键词搜索")
-                return _cached_keyword_search(query, k)
-            
-            print("正在加载向量存储...")
-            embeddings = BertEmbeddings()
-            _vectorstore = FAISS.load_local(
-                VECTOR_STORE_PATH, 
-                embeddings, 
-                allow_dangerous_deserialization=True
-            )
-            print("向量存储加载完成")
+            return _cached_keyword_search(version, query, k, filters)
+        
+        allowed = version.filter_mask(filters)
+
+        def vector_search(depth):
+            if allowed is None:
+                return vectorstore.similarity_search(query, k=depth)
+            return _filtered_similarity_search(version, vectorstore, query, depth, allowed)
+        
+        if mode == "vector":
+            # 执行快速相似性搜索
+            return vector_search(k)
         
-        # 执行快速相似性搜索
-        results = _vectorstore.similarity_search(query, k=k)
-        return results
+        # 两路检索共享同一候选预算，每路取一半（不少于k）
+        depth = max(k, PERFORMANCE_CONFIG["hybrid_candidate_budget"] // 2)
+        keyword_results = version.keyword_documents(query, depth, filters)
+        vector_results = vector_search(depth)
+        results = reciprocal_rank_fusion(
+            [keyword_results, vector_results], k, rrf_k=PERFORMANCE_CONFIG["rrf_k"]
+        )
+        return results if results else _cached_keyword_search(version, query, k, filters)
         
     except Exception as e:
         print(f"向量存储查询失败: {e}，回退到关键词搜索")
         # 如果向量存储查询失败，回退到缓存的关键词匹配
-        return _cached_keyword_search(query, k)
+        return _cached_keyword_search(version, query, k, filters)
 
 def _fallback_keyword_search(query: str, k: int = 2):
     """
     回退的关键词搜索方法（保留兼容性）
     """
-    return _cached_keyword_search(query, k) 
\ No newline at end of file
+    with _index_versions.acquire() as version:
+        return _cached_keyword_search(version, query, k)
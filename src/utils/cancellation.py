@@ -0,0 +1,121 @@
+"""
+取消令牌 - 会话重新开始或用户离开时，终止仍在排队或生成中的LLM请求
+
+令牌通过 cancel_token 参数传给代理、评估链和各层LLM包装（调度、路由、重试），
+排队中的请求被移出队列，生成中的请求关闭HTTP流，并抛出 LLMCancelled
+"""
+import asyncio
+import threading
+import time
+from typing import Callable, List, Optional
+
+# 取消条件需要轮询时（父令牌、should_cancel）的检查间隔
+CANCEL_POLL_SECONDS = 0.1
+
+
+class LLMCancelled(Exception):
+    """LLM请求已被取消"""
+
+
+class CancelToken:
+    """
+    cancel() 后 cancelled 为真；子令牌在父令牌取消时也视为已取消。
+    should_cancel 为额外的取消条件（如页面已发起新的运行），由等待方轮询
+    """
+
+    def __init__(self, parent: "CancelToken" = None, should_cancel: Callable[[], bool] = None):
+        self.parent = parent
+        self.should_cancel = should_cancel
+        self.reason = ""
+        self._event = threading.Event()
+        self._callbacks = []
+        self._background = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if (self.parent is not None and self.parent.cancelled) or (self.should_cancel and self.should_cancel()):
+            self.cancel("上级取消")
+            return True
+        return False
+
+    def cancel(self, reason: str = "已取消"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """取消时调用 callback（已取消则立即调用，父令牌和本令牌都触发时只调用一次），返回注销函数"""
+        fired = []
+
+        def once():
+            if not fired:
+                fired.append(True)
+                callback()
+
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(once)
+                registered = True
+            else:
+                registered = False
+        remove_parent = self.parent.add_callback(once) if self.parent is not None else None
+        if not registered:
+            once()
+
+        def remove():
+            with self._lock:
+                if once in self._callbacks:
+                    self._callbacks.remove(once)
+            if remove_parent is not None:
+                remove_parent()
+
+        return remove
+
+    def hold(self, thread: threading.Thread):
+        """登记取消后仍在收尾的后台线程（如还在等首个块的HTTP读取，要等块到达才能关闭连接）"""
+        with self._lock:
+            self._background.append(thread)
+
+    def background_threads(self) -> List[threading.Thread]:
+        """登记过且仍在运行的后台线程"""
+        with self._lock:
+            return [thread for thread in self._background if thread.is_alive()]
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise LLMCancelled(self.reason)
+
+    def wait(self, timeout: Optional[float]) -> bool:
+        """最多等待 timeout 秒（None为一直等），期间被取消时提前返回True"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.cancelled:
+            remaining = CANCEL_POLL_SECONDS if deadline is None else min(CANCEL_POLL_SECONDS,
+                                                                         deadline - time.monotonic())
+            if remaining <= 0:
+                return False
+            self._event.wait(remaining)
+        return True
+
+    async def async_wait(self, timeout: Optional[float]) -> bool:
+        """wait 的异步版本，等待期间不阻塞事件循环"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.cancelled:
+            remaining = CANCEL_POLL_SECONDS if deadline is None else min(CANCEL_POLL_SECONDS,
+                                                                         deadline - time.monotonic())
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(remaining)
+        return True
+
+
+def llm_kwargs(cancel_token: Optional[CancelToken]) -> dict:
+    """调用LLM包装时的额外参数：只在有令牌时传 cancel_token"""
+    return {} if cancel_token is None else {"cancel_token": cancel_token}
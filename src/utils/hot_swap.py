@@ -0,0 +1,84 @@
+"""
+可热切换的共享引用 - 索引等只读数据的零停机替换
+"""
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class HotSwapReference:
+    """
+    读者在 acquire() 期间持有取得时的版本；swap() 之后的新读者立即看到新版本，
+    旧版本在最后一个读者释放后回调 on_retired（释放资源）并被丢弃
+    """
+
+    def __init__(self, loader: Optional[Callable[[], object]] = None,
+                 on_retired: Optional[Callable[[object], None]] = None):
+        self._loader = loader
+        self._on_retired = on_retired
+        self._lock = threading.Lock()
+        self._current = None
+        self._readers: Dict[int, list] = {}  # id(版本) -> [版本, 读者数]
+        self.swaps = 0
+
+    @property
+    def current(self):
+        """当前版本（首次访问时由 loader 创建）"""
+        with self._lock:
+            if self._current is None and self._loader is not None:
+                self._current = self._loader()
+            return self._current
+
+    def peek(self):
+        """当前版本，尚未创建时返回None（不触发 loader）"""
+        with self._lock:
+            return self._current
+
+    @contextmanager
+    def acquire(self):
+        with self._lock:
+            if self._current is None and self._loader is not None:
+                self._current = self._loader()
+            value = self._current
+            entry = self._readers.setdefault(id(value), [value, 0])
+            entry[1] += 1
+        try:
+            yield value
+        finally:
+            self._release(value)
+
+    def _release(self, value):
+        with self._lock:
+            entry = self._readers[id(value)]
+            entry[1] -= 1
+            retired = entry[1] == 0 and value is not self._current
+            if entry[1] == 0:
+                del self._readers[id(value)]
+        if retired:
+            self._retire(value)
+
+    def _retire(self, value):
+        if self._on_retired is not None and value is not None:
+            self._on_retired(value)
+
+    def swap(self, value):
+        """替换为新版本，返回旧版本；旧版本没有读者时立即释放"""
+        with self._lock:
+            old = self._current
+            if old is value:
+                return old
+            self._current = value
+            self.swaps += 1
+            retire_now = id(old) not in self._readers
+        if retire_now:
+            self._retire(old)
+        return old
+
+    def stats(self) -> Dict:
+        with self._lock:
+            current_id = id(self._current)
+            return {
+                "swaps": self.swaps,
+                "active_readers": sum(count for _, count in self._readers.values()),
+                "draining_versions": sum(1 for key in self._readers if key != current_id),
+            }
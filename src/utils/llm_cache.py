@@ -0,0 +1,224 @@
+"""
+LLM响应缓存（SQLite持久化）- 支持录制/回放
+
+键为 (模型, temperature, max_tokens, 完整prompt) 的哈希。包装的是 LLMRouter 时，
+按回复上标注的实际后端的参数录制，查找时依次尝试主后端和各备用后端的键，
+因此录制时发生过故障切换的prompt回放时同样命中。三种模式：
+- live:   直接调用API，不读写缓存（默认）
+- record: 命中时直接返回缓存的回复，未命中时调用API并记录
+- replay: 只从缓存返回，未命中抛出 LLMCacheMiss（离线压测、回归测试用，结果确定）
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.runnables import Runnable
+
+from config import LLM_CACHE_PATH, PERFORMANCE_CONFIG
+from src.utils.llm_router import ROUTED_BACKEND_KEY
+
+CACHE_MODES = ("live", "record", "replay")
+
+_response_caches = {}
+_response_caches_lock = threading.Lock()
+
+
+class LLMCacheMiss(KeyError):
+    """replay 模式下缓存中没有对应的回复"""
+
+
+def llm_cache_key(model: str, temperature, max_tokens, prompt: str) -> str:
+    return hashlib.sha256(
+        json.dumps([model, temperature, max_tokens, prompt], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+class LLMResponseCache:
+    """SQLite存储的LLM回复，多线程共享一个连接（WAL模式，允许多进程同时读）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT, temperature REAL, max_tokens INTEGER, "
+                "prompt TEXT, response TEXT, latency_ms REAL, created_at REAL)"
+            )
+            self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key: str) -> Optional[str]:
+        return self.get_first([key])
+
+    def get_first(self, keys: List[str]) -> Optional[str]:
+        """按顺序返回第一个存在的键对应的回复，整体计一次命中或未命中"""
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = {
+                key: (response, latency_ms)
+                for key, response, latency_ms in self._conn.execute(
+                    f"SELECT key, response, latency_ms FROM responses WHERE key IN ({placeholders})", keys)
+            }
+            row = next((rows[key] for key in keys if key in rows), None)
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += (row[1] or 0) / 1000
+            return row[0]
+
+    def put(self, key: str, model: str, temperature, max_tokens, prompt: str, response: str, latency_ms: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, model, temperature, max_tokens, prompt, response, latency_ms, time.time()),
+            )
+            self._conn.commit()
+            self.recorded += 1
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "recorded": self.recorded,
+            "saved_seconds": self.saved_seconds,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def get_response_cache(path: str = None) -> LLMResponseCache:
+    """获取进程内共享的响应缓存"""
+    path = path or LLM_CACHE_PATH
+    with _response_caches_lock:
+        if path not in _response_caches:
+            _response_caches[path] = LLMResponseCache(path)
+        return _response_caches[path]
+
+
+def _prompt_text(input) -> str:
+    """prompt统一为字符串：支持字符串和 PromptValue（LCEL中上游 PromptTemplate 的输出）"""
+    if isinstance(input, str):
+        return input
+    if hasattr(input, "to_string"):
+        return input.to_string()
+    return str(input)
+
+
+def _message_text(message) -> str:
+    return message if isinstance(message, str) else getattr(message, "content", str(message))
+
+
+class CachedChatModel(Runnable):
+    """
+    为聊天模型加上响应缓存，接口与被包装的模型一致（invoke/stream/ainvoke/astream），可用于LCEL链。
+    流式调用命中缓存时一次性返回完整回复；录制时只记录完整生成的回复
+    """
+
+    def __init__(self, llm, cache: LLMResponseCache, mode: str = "record"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"未知的LLM缓存模式: {mode}，可选 {CACHE_MODES}")
+        self.llm = llm
+        self.cache = cache
+        self.mode = mode
+        self.model_name = getattr(llm, "model_name", type(llm).__name__)
+        self.temperature = getattr(llm, "temperature", None)
+        self.max_tokens = getattr(llm, "max_tokens", None)
+        # 查找时依次尝试的模型参数：路由器为主后端和各备用后端，其他模型只有它自己
+        identities = getattr(llm, "cache_identities", None) or [(self.model_name, self.temperature, self.max_tokens)]
+        self.identities = list(dict.fromkeys(identities))
+
+    def _lookup(self, input):
+        prompt = _prompt_text(input)
+        keys = [llm_cache_key(model, temperature, max_tokens, prompt) for model, temperature, max_tokens in self.identities]
+        response = None if self.mode == "live" else self.cache.get_first(keys)
+        if response is None and self.mode == "replay":
+            raise LLMCacheMiss(f"回放模式下缓存未命中（模型 {self.model_name}）: {prompt[:50]}...")
+        return prompt, response
+
+    def _answered_by(self, messages):
+        """实际回复的模型参数：路由器标注的后端（故障切换后不是主后端），没有标注时为被包装模型的参数"""
+        for message in messages:
+            routed = (getattr(message, "response_metadata", None) or {}).get(ROUTED_BACKEND_KEY)
+            if routed:
+                return routed["model_name"], routed["temperature"], routed["max_tokens"]
+        return self.model_name, self.temperature, self.max_tokens
+
+    def _record(self, prompt: str, messages, response: str, start: float):
+        if self.mode == "record":
+            model, temperature, max_tokens = self._answered_by(messages)
+            self.cache.put(llm_cache_key(model, temperature, max_tokens, prompt), model, temperature, max_tokens,
+                           prompt, response, (time.perf_counter() - start) * 1000)
+
+    def invoke(self, input, config=None, **kwargs):
+        prompt, response = self._lookup(input)
+        if response is not None:
+            return AIMessage(content=response)
+        start = time.perf_counter()
+        result = self.llm.invoke(input, config, **kwargs)
+        self._record(prompt, [result], _message_text(result), start)
+        return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        prompt, response = self._lookup(input)
+        if response is not None:
+            return AIMessage(content=response)
+        start = time.perf_counter()
+        result = await self.llm.ainvoke(input, config, **kwargs)
+        self._record(prompt, [result], _message_text(result), start)
+        return result
+
+    def stream(self, input, config=None, **kwargs):
+        prompt, response = self._lookup(input)
+        if response is not None:
+            yield AIMessageChunk(content=response)
+            return
+        start = time.perf_counter()
+        chunks = []
+        for chunk in self.llm.stream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self._record(prompt, chunks, "".join(map(_message_text, chunks)), start)
+
+    async def astream(self, input, config=None, **kwargs):
+        prompt, response = self._lookup(input)
+        if response is not None:
+            yield AIMessageChunk(content=response)
+            return
+        start = time.perf_counter()
+        chunks = []
+        async for chunk in self.llm.astream(input, config, **kwargs):
+            chunks.append(chunk)
+            yield chunk
+        self._record(prompt, chunks, "".join(map(_message_text, chunks)), start)
+
+
+def with_response_cache(llm, mode: str = None):
+    """按 PERFORMANCE_CONFIG["llm_cache_mode"] 包装聊天模型；live 模式原样返回"""
+    mode = mode or PERFORMANCE_CONFIG["llm_cache_mode"]
+    if mode == "live":
+        return llm
+    return CachedChatModel(llm, get_response_cache(), mode)
@@ -0,0 +1,454 @@
+"""
+LLM客户端网络层 - 所有聊天模型共享的连接池、显式超时、带抖动的重试和对冲请求
+
+- create_chat_model() 创建的 ChatOpenAI 共用一个 httpx 连接池（keep-alive），关闭SDK自带的重试；
+  异步连接绑定事件循环，每个运行中的事件循环各用一个异步连接池，循环关闭前随之关闭
+- ResilientChatModel 在流式调用层面重试：只在尚未产出任何token时重试，避免重复输出
+- 对冲（可选）：请求在截止时间内没有首token时再发一个相同请求，先出首token的胜出，另一个被关闭；
+  截止时间取该模型近期首token延迟的 p95（限制在 [llm_hedge_min_ms, llm_hedge_max_ms]）
+- cancel_token 参数在这一层消费（不传给API）：被取消时关闭HTTP流并抛出 LLMCancelled，不重试；
+  同步调用还没收到首个块的读取线程要等块到达才能关闭连接，登记在令牌上（见 CancelToken.hold）
+"""
+import asyncio
+import queue
+import random
+import threading
+import time
+from functools import reduce
+from typing import Dict, Optional
+
+import httpx
+import openai
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+
+from config import PERFORMANCE_CONFIG
+from src.utils.cancellation import CANCEL_POLL_SECONDS, LLMCancelled
+from src.utils.metrics import Histogram
+
+_http_client = None
+_http_async_client = None
+# 事件循环 -> (该循环的异步连接池, 循环关闭时负责关闭连接池的异步生成器)
+_loop_clients: Dict[asyncio.AbstractEventLoop, tuple] = {}
+_http_clients_lock = threading.Lock()
+
+# 对冲前至少需要的首token延迟样本数，样本不足时用 llm_hedge_max_ms
+MIN_HEDGE_SAMPLES = 20
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(
+        connect=PERFORMANCE_CONFIG["llm_connect_timeout_seconds"],
+        read=PERFORMANCE_CONFIG["llm_read_timeout_seconds"],
+        write=PERFORMANCE_CONFIG["llm_connect_timeout_seconds"],
+        pool=PERFORMANCE_CONFIG["llm_pool_timeout_seconds"],
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=PERFORMANCE_CONFIG["llm_max_connections"],
+        max_keepalive_connections=PERFORMANCE_CONFIG["llm_max_keepalive_connections"],
+        keepalive_expiry=PERFORMANCE_CONFIG["llm_keepalive_expiry_seconds"],
+    )
+
+
+def get_http_client() -> httpx.Client:
+    """进程内共享的同步连接池"""
+    global _http_client
+    with _http_clients_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(timeout=_timeout(), limits=_limits())
+        return _http_client
+
+
+class _LoopHttpClient(httpx.AsyncClient):
+    """
+    交给 ChatOpenAI 的异步客户端：请求转发给当前事件循环自己的连接池。
+    ChatOpenAI 在创建时就固定了 http_async_client，而 keep-alive 连接只能在建立它的事件循环里使用
+    """
+
+    async def send(self, request, **kwargs):
+        client = await _loop_http_client()
+        return await client.send(request, **kwargs)
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """进程内共享的异步客户端，实际连接池按事件循环区分（见 _loop_http_client）"""
+    global _http_async_client
+    with _http_clients_lock:
+        if _http_async_client is None:
+            _http_async_client = _LoopHttpClient(timeout=_timeout(), limits=_limits())
+        return _http_async_client
+
+
+async def _close_on_loop_shutdown(client: httpx.AsyncClient):
+    """
+    在事件循环里启动后挂起；asyncio.run 关闭循环前会对未结束的异步生成器调用 aclose()
+    （shutdown_asyncgens），这时在同一个循环里关闭连接池
+    """
+    try:
+        yield
+    finally:
+        with _http_clients_lock:
+            _loop_clients.pop(asyncio.get_running_loop(), None)
+        await client.aclose()
+
+
+async def _loop_http_client() -> httpx.AsyncClient:
+    """当前事件循环的异步连接池，首次使用时创建"""
+    loop = asyncio.get_running_loop()
+    with _http_clients_lock:
+        entry = _loop_clients.get(loop)
+        if entry is not None:
+            return entry[0]
+        # 没走 shutdown_asyncgens 就关闭的循环，它的连接已不可用，直接丢弃
+        for closed in [other for other in _loop_clients if other.is_closed()]:
+            del _loop_clients[closed]
+        client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        closer = _close_on_loop_shutdown(client)
+        _loop_clients[loop] = (client, closer)
+        # 首次调用 __anext__ 时生成器登记到当前循环（asyncio 的 firstiter 钩子）
+        started = closer.__anext__()
+    await started
+    return client
+
+
+def create_chat_model(model_name: str, api_key: str, base_url: Optional[str] = None, **kwargs) -> ChatOpenAI:
+    """创建使用共享连接池和显式超时的聊天模型；重试由 ResilientChatModel 负责"""
+    return ChatOpenAI(
+        model_name=model_name,
+        openai_api_key=api_key,
+        openai_api_base=base_url,
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+        timeout=_timeout(),
+        max_retries=0,
+        **kwargs,
+    )
+
+
+def is_retryable(error: Exception) -> bool:
+    """连接错误、超时、限流和服务端5xx可以重试；参数错误、鉴权失败等不重试"""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, httpx.TransportError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+def backoff_seconds(attempt: int) -> float:
+    """指数退避 + 全抖动：[0, min(上限, 基数 * 2^attempt)] 内均匀随机"""
+    cap = min(PERFORMANCE_CONFIG["llm_retry_backoff_max_seconds"],
+              PERFORMANCE_CONFIG["llm_retry_backoff_seconds"] * 2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def _merge(chunks) -> AIMessageChunk:
+    """合并流式消息块（内容拼接，用量等元数据合并）"""
+    return reduce(lambda a, b: a + b, chunks, AIMessageChunk(content=""))
+
+
+_DONE = object()
+
+
+class _StreamAttempt:
+    """在后台线程中消费一次流式请求，消息块放入共享队列；stop() 后在下一个块到达时关闭连接"""
+
+    def __init__(self, llm, input, config, kwargs, results: "queue.Queue", attempt_id: int):
+        self.id = attempt_id
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, args=(llm, input, config, kwargs, results), name="llm-hedge", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self, llm, input, config, kwargs, results):
+        stream = llm.stream(input, config, **kwargs)
+        try:
+            for chunk in stream:
+                if self.stopped.is_set():
+                    return
+                results.put((self.id, chunk, None))
+            results.put((self.id, _DONE, None))
+        except Exception as e:
+            results.put((self.id, None, e))
+        finally:
+            stream.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class ResilientChatModel(Runnable):
+    """
+    为聊天模型加上重试和对冲，接口与被包装的模型一致（invoke/stream/ainvoke/astream）。
+    首token延迟、重试和对冲次数见 stats()
+    """
+
+    def __init__(self, llm, name: str = None, max_retries: int = None, hedging: bool = None):
+        self.llm = llm
+        self.name = name or getattr(llm, "model_name", type(llm).__name__)
+        self.max_retries = PERFORMANCE_CONFIG["llm_max_retries"] if max_retries is None else max_retries
+        self.hedging = PERFORMANCE_CONFIG["llm_hedging_enabled"] if hedging is None else hedging
+        self.ttft_ms = Histogram()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    # 透传模型参数（响应缓存的键等会用到）
+    @property
+    def model_name(self):
+        return getattr(self.llm, "model_name", self.name)
+
+    @property
+    def temperature(self):
+        return getattr(self.llm, "temperature", None)
+
+    @property
+    def max_tokens(self):
+        return getattr(self.llm, "max_tokens", None)
+
+    def hedge_deadline_seconds(self) -> float:
+        """对冲截止时间：近期首token延迟的分位数，样本不足时取上限"""
+        high = PERFORMANCE_CONFIG["llm_hedge_max_ms"]
+        if self.ttft_ms.count < MIN_HEDGE_SAMPLES:
+            return high / 1000
+        deadline = self.ttft_ms.percentile(PERFORMANCE_CONFIG["llm_hedge_percentile"])
+        return min(max(deadline, PERFORMANCE_CONFIG["llm_hedge_min_ms"]), high) / 1000
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                setattr(self, key, getattr(self, key) + value)
+
+    def _retry_or_raise(self, error: Exception, attempt: int, emitted: bool) -> float:
+        """可以重试时返回退避秒数，否则抛出原异常（取消不计为失败）"""
+        if isinstance(error, LLMCancelled):
+            raise error
+        if emitted or attempt >= self.max_retries or not is_retryable(error):
+            self._count(failures=1)
+            raise error
+        self._count(retries=1)
+        delay = backoff_seconds(attempt)
+        print(f"LLM请求失败（{self.name}）: {error}，{delay:.2f}秒后第{attempt + 1}次重试")
+        return delay
+
+    # ---- 同步 ----
+
+    def _stream_once(self, input, config, kwargs, cancel_token):
+        start = time.perf_counter()
+        first = True
+        # 有取消令牌时在后台线程中读取，调用方等待首token期间也能立即响应取消
+        if self.hedging or cancel_token is not None:
+            chunks = self._threaded_stream(input, config, kwargs, cancel_token)
+        else:
+            chunks = self.llm.stream(input, config, **kwargs)
+        for chunk in chunks:
+            if first:
+                self.ttft_ms.observe((time.perf_counter() - start) * 1000)
+                first = False
+            yield chunk
+
+    def _threaded_stream(self, input, config, kwargs, cancel_token):
+        """
+        在后台线程中读取流式输出；开启对冲时，截止时间内没有首token再发一个相同请求，先出首token的胜出。
+        被取消或落败的请求在下一个块到达时关闭连接
+        """
+        results: "queue.Queue" = queue.Queue()
+        attempts = {0: _StreamAttempt(self.llm, input, config, kwargs, results, 0)}
+        remove = None
+        if cancel_token is not None:
+            remove = cancel_token.add_callback(lambda: results.put((None, None, LLMCancelled(cancel_token.reason))))
+        winner = None
+        hedge_at = time.monotonic() + self.hedge_deadline_seconds() if self.hedging else None
+        try:
+            while True:
+                try:
+                    attempt_id, chunk, error = results.get(timeout=self._next_wait(hedge_at, cancel_token))
+                except queue.Empty:
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    if hedge_at is not None and time.monotonic() >= hedge_at:
+                        self._count(hedges=1)
+                        hedge_at = None
+                        attempts[1] = _StreamAttempt(self.llm, input, config, kwargs, results, 1)
+                    continue
+                if attempt_id is None:
+                    raise error
+                if winner is not None and attempt_id != winner:
+                    continue
+                if error is not None:
+                    attempts.pop(attempt_id).stop()
+                    if winner is not None or not attempts:
+                        raise error
+                    continue
+                if winner is None:
+                    winner = attempt_id
+                    hedge_at = None
+                    if winner == 1:
+                        self._count(hedge_wins=1)
+                    for other_id, other in attempts.items():
+                        if other_id != winner:
+                            other.stop()
+                if chunk is _DONE:
+                    return
+                yield chunk
+        finally:
+            if remove is not None:
+                remove()
+            for attempt in attempts.values():
+                attempt.stop()
+                # 还在等块的读取线程要到下一个块到达才能关闭连接，登记给令牌，调度层等它结束再释放许可
+                if cancel_token is not None and attempt.thread.is_alive():
+                    cancel_token.hold(attempt.thread)
+
+    @staticmethod
+    def _next_wait(hedge_at: Optional[float], cancel_token) -> Optional[float]:
+        wait = CANCEL_POLL_SECONDS if cancel_token is not None else None
+        if hedge_at is not None:
+            remaining = max(0.0, hedge_at - time.monotonic())
+            wait = remaining if wait is None else min(wait, remaining)
+        return wait
+
+    def stream(self, input, config=None, **kwargs):
+        cancel_token = kwargs.pop("cancel_token", None)
+        self._count(calls=1)
+        attempt = 0
+        while True:
+            emitted = False
+            try:
+                for chunk in self._stream_once(input, config, kwargs, cancel_token):
+                    emitted = True
+                    yield chunk
+                return
+            except Exception as e:
+                delay = self._retry_or_raise(e, attempt, emitted)
+                if cancel_token is None:
+                    time.sleep(delay)
+                elif cancel_token.wait(delay):
+                    raise LLMCancelled(cancel_token.reason)
+                attempt += 1
+
+    def invoke(self, input, config=None, **kwargs):
+        return _merge(list(self.stream(input, config, **kwargs)))
+
+    # ---- 异步 ----
+
+    async def _acancellable(self, stream, cancel_token):
+        """异步流式读取，等待下一个块时定期检查取消；被取消时取消读取任务，HTTP流随之关闭"""
+        try:
+            while True:
+                task = asyncio.ensure_future(stream.__anext__())
+                while True:
+                    done, _ = await asyncio.wait({task}, timeout=CANCEL_POLL_SECONDS)
+                    if done:
+                        break
+                    if cancel_token.cancelled:
+                        task.cancel()
+                        await asyncio.gather(task, return_exceptions=True)
+                        raise LLMCancelled(cancel_token.reason)
+                try:
+                    chunk = task.result()
+                except StopAsyncIteration:
+                    return
+                yield chunk
+                cancel_token.raise_if_cancelled()
+        finally:
+            await stream.aclose()
+
+    async def _ahedged_stream(self, input, config, kwargs, cancel_token):
+        streams = {0: self.llm.astream(input, config, **kwargs)}
+        pending = {asyncio.ensure_future(streams[0].__anext__()): 0}
+        winner = None
+        hedge_at = time.monotonic() + self.hedge_deadline_seconds()
+        try:
+            while winner is None:
+                done, _ = await asyncio.wait(
+                    pending, timeout=self._next_wait(hedge_at, cancel_token), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    if cancel_token is not None:
+                        cancel_token.raise_if_cancelled()
+                    if hedge_at is not None and time.monotonic() >= hedge_at:
+                        self._count(hedges=1)
+                        hedge_at = None
+                        streams[1] = self.llm.astream(input, config, **kwargs)
+                        pending[asyncio.ensure_future(streams[1].__anext__())] = 1
+                    continue
+                task = done.pop()
+                attempt_id = pending.pop(task)
+                error = task.exception()
+                if error is not None:
+                    await streams.pop(attempt_id).aclose()
+                    if not streams:
+                        raise error if not isinstance(error, StopAsyncIteration) else RuntimeError("LLM返回空流")
+                    continue
+                winner = attempt_id
+                if winner == 1:
+                    self._count(hedge_wins=1)
+                yield task.result()
+        finally:
+            # 先等落败请求的 __anext__ 取消完成，才能关闭对应的流
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            for attempt_id, stream in streams.items():
+                if attempt_id != winner:
+                    await stream.aclose()
+        rest = streams[winner] if cancel_token is None else self._acancellable(streams[winner], cancel_token)
+        async for chunk in rest:
+            yield chunk
+
+    async def _astream_once(self, input, config, kwargs, cancel_token):
+        start = time.perf_counter()
+        first = True
+        if self.hedging:
+            stream = self._ahedged_stream(input, config, kwargs, cancel_token)
+        elif cancel_token is not None:
+            stream = self._acancellable(self.llm.astream(input, config, **kwargs), cancel_token)
+        else:
+            stream = self.llm.astream(input, config, **kwargs)
+        async for chunk in stream:
+            if first:
+                self.ttft_ms.observe((time.perf_counter() - start) * 1000)
+                first = False
+            yield chunk
+
+    async def astream(self, input, config=None, **kwargs):
+        cancel_token = kwargs.pop("cancel_token", None)
+        self._count(calls=1)
+        attempt = 0
+        while True:
+            emitted = False
+            try:
+                async for chunk in self._astream_once(input, config, kwargs, cancel_token):
+                    emitted = True
+                    yield chunk
+                return
+            except Exception as e:
+                delay = self._retry_or_raise(e, attempt, emitted)
+                if cancel_token is None:
+                    await asyncio.sleep(delay)
+                elif await cancel_token.async_wait(delay):
+                    raise LLMCancelled(cancel_token.reason)
+                attempt += 1
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return _merge([chunk async for chunk in self.astream(input, config, **kwargs)])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retries": self.retries,
+                "failures": self.failures,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "ttft_ms": self.ttft_ms.snapshot(),
+                "hedge_deadline_ms": self.hedge_deadline_seconds() * 1000,
+            }
@@ -0,0 +1,284 @@
+"""
+LLM后端路由 - 按近期延迟和错误率在多个后端（DeepSeek、OpenAI等）之间选择，带熔断和后台恢复探测
+
+- 每个后端保留最近 llm_router_window 次调用的首token延迟和成败，
+  得分 = 首token延迟中位数 + 错误率 * llm_router_error_penalty_ms，选得分最低的健康后端；
+  还没有样本的后端得分为0，会先被试用一次
+- 连续失败 llm_breaker_failure_threshold 次后熔断，llm_breaker_cooldown_seconds 后
+  在后台发一个探测请求，成功则恢复，失败则继续熔断
+- 尚未产出任何内容时失败会切换到下一个后端；所有后端都熔断时仍按熔断先后依次尝试
+- 被取消（LLMCancelled）不计为后端失败，也不切换后端
+- 回复（流式时为第一个块）的 response_metadata["llm_backend"] 标注实际回复的后端及其模型参数，
+  响应缓存据此按实际后端记录，故障切换后的回复不会记在主后端的键下；
+  查找时按 cache_identities 依次尝试各后端的键，录制时切换过的prompt回放时也能命中
+"""
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Dict, List
+
+from langchain_core.runnables import Runnable
+
+from config import PERFORMANCE_CONFIG
+from src.utils.cancellation import LLMCancelled
+
+# 恢复探测用的请求（只要求1个token）
+PROBE_PROMPT = "请回复：好"
+
+# 回复 response_metadata 中标注实际后端的键
+ROUTED_BACKEND_KEY = "llm_backend"
+
+
+class CircuitBreaker:
+    """closed 正常 -> 连续失败达到阈值 open 熔断 -> 冷却后 half_open 探测 -> 成功 closed / 失败 open"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, cooldown_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+
+    @property
+    def available(self) -> bool:
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.failures = 0
+        self.state = self.CLOSED
+
+    def record_failure(self) -> bool:
+        """记录一次失败，本次导致熔断时返回True"""
+        self.failures += 1
+        if self.state == self.OPEN:
+            return False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.time()
+            self.opens += 1
+            return True
+        return False
+
+
+class Backend:
+    """一个可路由的聊天模型及其近期延迟、错误率和熔断状态"""
+
+    def __init__(self, name: str, llm, window: int = None, failure_threshold: int = None,
+                 cooldown_seconds: float = None):
+        window = window or PERFORMANCE_CONFIG["llm_router_window"]
+        self.name = name
+        self.llm = llm
+        self.breaker = CircuitBreaker(
+            failure_threshold or PERFORMANCE_CONFIG["llm_breaker_failure_threshold"],
+            PERFORMANCE_CONFIG["llm_breaker_cooldown_seconds"] if cooldown_seconds is None else cooldown_seconds,
+        )
+        self.ttft_ms = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def score(self) -> float:
+        latency = statistics.median(self.ttft_ms) if self.ttft_ms else 0.0
+        return latency + self.error_rate * PERFORMANCE_CONFIG["llm_router_error_penalty_ms"]
+
+
+class LLMRouter(Runnable):
+    """
+    在多个后端之间路由的聊天模型，接口与被包装的模型一致（invoke/stream/ainvoke/astream）。
+    第一个后端为主后端：对外的模型参数（调度预估等）取自它，得分相同时优先选它
+    """
+
+    def __init__(self, backends: List[Backend], name: str = "router"):
+        if not backends:
+            raise ValueError("LLMRouter 至少需要一个后端")
+        self.backends = backends
+        self.name = name
+        self._lock = threading.Lock()
+        self.failovers = 0
+
+    @property
+    def model_name(self):
+        return getattr(self.backends[0].llm, "model_name", self.backends[0].name)
+
+    @property
+    def temperature(self):
+        return getattr(self.backends[0].llm, "temperature", None)
+
+    @property
+    def max_tokens(self):
+        return getattr(self.backends[0].llm, "max_tokens", None)
+
+    @staticmethod
+    def _identity(backend: Backend) -> Dict:
+        """后端的模型参数（响应缓存的键用到）"""
+        return {
+            "model_name": getattr(backend.llm, "model_name", backend.name),
+            "temperature": getattr(backend.llm, "temperature", None),
+            "max_tokens": getattr(backend.llm, "max_tokens", None),
+        }
+
+    @property
+    def cache_identities(self) -> List[tuple]:
+        """各后端的 (模型, temperature, max_tokens)，主后端在前；响应缓存按这个顺序查找"""
+        return [tuple(self._identity(b).values()) for b in self.backends]
+
+    def _tag(self, message, backend: Backend):
+        """在回复上标注实际回复的后端和它的模型参数"""
+        metadata = getattr(message, "response_metadata", None)
+        if isinstance(metadata, dict):
+            metadata[ROUTED_BACKEND_KEY] = {"name": backend.name, **self._identity(backend)}
+        return message
+
+    def candidates(self) -> List[Backend]:
+        """本次调用依次尝试的后端：健康的按得分排序，熔断的按熔断先后排在最后"""
+        with self._lock:
+            healthy = sorted((b for b in self.backends if b.breaker.available), key=Backend.score)
+            broken = sorted((b for b in self.backends if not b.breaker.available), key=lambda b: b.breaker.opened_at)
+        return healthy + broken
+
+    def _record(self, backend: Backend, ok: bool, ttft_ms: float = None, error: Exception = None):
+        with self._lock:
+            backend.calls += 1
+            backend.outcomes.append(ok)
+            if ttft_ms is not None:
+                backend.ttft_ms.append(ttft_ms)
+            if ok:
+                backend.breaker.record_success()
+                return
+            backend.failures += 1
+            opened = backend.breaker.record_failure()
+        if opened:
+            print(f"LLM后端 {backend.name} 连续失败{backend.breaker.failures}次，熔断"
+                  f"{backend.breaker.cooldown_seconds:g}秒: {error}")
+            self._schedule_probe(backend)
+
+    def _schedule_probe(self, backend: Backend):
+        timer = threading.Timer(backend.breaker.cooldown_seconds, self._probe, args=(backend,))
+        timer.daemon = True
+        timer.start()
+
+    def _probe(self, backend: Backend):
+        """熔断冷却结束后的恢复探测（不经过调度队列，只要求1个token）"""
+        with self._lock:
+            if backend.breaker.state != CircuitBreaker.OPEN:
+                return
+            backend.breaker.state = CircuitBreaker.HALF_OPEN
+        start = time.perf_counter()
+        try:
+            backend.llm.invoke(PROBE_PROMPT, max_tokens=1)
+        except Exception as e:
+            self._record(backend, False, error=e)
+            return
+        self._record(backend, True, (time.perf_counter() - start) * 1000)
+        print(f"LLM后端 {backend.name} 探测成功，恢复路由")
+
+    def _failover(self, backend: Backend, error: Exception, emitted: bool):
+        """记录失败；已经产出内容或没有下一个后端时由调用方抛出"""
+        self._record(backend, False, error=error)
+        if emitted:
+            raise error
+        with self._lock:
+            self.failovers += 1
+        print(f"LLM后端 {backend.name} 调用失败: {error}，尝试下一个后端")
+
+    def stream(self, input, config=None, **kwargs):
+        error = None
+        for backend in self.candidates():
+            start = time.perf_counter()
+            ttft_ms = None
+            try:
+                for chunk in backend.llm.stream(input, config, **kwargs):
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - start) * 1000
+                        chunk = self._tag(chunk, backend)
+                    yield chunk
+            except LLMCancelled:
+                raise
+            except Exception as e:
+                self._failover(backend, e, ttft_ms is not None)
+                error = e
+                continue
+            self._record(backend, True, ttft_ms)
+            return
+        raise error
+
+    def invoke(self, input, config=None, **kwargs):
+        error = None
+        for backend in self.candidates():
+            start = time.perf_counter()
+            try:
+                result = backend.llm.invoke(input, config, **kwargs)
+            except LLMCancelled:
+                raise
+            except Exception as e:
+                self._failover(backend, e, False)
+                error = e
+                continue
+            self._record(backend, True, (time.perf_counter() - start) * 1000)
+            return self._tag(result, backend)
+        raise error
+
+    async def astream(self, input, config=None, **kwargs):
+        error = None
+        for backend in self.candidates():
+            start = time.perf_counter()
+            ttft_ms = None
+            try:
+                async for chunk in backend.llm.astream(input, config, **kwargs):
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - start) * 1000
+                        chunk = self._tag(chunk, backend)
+                    yield chunk
+            except LLMCancelled:
+                raise
+            except Exception as e:
+                self._failover(backend, e, ttft_ms is not None)
+                error = e
+                continue
+            self._record(backend, True, ttft_ms)
+            return
+        raise error
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        error = None
+        for backend in self.candidates():
+            start = time.perf_counter()
+            try:
+                result = await backend.llm.ainvoke(input, config, **kwargs)
+            except LLMCancelled:
+                raise
+            except Exception as e:
+                self._failover(backend, e, False)
+                error = e
+                continue
+            self._record(backend, True, (time.perf_counter() - start) * 1000)
+            return self._tag(result, backend)
+        raise error
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "failovers": self.failovers,
+                "backends": {
+                    b.name: {
+                        "state": b.breaker.state,
+                        "calls": b.calls,
+                        "failures": b.failures,
+                        "error_rate": b.error_rate,
+                        "ttft_ms_p50": statistics.median(b.ttft_ms) if b.ttft_ms else None,
+                        "score": b.score(),
+                        "opens": b.breaker.opens,
+                    }
+                    for b in self.backends
+                },
+            }
@@ -0,0 +1,524 @@
+"""
+LLM请求调度器 - 所有会话共享的并发上限、请求/token速率预算和优先级队列
+
+- 优先级：interactive（客户对话）> report（评估报告）> batch（摘要、预生成、批处理）
+- 同优先级先到先得；排在队首的请求等待速率预算恢复时，后面的请求不会插队
+- 配置 llm_scheduler_dir 后，并发槽位（flock 文件锁）和速率预算（加锁的状态文件）
+  在同一台机器的多个进程间共享，进程退出时槽位自动释放
+- 调用方通过 ScheduledChatModel 接入，优先级默认取包装时指定的值，
+  也可以用 with llm_priority(...) 在当前上下文中临时指定
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from langchain_core.runnables import Runnable
+
+from config import PERFORMANCE_CONFIG
+from src.utils.cancellation import CANCEL_POLL_SECONDS, CancelToken, LLMCancelled
+from src.memory.conversation_memory import count_tokens
+from src.utils.metrics import Histogram
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_REPORT = "report"
+PRIORITY_BATCH = "batch"
+# 按优先级从高到低
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_REPORT, PRIORITY_BATCH)
+
+# 排队等待分桶（毫秒）
+QUEUE_WAIT_BUCKETS_MS = (1, 10, 50, 100, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+# 跨进程槽位被占满时的重试间隔
+SLOT_POLL_SECONDS = 0.05
+
+_current_priority = contextvars.ContextVar("llm_priority", default=None)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class LLMQueueTimeout(TimeoutError):
+    """在调度队列中等待超时"""
+
+
+@contextmanager
+def llm_priority(priority: str):
+    """在当前上下文（线程/协程）中指定之后LLM调用的优先级"""
+    if priority not in PRIORITIES:
+        raise ValueError(f"未知的LLM优先级: {priority}，可选 {PRIORITIES}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """令牌桶：每分钟恢复 per_minute 个，最多积攒 burst 个（默认一分钟的量）。由调用方加锁"""
+
+    def __init__(self, per_minute: float, burst: float = None):
+        self.rate = per_minute / 60
+        self.capacity = burst or per_minute
+        self._data = [self.capacity, time.monotonic()]
+
+    def _clock(self) -> float:
+        return time.monotonic()
+
+    @contextmanager
+    def _state(self):
+        yield self._data
+
+    def _refill(self, state) -> float:
+        now = self._clock()
+        state[0] = min(self.capacity, state[0] + (now - state[1]) * self.rate)
+        state[1] = now
+        return state[0]
+
+    def try_take(self, amount: float) -> float:
+        """取出 amount 个令牌并返回0；不够时不取，返回还需等待的秒数（超过桶容量的请求按容量计）"""
+        amount = min(amount, self.capacity)
+        with self._state() as state:
+            available = self._refill(state)
+            if available >= amount:
+                state[0] = available - amount
+                return 0.0
+            return (amount - available) / self.rate
+
+    def give_back(self, amount: float):
+        """归还（amount<0 时补扣）令牌，用于按实际用量修正预估"""
+        with self._state() as state:
+            state[0] = min(self.capacity, self._refill(state) + amount)
+
+
+class FileTokenBucket(TokenBucket):
+    """状态存放在文件中，flock 加锁，同一台机器上的多个进程共享预算"""
+
+    def __init__(self, path: str, per_minute: float, burst: float = None):
+        super().__init__(per_minute, burst)
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def _clock(self) -> float:
+        return time.time()
+
+    @contextmanager
+    def _state(self):
+        import fcntl
+
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            raw = os.read(self._fd, 64).split()
+            state = [float(raw[0]), float(raw[1])] if len(raw) == 2 else [self.capacity, self._clock()]
+            yield state
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.ftruncate(self._fd, 0)
+            os.write(self._fd, f"{state[0]:.6f} {state[1]:.6f}".encode("ascii"))
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class FileSlots:
+    """跨进程并发槽位：每个槽位一个锁文件，持有 flock 即占用（进程崩溃时由内核释放）"""
+
+    def __init__(self, directory: str, count: int):
+        self.paths = [os.path.join(directory, f"slot-{i}.lock") for i in range(count)]
+
+    def try_acquire(self) -> Optional[int]:
+        import fcntl
+
+        for path in self.paths:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def release(self, fd: int):
+        import fcntl
+
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+class _Ticket:
+    """一个排队中的LLM请求"""
+
+    __slots__ = ("priority", "order", "tokens", "timeout", "enqueued_at", "granted", "cancelled", "slot",
+                 "_event", "_loop", "_future")
+
+    def __init__(self, priority: str, seq: int, tokens: int, loop=None):
+        self.priority = priority
+        self.order = (PRIORITIES.index(priority), seq)
+        self.tokens = tokens
+        self.timeout = None
+        self.enqueued_at = time.perf_counter()
+        self.granted = False
+        self.cancelled = False
+        self.slot = None
+        self._loop = loop
+        self._future = loop.create_future() if loop is not None else None
+        self._event = threading.Event() if loop is None else None
+
+    def __lt__(self, other):
+        return self.order < other.order
+
+    def _wake(self):
+        if self._future is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(lambda: self._future.done() or self._future.set_result(None))
+
+
+class LLMScheduler:
+    """
+    acquire()/aacquire() 排队拿到许可后才能调用LLM，结束后 release()。
+    requests_per_minute / tokens_per_minute 为 0 或 None 时不限；token按 prompt + max_tokens 预估，
+    release 时按实际用量修正
+    """
+
+    def __init__(self, max_concurrency: int = 8, requests_per_minute: float = None, tokens_per_minute: float = None,
+                 shared_dir: str = None, queue_timeout: float = None):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.shared_dir = shared_dir
+        if shared_dir:
+            os.makedirs(shared_dir, exist_ok=True)
+            self._slots = FileSlots(shared_dir, max_concurrency)
+            bucket = lambda name, rate: FileTokenBucket(os.path.join(shared_dir, f"{name}.bucket"), rate)
+        else:
+            self._slots = None
+            bucket = lambda name, rate: TokenBucket(rate)
+        self._requests = bucket("requests", requests_per_minute) if requests_per_minute else None
+        self._tokens = bucket("tokens", tokens_per_minute) if tokens_per_minute else None
+
+        self._lock = threading.Lock()
+        self._heap = []
+        self._seq = itertools.count()
+        self._timer = None
+        self._timer_at = 0.0
+        self.in_flight = 0
+        self._queued = {p: 0 for p in PRIORITIES}
+        self._max_queued = {p: 0 for p in PRIORITIES}
+        self._granted = {p: 0 for p in PRIORITIES}
+        self._timeouts = {p: 0 for p in PRIORITIES}
+        self._cancelled = {p: 0 for p in PRIORITIES}
+        self._wait_ms = {p: Histogram(buckets=QUEUE_WAIT_BUCKETS_MS) for p in PRIORITIES}
+
+    # ---- 调度（均在 self._lock 内调用） ----
+
+    def _enqueue(self, ticket: _Ticket):
+        heapq.heappush(self._heap, ticket)
+        self._queued[ticket.priority] += 1
+        self._max_queued[ticket.priority] = max(self._max_queued[ticket.priority], self._queued[ticket.priority])
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._heap:
+            ticket = self._heap[0]
+            if ticket.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            if self.in_flight >= self.max_concurrency:
+                return
+            wait = self._requests.try_take(1) if self._requests else 0.0
+            if wait:
+                self._retry_in(wait)
+                return
+            wait = self._tokens.try_take(ticket.tokens) if self._tokens else 0.0
+            if wait:
+                self._refund(1, 0)
+                self._retry_in(wait)
+                return
+            if self._slots is not None:
+                ticket.slot = self._slots.try_acquire()
+                if ticket.slot is None:
+                    self._refund(1, ticket.tokens)
+                    self._retry_in(SLOT_POLL_SECONDS)
+                    return
+            heapq.heappop(self._heap)
+            self.in_flight += 1
+            self._queued[ticket.priority] -= 1
+            self._granted[ticket.priority] += 1
+            self._wait_ms[ticket.priority].observe((time.perf_counter() - ticket.enqueued_at) * 1000)
+            ticket.granted = True
+            ticket._wake()
+
+    def _refund(self, requests: int, tokens: int):
+        if self._requests is not None and requests:
+            self._requests.give_back(requests)
+        if self._tokens is not None and tokens:
+            self._tokens.give_back(tokens)
+
+    def _retry_in(self, delay: float):
+        """速率预算或跨进程槽位暂不可用，delay 秒后再调度"""
+        at = time.monotonic() + delay
+        if self._timer is not None and self._timer_at <= at:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = at
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _cancel(self, ticket: _Ticket) -> bool:
+        """放弃排队；已经拿到许可时返回False"""
+        if ticket.granted:
+            return False
+        ticket.cancelled = True
+        self._queued[ticket.priority] -= 1
+        self._dispatch()
+        return True
+
+    # ---- 对外接口 ----
+
+    def _next_wait(self, deadline: Optional[float], cancel_token: Optional[CancelToken]) -> Optional[float]:
+        """下一次等待的秒数：不超过剩余排队时间；有取消令牌时定期醒来检查"""
+        wait = CANCEL_POLL_SECONDS if cancel_token is not None else None
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.monotonic())
+            wait = remaining if wait is None else min(wait, remaining)
+        return wait
+
+    def _give_up(self, ticket: _Ticket, deadline: Optional[float], cancel_token: Optional[CancelToken]) -> bool:
+        """
+        未拿到许可时检查是否应放弃排队：已取消抛出 LLMCancelled，超时抛出 LLMQueueTimeout；
+        返回True表示放弃前刚好拿到了许可（超时的情况下照常使用）
+        """
+        cancelled = cancel_token is not None and cancel_token.cancelled
+        if not cancelled and (deadline is None or time.monotonic() < deadline):
+            return False
+        with self._lock:
+            granted = not self._cancel(ticket)
+            if not granted:
+                counter = self._cancelled if cancelled else self._timeouts
+                counter[ticket.priority] += 1
+        if granted and not cancelled:
+            return True
+        if granted:
+            self.release(ticket)
+        if cancelled:
+            raise LLMCancelled(f"LLM请求在排队时被取消（优先级 {ticket.priority}）")
+        raise LLMQueueTimeout(f"LLM请求排队超过{ticket.timeout}秒（优先级 {ticket.priority}）")
+
+    def acquire(self, priority: str = PRIORITY_INTERACTIVE, tokens: int = 0, timeout: float = None,
+                cancel_token: CancelToken = None) -> _Ticket:
+        """阻塞直到拿到许可；超时抛出 LLMQueueTimeout，被取消时移出队列并抛出 LLMCancelled"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            ticket = _Ticket(priority, next(self._seq), tokens)
+            ticket.timeout = timeout
+            self._enqueue(ticket)
+        remove = cancel_token.add_callback(ticket._wake) if cancel_token is not None else None
+        try:
+            while True:
+                ticket._event.wait(self._next_wait(deadline, cancel_token))
+                if ticket.granted or self._give_up(ticket, deadline, cancel_token):
+                    return ticket
+        finally:
+            if remove is not None:
+                remove()
+
+    async def aacquire(self, priority: str = PRIORITY_INTERACTIVE, tokens: int = 0, timeout: float = None,
+                       cancel_token: CancelToken = None) -> _Ticket:
+        """acquire 的异步版本，排队时不占用线程"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            ticket = _Ticket(priority, next(self._seq), tokens, loop=asyncio.get_running_loop())
+            ticket.timeout = timeout
+            self._enqueue(ticket)
+        remove = cancel_token.add_callback(ticket._wake) if cancel_token is not None else None
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(asyncio.shield(ticket._future), self._next_wait(deadline, cancel_token))
+                except asyncio.TimeoutError:
+                    pass
+                if ticket.granted or self._give_up(ticket, deadline, cancel_token):
+                    return ticket
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = not self._cancel(ticket)
+                if not granted:
+                    self._cancelled[priority] += 1
+            if granted:
+                self.release(ticket)
+            raise
+        finally:
+            if remove is not None:
+                remove()
+
+    def release(self, ticket: _Ticket, used_tokens: int = None):
+        """归还许可；给出实际token用量时修正预估的token预算"""
+        with self._lock:
+            self.in_flight -= 1
+            if ticket.slot is not None:
+                self._slots.release(ticket.slot)
+                ticket.slot = None
+            if used_tokens is not None:
+                self._refund(0, ticket.tokens - used_tokens)
+            self._dispatch()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "queues": {
+                    p: {
+                        "queued": self._queued[p],
+                        "max_queued": self._max_queued[p],
+                        "granted": self._granted[p],
+                        "timeouts": self._timeouts[p],
+                        "cancelled": self._cancelled[p],
+                        "wait_ms": self._wait_ms[p].snapshot(),
+                    }
+                    for p in PRIORITIES
+                },
+            }
+
+
+def get_scheduler() -> LLMScheduler:
+    """进程内共享的LLM调度器"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler(
+                max_concurrency=PERFORMANCE_CONFIG["llm_max_concurrency"],
+                requests_per_minute=PERFORMANCE_CONFIG["llm_requests_per_minute"],
+                tokens_per_minute=PERFORMANCE_CONFIG["llm_tokens_per_minute"],
+                shared_dir=PERFORMANCE_CONFIG["llm_scheduler_dir"],
+                queue_timeout=PERFORMANCE_CONFIG["llm_queue_timeout_seconds"],
+            )
+        return _scheduler
+
+
+def _used_tokens(chunks_usage: Optional[Dict]) -> Optional[int]:
+    return chunks_usage.get("total_tokens") if chunks_usage else None
+
+
+class ScheduledChatModel(Runnable):
+    """
+    调用前在调度器中排队的聊天模型包装，接口与被包装的模型一致（invoke/stream/ainvoke/astream）。
+    包在响应缓存之内，缓存命中不占用预算；cancel_token 参数用于取消排队，并（换成本次调用的子令牌）
+    继续传给被包装的模型，取消后许可要等遗留的读取线程结束才释放
+    """
+
+    def __init__(self, llm, priority: str = PRIORITY_INTERACTIVE, scheduler: LLMScheduler = None):
+        self.llm = llm
+        self.priority = priority
+        self._scheduler = scheduler
+
+    @property
+    def scheduler(self) -> LLMScheduler:
+        return self._scheduler or get_scheduler()
+
+    @property
+    def model_name(self):
+        return getattr(self.llm, "model_name", type(self.llm).__name__)
+
+    @property
+    def temperature(self):
+        return getattr(self.llm, "temperature", None)
+
+    @property
+    def max_tokens(self):
+        return getattr(self.llm, "max_tokens", None)
+
+    @property
+    def cache_identities(self):
+        """被包装的是路由器时，各后端的模型参数（供响应缓存查找）"""
+        return getattr(self.llm, "cache_identities", None)
+
+    def _request(self, input):
+        """(优先级, 预估token数)：prompt 的token数 + 最大输出长度"""
+        prompt = input if isinstance(input, str) else input.to_string() if hasattr(input, "to_string") else str(input)
+        return _current_priority.get() or self.priority, count_tokens(prompt) + (self.max_tokens or 0)
+
+    @staticmethod
+    def _call_kwargs(kwargs):
+        """每次调用用一个子令牌：取消随调用方的令牌传播，同时收集本次调用遗留的后台读取线程"""
+        cancel_token = kwargs.get("cancel_token")
+        if cancel_token is None:
+            return kwargs, None
+        call_token = CancelToken(parent=cancel_token)
+        return {**kwargs, "cancel_token": call_token}, call_token
+
+    @staticmethod
+    def _release(scheduler: LLMScheduler, ticket: _Ticket, used_tokens: Optional[int], call_token: Optional[CancelToken]):
+        """
+        释放许可；本次调用被取消后仍有读取线程在等首个块（连接还开着）时，等线程结束再释放，
+        避免提前归还许可导致实际并发超过上限
+        """
+        threads = call_token.background_threads() if call_token is not None else []
+        if not threads:
+            scheduler.release(ticket, used_tokens)
+            return
+
+        def release_later():
+            for thread in threads:
+                thread.join()
+            scheduler.release(ticket, used_tokens)
+
+        threading.Thread(target=release_later, name="llm-permit-release", daemon=True).start()
+
+    def stream(self, input, config=None, **kwargs):
+        scheduler = self.scheduler
+        kwargs, call_token = self._call_kwargs(kwargs)
+        ticket = scheduler.acquire(*self._request(input), cancel_token=call_token)
+        usage = None
+        try:
+            for chunk in self.llm.stream(input, config, **kwargs):
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        finally:
+            self._release(scheduler, ticket, _used_tokens(usage), call_token)
+
+    def invoke(self, input, config=None, **kwargs):
+        scheduler = self.scheduler
+        kwargs, call_token = self._call_kwargs(kwargs)
+        ticket = scheduler.acquire(*self._request(input), cancel_token=call_token)
+        result = None
+        try:
+            result = self.llm.invoke(input, config, **kwargs)
+            return result
+        finally:
+            self._release(scheduler, ticket, _used_tokens(getattr(result, "usage_metadata", None)), call_token)
+
+    async def astream(self, input, config=None, **kwargs):
+        scheduler = self.scheduler
+        kwargs, call_token = self._call_kwargs(kwargs)
+        ticket = await scheduler.aacquire(*self._request(input), cancel_token=call_token)
+        usage = None
+        try:
+            async for chunk in self.llm.astream(input, config, **kwargs):
+                usage = getattr(chunk, "usage_metadata", None) or usage
+                yield chunk
+        finally:
+            self._release(scheduler, ticket, _used_tokens(usage), call_token)
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        scheduler = self.scheduler
+        kwargs, call_token = self._call_kwargs(kwargs)
+        ticket = await scheduler.aacquire(*self._request(input), cancel_token=call_token)
+        result = None
+        try:
+            result = await self.llm.ainvoke(input, config, **kwargs)
+            return result
+        finally:
+            self._release(scheduler, ticket, _used_tokens(getattr(result, "usage_metadata", None)), call_token)
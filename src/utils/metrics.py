@@ -0,0 +1,206 @@
+"""
+轻量级指标模块 - 直方图统计，供性能监控和调参使用
+"""
+import asyncio
+import bisect
+import threading
+import time
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+from src.utils.cancellation import LLMCancelled
+
+# 默认延迟分桶（毫秒）
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+# LLM生成总耗时分桶（毫秒）
+GENERATION_BUCKETS_MS = (100, 200, 500, 1000, 2000, 3000, 5000, 10000, 20000, 30000, 60000)
+
+# 流式生成指标：名称 -> {"ttft_ms": 首token延迟, "total_ms": 总生成耗时,
+#                      "ttft_ms_cache_hit"/"ttft_ms_cache_miss": 按服务端上下文缓存是否命中分开的首token延迟}
+_stream_metrics: Dict[str, Dict[str, "Histogram"]] = {}
+_stream_metrics_lock = threading.Lock()
+# LLM用量累计：名称 -> {"calls", "input_tokens", "cached_tokens", "output_tokens"}
+_llm_usage: Dict[str, Dict[str, int]] = {}
+# 流式生成结果计数：名称 -> {"completed", "cancelled", "failed"}
+_stream_outcomes: Dict[str, Dict[str, int]] = {}
+
+
+class Histogram:
+    """
+    分桶直方图，同时保留最近 window 个样本用于计算分位数（线程安全）
+    """
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS_MS, window: int = 2048):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.total += value
+            self._recent.append(value)
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            if not self._recent:
+                return 0.0
+            return float(np.percentile(list(self._recent), q))
+
+    def snapshot(self) -> Dict:
+        """导出统计结果，buckets 为 {"<=上界": 次数}"""
+        with self._lock:
+            recent = list(self._recent)
+            counts = list(self.counts)
+            count, total = self.count, self.total
+        labels: List[str] = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+        result = {
+            "count": count,
+            "mean": total / count if count else 0.0,
+            "buckets": dict(zip(labels, counts)),
+        }
+        for q in (50, 95, 99):
+            result[f"p{q}"] = float(np.percentile(recent, q)) if recent else 0.0
+        return result
+
+
+def _get_stream_histograms(name: str) -> Dict[str, Histogram]:
+    with _stream_metrics_lock:
+        if name not in _stream_metrics:
+            _stream_metrics[name] = {
+                key: Histogram(buckets=GENERATION_BUCKETS_MS)
+                for key in ("ttft_ms", "total_ms", "ttft_ms_cache_hit", "ttft_ms_cache_miss")
+            }
+        return _stream_metrics[name]
+
+
+def record_usage(name: str, usage_metadata: Optional[Dict]) -> Dict:
+    """
+    累计一次LLM调用的token用量（LangChain的 usage_metadata），返回本次的
+    input_tokens / cached_tokens（服务端上下文缓存命中的输入token）/ output_tokens
+    """
+    if not usage_metadata:
+        return {}
+    usage = {
+        "input_tokens": usage_metadata.get("input_tokens") or 0,
+        "cached_tokens": (usage_metadata.get("input_token_details") or {}).get("cache_read") or 0,
+        "output_tokens": usage_metadata.get("output_tokens") or 0,
+    }
+    with _stream_metrics_lock:
+        totals = _llm_usage.setdefault(name, {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "output_tokens": 0})
+        totals["calls"] += 1
+        for key, value in usage.items():
+            totals[key] += value
+    return usage
+
+
+def get_llm_usage_stats() -> Dict[str, Dict]:
+    """各类LLM调用的累计token用量与上下文缓存命中率（缓存命中的输入token / 全部输入token）"""
+    with _stream_metrics_lock:
+        items = [(name, dict(totals)) for name, totals in _llm_usage.items()]
+    for _, totals in items:
+        totals["cache_hit_rate"] = totals["cached_tokens"] / totals["input_tokens"] if totals["input_tokens"] else 0.0
+    return dict(items)
+
+
+class _StreamTimer:
+    """记录一次流式生成的首token延迟、总耗时和token用量"""
+
+    def __init__(self, name: str, timing: Optional[Dict], start: Optional[float]):
+        self.name = name
+        self.histograms = _get_stream_histograms(name)
+        self.timing = {} if timing is None else timing
+        self.start = time.perf_counter() if start is None else start
+        self.count = 0
+        self.usage = None
+
+    def text(self, chunk) -> str:
+        # 用量在最后一个（内容为空的）消息块中返回
+        usage = getattr(chunk, "usage_metadata", None)
+        if usage:
+            self.usage = usage
+        text = chunk if isinstance(chunk, str) else getattr(chunk, "content", "")
+        if text and self.count == 0:
+            self.timing["ttft_ms"] = (time.perf_counter() - self.start) * 1000
+            self.histograms["ttft_ms"].observe(self.timing["ttft_ms"])
+        if text:
+            self.count += 1
+        return text
+
+    def finish(self):
+        self.timing["total_ms"] = (time.perf_counter() - self.start) * 1000
+        self.timing["chunks"] = self.count
+        self.histograms["total_ms"].observe(self.timing["total_ms"])
+        if self.usage:
+            self.timing.update(record_usage(self.name, self.usage))
+            if "ttft_ms" in self.timing:
+                key = "ttft_ms_cache_hit" if self.timing["cached_tokens"] else "ttft_ms_cache_miss"
+                self.histograms[key].observe(self.timing["ttft_ms"])
+
+
+def _record_outcome(name: str, outcome: str):
+    with _stream_metrics_lock:
+        counts = _stream_outcomes.setdefault(name, {"completed": 0, "cancelled": 0, "failed": 0})
+        counts[outcome] += 1
+
+
+def _outcome_of(error: BaseException) -> str:
+    """被取消（LLMCancelled、任务取消）或调用方中途停止读取（GeneratorExit）计为取消，其余异常计为失败"""
+    return "cancelled" if isinstance(error, (LLMCancelled, GeneratorExit, asyncio.CancelledError)) else "failed"
+
+
+def timed_stream(chunks: Iterable, name: str, timing: Optional[Dict] = None,
+                 start: Optional[float] = None) -> Iterator[str]:
+    """
+    逐块产出LLM流式输出的文本，并记录首token延迟和总生成耗时。
+    chunks 可以是消息块（取 .content）或字符串；start 为计时起点（默认开始迭代时），
+    调用方在检索等前置步骤之前取 time.perf_counter() 传入，使首token延迟反映用户实际等待的时间。
+    结果写入 timing（ttft_ms、total_ms、chunks，有用量时还有 input_tokens、cached_tokens、output_tokens），
+    并汇总到 get_stream_stats() 和 get_llm_usage_stats()；完成、取消、失败次数见 get_stream_outcomes()
+    """
+    timer = _StreamTimer(name, timing, start)
+    try:
+        for chunk in chunks:
+            text = timer.text(chunk)
+            if text:
+                yield text
+    except BaseException as e:
+        _record_outcome(name, _outcome_of(e))
+        raise
+    timer.finish()
+    _record_outcome(name, "completed")
+
+
+async def atimed_stream(chunks: AsyncIterable, name: str, timing: Optional[Dict] = None,
+                        start: Optional[float] = None) -> AsyncIterator[str]:
+    """timed_stream 的异步版本，chunks 为 LLM.astream() 等异步迭代器"""
+    timer = _StreamTimer(name, timing, start)
+    try:
+        async for chunk in chunks:
+            text = timer.text(chunk)
+            if text:
+                yield text
+    except BaseException as e:
+        _record_outcome(name, _outcome_of(e))
+        raise
+    timer.finish()
+    _record_outcome(name, "completed")
+
+
+def get_stream_outcomes() -> Dict[str, Dict[str, int]]:
+    """各流式生成的完成、取消、失败次数"""
+    with _stream_metrics_lock:
+        return {name: dict(counts) for name, counts in _stream_outcomes.items()}
+
+
+def get_stream_stats() -> Dict[str, Dict]:
+    """各流式生成的首token延迟与总耗时统计"""
+    with _stream_metrics_lock:
+        items = list(_stream_metrics.items())
+    return {name: {key: h.snapshot() for key, h in histograms.items()} for name, histograms in items}
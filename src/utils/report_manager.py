@@ -1,106 +1,273 @@
 import os
 import json
+import tempfile
+import threading
+from contextlib import contextmanager
 import pandas as pd
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import streamlit as st
 
+from src.data_models.models import SCORE_LABELS, EvaluationReport
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只做进程内互斥
+    fcntl = None
+
+# 回填时每批写回的报告数
+BACKFILL_BATCH_SIZE = 200
+
 class ReportManager:
-    """报告管理器，负责保存、加载和管理复盘报告"""
-    
+    """
+    报告管理器，负责保存、加载和管理复盘报告
+
+    每个报告保存为一个JSON文件（含完整报告和对话记录），另外在 index.json 中保存所有报告的
+    概要和数值评分，报告列表、评分汇总和导出直接读索引，不需要打开每个报告文件。
+    Streamlit、回填和批量评估可能在不同进程中同时写，索引的读-改-写和报告文件的改写
+    都在 index.lock 文件锁内进行
+    """
+
     def __init__(self, reports_dir: str = "data/reports"):
         self.reports_dir = reports_dir
+        self.index_path = os.path.join(reports_dir, "index.json")
+        self.lock_path = os.path.join(reports_dir, "index.lock")
+        self._lock = threading.Lock()
+        self._index = None
+        self._index_mtime = None
         self.ensure_reports_directory()
-    
+
     def ensure_reports_directory(self):
         """确保报告目录存在"""
         if not os.path.exists(self.reports_dir):
             os.makedirs(self.reports_dir)
-    
-    def save_report(self, report_content: str, persona: str, conversation_history: List[Dict]) -> str:
+
+    def _report_path(self, report_id: str) -> str:
+        return os.path.join(self.reports_dir, f"report_{report_id}.json")
+
+    @staticmethod
+    def _summary(report_data: Dict) -> Dict:
+        """索引中保存的概要信息"""
+        return {
+            "id": report_data["id"],
+            "timestamp": report_data["timestamp"],
+            "persona": report_data["persona"],
+            "conversation_length": report_data.get("conversation_length", 0),
+            "scores": report_data.get("scores"),
+        }
+
+    def _write_json(self, path: str, data):
+        # 先写唯一的临时文件再替换，中断时不会留下半个文件，多个进程同时写也不会互相覆盖临时文件
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=os.path.basename(path) + ".",
+                                        suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def _index_lock(self):
+        """索引和报告文件改写的互斥（跨线程、跨进程）"""
+        with self._lock, open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load_index(self) -> Dict[str, Dict]:
         """
-        保存复盘报告
+        读取索引（调用方持有 _index_lock）：文件被其他进程（如回填、批量评估）改过时重新读取，
+        索引不存在或损坏时从报告文件重建
+        """
+        try:
+            mtime = os.path.getmtime(self.index_path)
+        except OSError:
+            mtime = None
+        if self._index is None or mtime != self._index_mtime:
+            try:
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = self._build_index()
+                self._write_json(self.index_path, self._index)
+            self._index_mtime = os.path.getmtime(self.index_path)
+        return self._index
+
+    def _build_index(self) -> Dict[str, Dict]:
+        index = {}
+        if not os.path.exists(self.reports_dir):
+            return index
+        for filename in os.listdir(self.reports_dir):
+            if filename.startswith("report_") and filename.endswith(".json"):
+                filepath = os.path.join(self.reports_dir, filename)
+                try:
+                    with open(filepath, 'r', encoding='utf-8') as f:
+                        report_data = json.load(f)
+                    index[report_data["id"]] = self._summary(report_data)
+                except Exception as e:
+                    print(f"读取报告文件 {filename} 时出错: {e}")
+        return index
+
+    def rebuild_index(self):
+        """从报告文件重建索引（手动增删报告文件后调用）"""
+        with self._index_lock():
+            self._index = self._build_index()
+            self._write_json(self.index_path, self._index)
+            self._index_mtime = os.path.getmtime(self.index_path)
+
+    def _update_index(self, updated: List[Dict] = (), removed_id: str = None):
+        """合并改动后写回索引（调用方持有 _index_lock）；先从文件重新读取，不丢失其他进程的改动"""
+        self._index = None
+        index = self._load_index()
+        for report_data in updated:
+            index[report_data["id"]] = self._summary(report_data)
+        if removed_id is not None:
+            index.pop(removed_id, None)
+        self._write_json(self.index_path, index)
+        self._index_mtime = os.path.getmtime(self.index_path)
+
+    def save_report(self, report_content: str, persona: str, conversation_history: List[Dict],
+                    evaluation: Optional[EvaluationReport] = None) -> str:
+        """
+        保存复盘报告，evaluation 为结构化评估（评分作为数值字段保存）
         返回报告ID
         """
         timestamp = datetime.now()
         report_id = timestamp.strftime("%Y%m%d_%H%M%S")
-        
+
         report_data = {
             "id": report_id,
             "timestamp": timestamp.isoformat(),
             "persona": persona,
             "report_content": report_content,
+            "scores": evaluation.scores() if evaluation else None,
+            "strengths": evaluation.strengths if evaluation else [],
+            "suggestions": evaluation.suggestions if evaluation else [],
             "conversation_history": conversation_history,
             "conversation_length": len(conversation_history)
         }
-        
+
         # 保存为JSON文件
-        filename = f"report_{report_id}.json"
-        filepath = os.path.join(self.reports_dir, filename)
-        
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(report_data, f, ensure_ascii=False, indent=2)
-        
+        with self._index_lock():
+            self._write_json(self._report_path(report_id), report_data)
+            self._update_index([report_data])
+
         return report_id
-    
+
+    def update_evaluation(self, report_id: str, evaluation: EvaluationReport,
+                          report_content: Optional[str] = None) -> bool:
+        """更新已有报告的结构化评估（回填或重新评估），report_content 为空时保留原报告正文"""
+        return self.update_evaluations([(report_id, evaluation, report_content)]) == 1
+
+    def update_evaluations(self, updates: List[Tuple[str, EvaluationReport, Optional[str]]]) -> int:
+        """
+        批量更新报告的结构化评估：逐个改写报告文件，索引只写一次（批量评估用），
+        updates 为 (报告ID, 评估, 新正文或None) 列表，返回更新的报告数
+        """
+        updated = []
+        # 在锁内读改写报告文件，不会把同时被删除的报告写回来
+        with self._index_lock():
+            for report_id, evaluation, report_content in updates:
+                report_data = self.load_report(report_id)
+                if report_data is None:
+                    continue
+                report_data["scores"] = evaluation.scores()
+                report_data["strengths"] = evaluation.strengths
+                report_data["suggestions"] = evaluation.suggestions
+                if report_content is not None:
+                    report_data["report_content"] = report_content
+                self._write_json(self._report_path(report_id), report_data)
+                updated.append(report_data)
+            if updated:
+                self._update_index(updated)
+        return len(updated)
+
     def load_report(self, report_id: str) -> Optional[Dict]:
-        """加载指定的报告"""
-        filename = f"report_{report_id}.json"
-        filepath = os.path.join(self.reports_dir, filename)
-        
+        """加载指定的报告，读取失败时打印错误并返回None（回填和批量评估在命令行中也会调用，不使用streamlit提示）"""
+        filepath = self._report_path(report_id)
+
         if not os.path.exists(filepath):
             return None
-        
+
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 return json.load(f)
         except Exception as e:
-            st.error(f"加载报告失败: {e}")
+            print(f"加载报告 {report_id} 失败: {e}")
             return None
-    
+
     def get_all_reports(self) -> List[Dict]:
-        """获取所有报告的概要信息"""
-        reports = []
-        
-        if not os.path.exists(self.reports_dir):
-            return reports
-        
-        for filename in os.listdir(self.reports_dir):
-            if filename.startswith("report_") and filename.endswith(".json"):
-                filepath = os.path.join(self.reports_dir, filename)
-                try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        report_data = json.load(f)
-                        # 只保留概要信息
-                        summary = {
-                            "id": report_data["id"],
-                            "timestamp": report_data["timestamp"],
-                            "persona": report_data["persona"],
-                            "conversation_length": report_data.get("conversation_length", 0),
-                            "date_formatted": datetime.fromisoformat(report_data["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
-                        }
-                        reports.append(summary)
-                except Exception as e:
-                    st.warning(f"读取报告文件 {filename} 时出错: {e}")
-        
+        """获取所有报告的概要信息（含评分，来自索引）"""
+        with self._index_lock():
+            index = self._load_index()
+            reports = [dict(summary) for summary in index.values()]
+
+        for summary in reports:
+            summary["date_formatted"] = datetime.fromisoformat(summary["timestamp"]).strftime("%Y-%m-%d %H:%M:%S")
+
         # 按时间戳倒序排列
         reports.sort(key=lambda x: x["timestamp"], reverse=True)
         return reports
-    
+
+    def get_score_table(self) -> pd.DataFrame:
+        """所有已评分报告的评分表（每行一个报告，列为客户类型和各项评分），用于仪表盘汇总"""
+        rows = [
+            {"id": r["id"], "timestamp": r["timestamp"], "persona": r["persona"], **r["scores"]}
+            for r in self.get_all_reports() if r.get("scores")
+        ]
+        return pd.DataFrame(rows, columns=["id", "timestamp", "persona", *SCORE_LABELS])
+
     def delete_report(self, report_id: str) -> bool:
         """删除报告"""
-        filename = f"report_{report_id}.json"
-        filepath = os.path.join(self.reports_dir, filename)
-        
+        filepath = self._report_path(report_id)
+
         try:
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                return True
+            with self._index_lock():
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                    self._update_index(removed_id=report_id)
+                    return True
             return False
         except Exception as e:
             st.error(f"删除报告失败: {e}")
             return False
-    
+
+    def backfill_scores(self) -> Dict[str, int]:
+        """
+        一次性回填：解析没有评分字段的旧报告（Markdown正文）并保存评分，
+        返回 {"updated": 回填数, "skipped": 已有评分数, "failed": 无法解析数}
+        """
+        from src.chains.evaluation_chain import EvaluationParseError, parse_markdown_report
+
+        self.rebuild_index()
+        result = {"updated": 0, "skipped": 0, "failed": 0}
+        updates = []
+        for summary in self.get_all_reports():
+            if summary.get("scores"):
+                result["skipped"] += 1
+                continue
+            report_data = self.load_report(summary["id"]) or {}
+            try:
+                evaluation = parse_markdown_report(report_data.get("report_content", ""))
+            except EvaluationParseError as e:
+                print(f"报告 {summary['id']} 无法解析: {e}")
+                result["failed"] += 1
+                continue
+            updates.append((summary["id"], evaluation, None))
+            # 分批写回：每批只写一次索引，也不会长时间占着锁
+            if len(updates) >= BACKFILL_BATCH_SIZE:
+                result["updated"] += self.update_evaluations(updates)
+                updates = []
+        result["updated"] += self.update_evaluations(updates)
+        return result
+
     def export_report_to_markdown(self, report_data: Dict) -> str:
         """将报告导出为Markdown格式"""
         md_content = f"""# 销售模拟复盘报告
@@ -116,40 +283,49 @@ class ReportManager:
 
 ## 完整对话记录
 """
-        
+
         for i, message in enumerate(report_data['conversation_history'], 1):
             role = "销售" if message['role'] == 'salesperson' else "客户"
             md_content += f"\n**{i}. {role}**: {message['content']}\n"
-        
+
         return md_content
-    
+
     def export_reports_to_excel(self, report_ids: List[str]) -> bytes:
         """将多个报告导出为Excel文件"""
         reports_data = []
-        
+
         for report_id in report_ids:
             report_data = self.load_report(report_id)
             if report_data:
-                # 提取报告中的评分信息（这里需要解析报告内容）
                 summary_data = {
                     "报告ID": report_data['id'],
                     "生成时间": datetime.fromisoformat(report_data['timestamp']).strftime('%Y-%m-%d %H:%M:%S'),
                     "客户类型": report_data['persona'],
                     "对话轮数": report_data.get('conversation_length', 0),
-                    "完整报告": report_data['report_content']
                 }
+                # 评分直接取保存的数值字段（旧报告可先运行回填）
+                scores = report_data.get("scores") or {}
+                for name, label in SCORE_LABELS.items():
+                    summary_data[label] = scores.get(name)
+                summary_data["优点"] = "\n".join(report_data.get("strengths", []))
+                summary_data["改进建议"] = "\n".join(report_data.get("suggestions", []))
+                summary_data["完整报告"] = report_data['report_content']
                 reports_data.append(summary_data)
-        
+
         # 创建Excel文件
         df = pd.DataFrame(reports_data)
-        
+
         # 使用BytesIO来在内存中创建Excel文件
         from io import BytesIO
         output = BytesIO()
         with pd.ExcelWriter(output, engine='openpyxl') as writer:
             df.to_excel(writer, sheet_name='复盘报告', index=False)
-        
+
         return output.getvalue()
 
 # 全局报告管理器实例
-report_manager = ReportManager() 
\ No newline at end of file
+report_manager = ReportManager()
+
+if __name__ == "__main__":
+    # 一次性回填旧报告的评分：python -m src.utils.report_manager
+    print(f"回填完成: {report_manager.backfill_scores()}")
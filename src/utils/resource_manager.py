@@ -0,0 +1,116 @@
+"""
+资源管理模块 - 重量级资源（BERT模型、向量索引等）的单飞加载与后台预热
+"""
+import time
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+
+
+class _Resource:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "pending"  # pending / loading / ready / failed
+        self.future: Optional[Future] = None
+        self.load_seconds: Optional[float] = None
+        self.loaded_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+
+class ResourceManager:
+    """
+    资源加载协调器：
+    - 同一资源同时只有一个线程在加载，其余调用方等待同一次加载的结果
+    - warm_up() 在后台线程中预热资源，UI 可通过 status() 展示就绪状态而不阻塞对话
+    加载结果由调用方自行缓存（loader 应当是幂等的）
+    """
+
+    def __init__(self):
+        self._resources: Dict[str, _Resource] = {}
+        self._lock = threading.Lock()
+        self._warm_up_thread: Optional[threading.Thread] = None
+
+    def load(self, name: str, loader: Callable[[], object], wait: bool = True):
+        """
+        加载资源。已有加载在进行时：wait=True 等待其结果，wait=False 立即返回None
+        """
+        with self._lock:
+            resource = self._resources.setdefault(name, _Resource(name))
+            in_flight = resource.future is not None and not resource.future.done()
+            if in_flight:
+                future = resource.future
+            else:
+                future = resource.future = Future()
+                first_load = resource.state != "ready"
+                resource.state = "loading"
+                resource.error = None
+
+        if in_flight:
+            return future.result() if wait else None
+
+        start = time.time()
+        try:
+            value = loader()
+        except BaseException as e:
+            with self._lock:
+                resource.state = "failed"
+                resource.error = str(e)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            resource.state = "ready"
+            resource.loaded_at = time.time()
+            if first_load:
+                resource.load_seconds = resource.loaded_at - start
+        future.set_result(value)
+        return value
+
+    def is_loading(self, name: str) -> bool:
+        with self._lock:
+            resource = self._resources.get(name)
+            return resource is not None and resource.state == "loading"
+
+    def reset(self, name: str):
+        """资源被调用方释放后重置状态（如向量存储重建）"""
+        with self._lock:
+            resource = self._resources.get(name)
+            if resource is not None and resource.state != "loading":
+                resource.state = "pending"
+
+    def warm_up(self, loaders: Dict[str, Callable[[], object]]) -> bool:
+        """
+        在后台线程中依次预热资源，只启动一次；返回本次是否启动了预热
+        """
+        with self._lock:
+            if self._warm_up_thread is not None:
+                return False
+            for name in loaders:
+                self._resources.setdefault(name, _Resource(name))
+
+            def run():
+                for name, loader in loaders.items():
+                    try:
+                        self.load(name, loader)
+                    except Exception as e:
+                        print(f"预热资源 {name} 失败: {e}")
+
+            self._warm_up_thread = threading.Thread(target=run, name="resource-warm-up", daemon=True)
+            self._warm_up_thread.start()
+            return True
+
+    def status(self) -> Dict[str, Dict]:
+        """各资源的状态、加载耗时和错误信息"""
+        with self._lock:
+            return {
+                name: {
+                    "state": r.state,
+                    "load_seconds": r.load_seconds,
+                    "loaded_at": r.loaded_at,
+                    "error": r.error,
+                }
+                for name, r in self._resources.items()
+            }
+
+    def all_ready(self) -> bool:
+        with self._lock:
+            return all(r.state == "ready" for r in self._resources.values())
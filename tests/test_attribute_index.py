@@ -0,0 +1,33 @@
+import pandas as pd
+
+from src.rag.attribute_index import AttributeIndex, parse_filters
+from src.rag.keyword_index import KeywordIndex
+
+
+def _products():
+    return pd.read_csv("data/product_knowledge.csv")
+
+
+def test_parse_filters_string_and_tuples_agree():
+    parsed = parse_filters("price_yuan<=8000, series in {星动系列, 玲珑系列}")
+    assert parsed == parse_filters([("series", "in", ["玲珑系列", "星动系列"]), ("price_yuan", "<=", 8000)])
+
+
+def test_mask_combines_range_and_category_conditions():
+    df = _products()
+    index = AttributeIndex.from_dataframe(df)
+
+    mask = index.mask("price_yuan<=9200, series in {星动系列, 玲珑系列}")
+    assert sorted(df["id"][mask]) == [2, 3]
+    assert sorted(df["id"][index.mask("weight_g>28")]) == [5]
+    assert sorted(df["id"][index.mask("designer=周大师")]) == [4]
+    assert index.mask(None) is None
+
+
+def test_keyword_search_is_prefiltered():
+    df = _products()
+    keyword_index = KeywordIndex.from_dataframe(df)
+    allowed = AttributeIndex.from_dataframe(df).mask("price_yuan<=8000")
+
+    results = keyword_index.search("福运转运珠手镯", k=2, allowed=allowed)
+    assert [keyword_index.doc_ids[i] for i, _ in results] == [3]
@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import src.chains.batch_evaluation as batch_evaluation
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from src.chains.batch_evaluation import BatchEvaluator, Checkpoint
+from src.data_models.models import EvaluationReport
+from src.utils.cancellation import CancelToken
+from src.utils.llm_client import ResilientChatModel, create_chat_model
+from src.utils.report_manager import ReportManager
+
+REPORT = EvaluationReport(
+    comprehensive_score=8,
+    demand_mining_score=8,
+    product_recommendation_score=7,
+    objection_handling_score=9,
+    trust_building_score=8,
+    closing_score=7,
+    strengths=["耐心解答价格问题"],
+    suggestions=["更早提出试戴"],
+)
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer(reply=REPORT.model_dump_json(), ttft_ms=20, chunk_ms=1) as server:
+        yield server
+
+
+def _llm(server):
+    llm = create_chat_model("fake-model", "sk-test", server.base_url, streaming=True)
+    return ResilientChatModel(llm, max_retries=0, hedging=False)
+
+
+def _write_reports(reports_dir, count):
+    for i in range(count):
+        report_id = f"20240101_{i:06d}"
+        data = {"id": report_id, "timestamp": f"2024-01-01T00:00:{i % 60:02d}", "persona": "预算敏感型",
+                "report_content": "旧报告", "conversation_history": [
+                    {"role": "salesperson", "content": f"第{i}位客户您好"},
+                    {"role": "customer", "content": "这个多少钱？"}]}
+        (reports_dir / f"report_{report_id}.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+
+def _run(evaluator, **kwargs):
+    return asyncio.run(evaluator.run(**kwargs))
+
+
+def test_batch_resumes_from_checkpoint(tmp_path, server):
+    _write_reports(tmp_path, 12)
+    manager = ReportManager(str(tmp_path))
+
+    first = BatchEvaluator(manager, concurrency=3, flush_every=2, llm=_llm(server))
+    assert _run(first, limit=5)["completed"] == 5
+    second = _run(BatchEvaluator(manager, concurrency=3, flush_every=2, llm=_llm(server)))
+    assert second["skipped"] == 5 and second["completed"] == 7
+    assert server.requests == 12
+    assert _run(BatchEvaluator(manager, concurrency=3, llm=_llm(server)))["submitted"] == 0
+
+    scores = manager.get_score_table()
+    assert len(scores) == 12 and (scores["objection_handling_score"] == 9).all()
+    assert "耐心解答价格问题" in manager.load_report("20240101_000003")["report_content"]
+
+
+def test_failures_are_recorded_and_retried(tmp_path, server):
+    _write_reports(tmp_path, 3)
+    broken = tmp_path / "report_20240101_000001.json"
+    data = json.loads(broken.read_text(encoding="utf-8"))
+    broken.write_text(json.dumps({**data, "conversation_history": None}), encoding="utf-8")
+    manager = ReportManager(str(tmp_path))
+
+    evaluator = BatchEvaluator(manager, concurrency=2, llm=_llm(server))
+    stats = _run(evaluator)
+    assert stats["completed"] == 2 and stats["failed"] == 1
+    with open(evaluator.checkpoint_path, encoding="utf-8") as f:
+        statuses = {entry["id"]: entry["status"] for entry in map(json.loads, f)}
+    assert statuses["20240101_000001"] == "failed"
+
+    broken.write_text(json.dumps(data), encoding="utf-8")
+    assert _run(BatchEvaluator(manager, concurrency=2, llm=_llm(server)))["completed"] == 1
+
+
+def test_unreadable_report_is_logged_not_shown_through_streamlit(tmp_path, server, capsys, caplog):
+    _write_reports(tmp_path, 2)
+    (tmp_path / "report_20240101_000000.json").write_text("{不是JSON", encoding="utf-8")
+    stats = _run(BatchEvaluator(ReportManager(str(tmp_path)), concurrency=2, llm=_llm(server)))
+    assert stats["completed"] == 1 and stats["failed"] == 1
+    output = capsys.readouterr()
+    assert "加载报告 20240101_000000 失败" in output.out
+    assert "streamlit" not in output.err.lower()
+    assert not [record for record in caplog.records if record.name.startswith("streamlit")]
+
+
+def test_cancel_stops_in_flight_requests_and_keeps_them_pending(tmp_path, server):
+    _write_reports(tmp_path, 6)
+    manager = ReportManager(str(tmp_path))
+    server.ttft_ms = 2000
+    token = CancelToken()
+    threading.Timer(0.2, token.cancel).start()
+
+    start = time.perf_counter()
+    stats = _run(BatchEvaluator(manager, concurrency=2, llm=_llm(server)), cancel_token=token)
+    assert time.perf_counter() - start < 1.5
+    assert stats["completed"] == 0 and stats["cancelled"] >= 2
+
+    server.ttft_ms = 10
+    assert _run(BatchEvaluator(manager, concurrency=2, llm=_llm(server)))["completed"] == 6
+
+
+def test_checkpoint_is_per_rubric_and_tolerates_torn_line(tmp_path, monkeypatch):
+    manager = ReportManager(str(tmp_path))
+    path = BatchEvaluator(manager).checkpoint_path
+    monkeypatch.setattr(batch_evaluation, "EVALUATION_PROMPT_TEMPLATE", "新的评估标准 {conversation_history}")
+    assert BatchEvaluator(manager).checkpoint_path != path
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"id": "a", "status": "done"}\n{"id": "b", "sta')
+    checkpoint = Checkpoint(path)
+    checkpoint.record([{"id": "c", "status": "done"}])
+    checkpoint.close()
+    reloaded = Checkpoint(path)
+    assert reloaded.done == {"a", "c"}
+    reloaded.close()
+
+
+def test_write_back_failure_aborts_run_and_keeps_results(tmp_path, server, monkeypatch):
+    _write_reports(tmp_path, 12)
+    manager = ReportManager(str(tmp_path))
+
+    def disk_full(updates):
+        raise OSError("磁盘已满")
+
+    monkeypatch.setattr(manager, "update_evaluations", disk_full)
+    evaluator = BatchEvaluator(manager, concurrency=2, flush_every=1, llm=_llm(server))
+    with pytest.raises(OSError, match="磁盘已满"):
+        asyncio.run(asyncio.wait_for(evaluator.run(), timeout=10))
+    # 所有已完成的评估都还在待写列表中，检查点里没有记录
+    assert evaluator.stats["completed"] >= 1
+    assert len(evaluator._pending) == evaluator.stats["completed"]
+    checkpoint = Checkpoint(evaluator.checkpoint_path)
+    assert checkpoint.done == set()
+    checkpoint.close()
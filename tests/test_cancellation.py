@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from src.core.agent_logic import SimpleConversationChain
+from src.memory.conversation_memory import RollingSummaryMemory
+from src.prompts.persona_prompts import PERSONA_PROMPTS
+from src.utils.cancellation import CancelToken, LLMCancelled
+from src.utils.llm_client import ResilientChatModel, create_chat_model
+from src.utils.llm_scheduler import PRIORITY_REPORT, LLMScheduler, ScheduledChatModel
+from src.utils.metrics import get_stream_outcomes
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+def _cancel_later(token, delay):
+    timer = threading.Timer(delay, token.cancel)
+    timer.start()
+    return timer
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer(reply="这款手镯太贵了，有没有便宜点的", ttft_ms=10, chunk_ms=20) as server:
+        yield server
+
+
+def _model(server):
+    llm = create_chat_model("fake-model", "sk-test", server.base_url, streaming=True)
+    return ResilientChatModel(llm, max_retries=2, hedging=False)
+
+
+def test_token_propagates_from_parent_and_condition():
+    parent = CancelToken()
+    child = CancelToken(parent=parent)
+    fired = []
+    child.add_callback(lambda: fired.append("child"))
+    parent.cancel("会话重新开始")
+    assert child.cancelled and fired == ["child"]
+    with pytest.raises(LLMCancelled):
+        child.raise_if_cancelled()
+
+    flag = []
+    conditional = CancelToken(should_cancel=lambda: bool(flag))
+    assert not conditional.wait(0.05)
+    threading.Timer(0.05, flag.append, args=(True,)).start()
+    assert conditional.wait(2)
+
+
+def test_cancelled_request_is_dropped_from_queue():
+    scheduler = LLMScheduler(max_concurrency=1)
+    held = scheduler.acquire()
+    token = CancelToken()
+    _cancel_later(token, 0.05)
+    start = time.perf_counter()
+    with pytest.raises(LLMCancelled):
+        scheduler.acquire(PRIORITY_REPORT, cancel_token=token)
+    assert time.perf_counter() - start < 1
+    queue = scheduler.stats()["queues"][PRIORITY_REPORT]
+    assert queue["queued"] == 0 and queue["cancelled"] == 1
+
+    async def run():
+        async_token = CancelToken()
+        _cancel_later(async_token, 0.05)
+        with pytest.raises(LLMCancelled):
+            await scheduler.aacquire(PRIORITY_REPORT, cancel_token=async_token)
+
+    asyncio.run(run())
+    assert scheduler.stats()["queues"][PRIORITY_REPORT]["cancelled"] == 2
+    scheduler.release(held)
+    scheduler.release(scheduler.acquire(timeout=1))
+
+
+def test_cancel_while_waiting_for_first_token_closes_stream(server):
+    server.ttft_ms = 1000
+    model = _model(server)
+    token = CancelToken()
+    _cancel_later(token, 0.1)
+    start = time.perf_counter()
+    with pytest.raises(LLMCancelled):
+        list(model.stream("你好", cancel_token=token))
+    assert time.perf_counter() - start < 0.5
+    # 后台读取在首个块到达时关闭连接，服务端写入失败
+    _wait_until(lambda: server.disconnected == 1)
+    assert server.requests == 1 and server.completed == 0
+    assert model.stats()["retries"] == 0 and model.stats()["failures"] == 0
+
+
+def test_permit_is_held_until_cancelled_reader_exits(server):
+    server.ttft_ms = 800
+    scheduler = LLMScheduler(max_concurrency=1)
+    model = ScheduledChatModel(_model(server), scheduler=scheduler)
+    token = CancelToken()
+    _cancel_later(token, 0.1)
+    with pytest.raises(LLMCancelled):
+        list(model.stream("你好", cancel_token=token))
+    # 调用方已返回，但连接要到首个块到达时才关闭，期间许可仍被占用
+    assert scheduler.stats()["in_flight"] == 1
+    _wait_until(lambda: scheduler.stats()["in_flight"] == 0)
+    _wait_until(lambda: server.disconnected == 1)
+    assert server.completed == 0
+
+
+def test_async_retry_backoff_is_cancellable(server, monkeypatch):
+    server.fail_first = 1
+    monkeypatch.setattr("src.utils.llm_client.backoff_seconds", lambda attempt: 5.0)
+    model = _model(server)
+
+    async def run():
+        token = CancelToken()
+        _cancel_later(token, 0.2)
+        with pytest.raises(LLMCancelled):
+            async for _ in model.astream("你好", cancel_token=token):
+                pass
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - start < 1
+    assert server.requests == 1
+
+
+def test_async_cancel_mid_stream_closes_connection(server):
+    model = _model(server)
+
+    async def run():
+        token = CancelToken()
+        chunks = []
+        with pytest.raises(LLMCancelled):
+            async for chunk in model.astream("你好", cancel_token=token):
+                chunks.append(chunk.content)
+                if len(chunks) == 2:
+                    token.cancel()
+        # 内层HTTP流由事件循环在随后的迭代中关闭（asyncio.run 结束时会取消尚未执行的关闭任务）
+        await asyncio.sleep(0.2)
+        return chunks
+
+    assert len(asyncio.run(run())) == 2
+    _wait_until(lambda: server.disconnected == 1)
+    assert server.completed == 0
+
+
+def test_cancelled_turn_is_not_written_to_memory(server):
+    memory = RollingSummaryMemory(lambda previous, lines: "摘要", background=False)
+    agent = SimpleConversationChain(_model(server), PERSONA_PROMPTS["预算敏感型 (王女士)"], memory)
+    before = get_stream_outcomes().get("customer_reply", {"completed": 0, "cancelled": 0})
+
+    assert agent.predict("这款多少钱？") == server.reply
+    token = CancelToken()
+    token.cancel()
+    with pytest.raises(LLMCancelled):
+        agent.predict("有优惠吗？", cancel_token=token)
+    assert memory.turns == 1
+
+    outcomes = get_stream_outcomes()["customer_reply"]
+    assert outcomes["completed"] == before["completed"] + 1
+    assert outcomes["cancelled"] == before["cancelled"] + 1
+    agent.close()
+    assert memory.cancel_token.cancelled
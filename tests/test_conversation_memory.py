@@ -0,0 +1,74 @@
+import threading
+
+from src.memory.conversation_memory import RollingSummaryMemory, count_tokens, truncate_to_tokens
+
+
+def _turn(i):
+    return f"第{i}轮：这款古法金手镯多少钱一克，有没有优惠？", f"第{i}轮回复：价格有点贵，我再看看别的款式。"
+
+
+def test_count_tokens_and_truncate():
+    assert count_tokens("") == 0
+    assert count_tokens("黄金手镯") == 4
+    assert count_tokens("gold bracelet") == 3  # 12个非空白字符 / 4
+    text = "一二三四五六七八九十"
+    assert truncate_to_tokens(text, 3) == "八九十"
+    assert truncate_to_tokens(text, 100) == text
+
+
+def test_history_stays_within_budget_over_long_session():
+    calls = []
+
+    def summarize(previous, lines):
+        calls.append(len(lines))
+        return (previous + "；" if previous else "") + f"讨论了{len(lines)}行"
+
+    memory = RollingSummaryMemory(summarize, token_budget=200, summary_max_tokens=60, background=False)
+    for i in range(60):
+        memory.add_turn(*_turn(i))
+        history = memory.render()
+        assert count_tokens(history) + history.count("\n") <= 200
+        # 最近一轮始终保留原文
+        assert f"第{i}轮回复" in history
+
+    stats = memory.stats()
+    assert stats["turns"] == 60
+    assert stats["summary_tokens"] <= 61
+    # 每次摘要折叠多轮对话，调用次数远少于轮数
+    assert 0 < stats["summary_calls"] < 30
+    assert sum(calls) == stats["lines_folded"]
+    assert "之前的对话摘要" in memory.render()
+
+
+def test_slow_summarizer_does_not_block_add_turn():
+    release = threading.Event()
+
+    def summarize(previous, lines):
+        release.wait(5)
+        return "客户预算有限"
+
+    memory = RollingSummaryMemory(summarize, token_budget=120, summary_max_tokens=40)
+    for i in range(20):
+        memory.add_turn(*_turn(i))
+        # 摘要未完成时仍按预算截取最近的对话
+        assert count_tokens(memory.render()) <= 120
+    assert memory.stats()["summary_calls"] == 0
+
+    release.set()
+    memory.wait(5)
+    assert memory.stats()["summary_calls"] >= 1
+    assert memory.render().startswith("（之前的对话摘要）客户预算有限")
+
+
+def test_summarizer_failure_falls_back_to_truncated_text():
+    def summarize(previous, lines):
+        raise RuntimeError("LLM不可用")
+
+    memory = RollingSummaryMemory(summarize, token_budget=120, summary_max_tokens=40, background=False)
+    for i in range(10):
+        memory.add_turn(*_turn(i))
+
+    stats = memory.stats()
+    assert stats["summary_failures"] >= 1
+    assert 0 < stats["summary_tokens"] <= 41
+    assert count_tokens(memory.render()) <= 120
@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.rag.docstore import MmapDocstore, PositionIds, docstore_exists, write_docstore
+
+
+def test_roundtrip_reads_single_records_and_product_id_column(tmp_path):
+    records = [
+        {"id": f"{i}-0", "page_content": f"产品{i} 手镯", "metadata": {"id": i}} for i in range(1, 6)
+    ] + [{"id": "x", "page_content": "", "metadata": {}}]
+    write_docstore(str(tmp_path), iter(records))
+
+    assert docstore_exists(str(tmp_path))
+    docstore = MmapDocstore(str(tmp_path))
+    assert len(docstore) == 6
+    assert docstore.search(2).page_content == "产品3 手镯"
+    assert docstore.search(np.int64(0)).metadata == {"id": 1}
+    assert list(docstore.product_ids) == [1, 2, 3, 4, 5, -1]
+    assert list(docstore.records()) == records
+    assert "not found" in docstore.search(6)
+    with pytest.raises(NotImplementedError):
+        docstore.delete([0])
+
+
+def test_rewrite_keeps_open_readers_consistent(tmp_path):
+    write_docstore(str(tmp_path), iter([{"id": "1-0", "page_content": "旧", "metadata": {"id": 1}}]))
+    reader = MmapDocstore(str(tmp_path))
+    write_docstore(str(tmp_path), iter([{"id": "2-0", "page_content": "新内容", "metadata": {"id": 2}}]))
+
+    # 旧读者仍读取替换前的文件，新打开的读者看到新内容
+    assert reader.search(0).page_content == "旧"
+    assert MmapDocstore(str(tmp_path)).search(0).page_content == "新内容"
+    assert not any(name.endswith(".tmp") or ".tmp." in name for name in os.listdir(tmp_path))
+
+
+def test_position_ids():
+    ids = PositionIds(3)
+    assert ids[np.int64(2)] == 2 and len(ids) == 3 and list(ids) == [0, 1, 2]
+    with pytest.raises(KeyError):
+        ids[3]
@@ -0,0 +1,73 @@
+import sys
+
+import numpy as np
+import pytest
+import torch
+from sentence_transformers import SentenceTransformer, models
+from transformers import BertConfig, BertModel, BertTokenizerFast
+
+import src.rag.rag_system as rag_system
+from src.rag.embedding_backends import embedding_model_id, load_sentence_model, loaded_backend
+
+TEXTS = ["福运转运珠手镯", "星动手镯多少钱", "价格元"]
+
+
+@pytest.fixture(scope="module")
+def tiny_model(tmp_path_factory):
+    """本地生成的小型随机BERT句向量模型（无需下载），返回模型目录"""
+    path = tmp_path_factory.mktemp("tiny_model")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set("".join(TEXTS)))
+    (path / "vocab.txt").write_text("\n".join(vocab), encoding="utf-8")
+    torch.manual_seed(0)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=1, num_attention_heads=2,
+                        intermediate_size=64, max_position_embeddings=64)
+    BertModel(config).save_pretrained(path / "bert")
+    BertTokenizerFast(str(path / "vocab.txt")).save_pretrained(path / "bert")
+    transformer = models.Transformer(str(path / "bert"))
+    SentenceTransformer(modules=[transformer, models.Pooling(transformer.get_word_embedding_dimension())]).save(
+        str(path / "model"))
+    return str(path / "model")
+
+
+def _cosine(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def test_model_id_separates_backends():
+    assert embedding_model_id("m", "torch") == "m"
+    assert embedding_model_id("m", "onnx_int8") == "m@onnx_int8"
+    assert embedding_model_id("m", "torch_int8") != embedding_model_id("m", "torch")
+
+
+def test_unknown_backend_rejected():
+    with pytest.raises(ValueError):
+        load_sentence_model("m", "tensorrt")
+
+
+def test_torch_int8_quantizes_linear_layers(tiny_model):
+    baseline = load_sentence_model(tiny_model, "torch").encode(TEXTS)
+    model = load_sentence_model(tiny_model, "torch_int8")
+    assert loaded_backend(model, "torch_int8") == "torch_int8"
+    assert any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in model.modules())
+    assert _cosine(model.encode(TEXTS), baseline).min() > 0.95
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx_int8"])
+def test_onnx_falls_back_to_torch_and_uses_torch_cache_key(tiny_model, backend, monkeypatch, tmp_path, capsys):
+    # 模拟没有安装 optimum[onnxruntime]
+    monkeypatch.setitem(sys.modules, "optimum", None)
+    monkeypatch.setitem(sys.modules, "optimum.onnxruntime", None)
+    model = load_sentence_model(tiny_model, backend, "onnx/model_quint8_avx2.onnx")
+    assert "回退到PyTorch" in capsys.readouterr().out
+    assert loaded_backend(model, backend) == "torch"
+    np.testing.assert_allclose(model.encode(TEXTS), load_sentence_model(tiny_model, "torch").encode(TEXTS), rtol=1e-5)
+
+    # 回退后的向量与 torch 相同，缓存键不能再带 @onnx
+    monkeypatch.setitem(rag_system.PERFORMANCE_CONFIG, "embedding_backend", backend)
+    monkeypatch.setattr(rag_system, "_bert_model", model)
+    monkeypatch.setattr(rag_system, "_embedding_caches", {})
+    monkeypatch.setattr(rag_system, "_embedding_batchers", {})
+    monkeypatch.setattr(rag_system, "EMBEDDING_CACHE_PATH", str(tmp_path / "embedding_cache"))
+    embeddings = rag_system.BertEmbeddings("tiny-model")
+    assert embeddings.backend == "torch"
+    assert list(rag_system._embedding_caches) == ["tiny-model"]
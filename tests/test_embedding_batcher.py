@@ -0,0 +1,47 @@
+import threading
+import time
+
+import numpy as np
+
+from src.rag.embedding_batcher import EmbeddingBatcher
+
+
+def test_concurrent_queries_are_batched_and_routed_back():
+    batches = []
+
+    def encode(texts):
+        batches.append(list(texts))
+        time.sleep(0.01)
+        return np.array([[float(len(t))] for t in texts])
+
+    batcher = EmbeddingBatcher(encode, max_batch_size=8, window_ms=50)
+    texts = ["a" * (i + 1) for i in range(8)]
+    results = {}
+
+    def worker(text):
+        results[text] = batcher.embed(text, timeout=5)
+
+    threads = [threading.Thread(target=worker, args=(t,)) for t in texts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert all(results[t][0] == len(t) for t in texts)
+    assert len(batches) < len(texts)
+    stats = batcher.stats()
+    assert stats["batch_size"]["count"] == len(batches)
+    assert stats["latency_ms"]["count"] == len(texts)
+
+
+def test_encode_errors_propagate_to_callers():
+    def encode(texts):
+        raise RuntimeError("boom")
+
+    batcher = EmbeddingBatcher(encode, window_ms=1)
+    try:
+        batcher.embed("hello", timeout=5)
+    except RuntimeError as e:
+        assert "boom" in str(e)
+    else:
+        raise AssertionError("expected RuntimeError")
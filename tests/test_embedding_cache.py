@@ -0,0 +1,86 @@
+import threading
+import time
+
+import numpy as np
+
+import src.rag.embedding_cache as embedding_cache
+from src.rag.embedding_cache import DiskEmbeddingStore, EmbeddingCache, cache_key
+
+
+class CountingEncoder:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.array([[len(t), 1.0, 2.0, 3.0] for t in texts], dtype=np.float32)
+
+
+def test_memory_hits_and_normalization(tmp_path):
+    cache = EmbeddingCache("test-model", path=str(tmp_path), memory_size=10)
+    encoder = CountingEncoder()
+
+    first = cache.get_or_encode(["您好", "想看手镯", "您好"], encoder)
+    second = cache.get_or_encode(["  您好 ", "想看手镯"], encoder)
+
+    assert encoder.calls == [["您好", "想看手镯"]]
+    assert np.allclose(first[0], second[0])
+    stats = cache.stats()
+    assert stats["misses"] == 2
+    assert stats["memory_hits"] == 2
+    assert stats["hit_rate"] == 0.5
+
+
+def test_disk_tier_survives_restart_and_is_shared_read_only(tmp_path):
+    writer = EmbeddingCache("test-model", path=str(tmp_path), dtype="float16")
+    writer.get_or_encode(["星动手镯"], CountingEncoder())
+
+    encoder = CountingEncoder()
+    reader = EmbeddingCache("test-model", path=str(tmp_path), read_only=True)
+    vector = reader.get_or_encode(["星动手镯"], encoder)
+    assert encoder.calls == []
+    assert reader.stats()["disk_hits"] == 1
+    assert vector.shape == (1, 4)
+
+    # 只读进程能看到写入进程之后追加的记录
+    writer.get_or_encode(["玲珑系列"], CountingEncoder())
+    reader.get_or_encode(["玲珑系列"], encoder)
+    assert encoder.calls == []
+
+
+def test_concurrent_reads_never_see_rows_past_the_mapping(tmp_path, monkeypatch):
+    real_memmap = np.memmap
+
+    def slow_memmap(*args, **kwargs):
+        # 放大 refresh 中登记键与换映射之间的窗口
+        time.sleep(0.002)
+        return real_memmap(*args, **kwargs)
+
+    monkeypatch.setattr(embedding_cache.np, "memmap", slow_memmap)
+    store = DiskEmbeddingStore(str(tmp_path), "test-model", dtype="float32")
+    batches = [[cache_key("test-model", f"产品{b}-{i}") for i in range(4)] for b in range(100)]
+    errors = []
+    done = threading.Event()
+
+    def read():
+        while not done.is_set():
+            for keys in batches:
+                try:
+                    vector = store.get(keys[-1])
+                except Exception as e:
+                    errors.append(e)
+                    return
+                if vector is not None and vector[0] != batches.index(keys):
+                    errors.append(AssertionError(vector))
+                    return
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for reader in readers:
+        reader.start()
+    for b, keys in enumerate(batches):
+        store.put_many(keys, np.full((len(keys), 4), b, dtype=np.float32))
+    done.set()
+    for reader in readers:
+        reader.join(10)
+    assert errors == []
+    assert len(store) == 400
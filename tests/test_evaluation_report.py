@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+
+import pandas as pd
+import pytest
+from io import BytesIO
+from langchain_core.messages import AIMessage
+
+from src.chains.evaluation_chain import (
+    EvaluationParseError,
+    parse_evaluation,
+    parse_markdown_report,
+    parse_or_repair_evaluation,
+    report_to_markdown,
+)
+from src.data_models.models import EvaluationReport
+from src.utils.report_manager import ReportManager
+
+REPORT = EvaluationReport(
+    comprehensive_score=7.5,
+    demand_mining_score=8,
+    product_recommendation_score=7,
+    objection_handling_score=6,
+    trust_building_score=8,
+    closing_score=6,
+    strengths=["主动询问预算", "介绍了保值性"],
+    suggestions=["多问用途", "及时给出限时优惠"],
+)
+
+LEGACY_MARKDOWN = """**综合评分**: 6/10
+
+**各项评分**:
+需求挖掘: 5/10
+产品推荐: 7/10
+异议处理: 6/10
+建立信任: 6/10
+推动成交: 5/10
+
+**优点**: [语气亲切；产品介绍清楚]
+
+**改进建议**:
+1. 先了解预算再推荐
+2. 主动提出试戴
+"""
+
+
+class FakeLLM:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.prompts = []
+
+    def invoke(self, input, config=None, **kwargs):
+        self.prompts.append(input)
+        return AIMessage(content=self.replies.pop(0))
+
+
+def test_parse_accepts_fenced_json_and_rejects_invalid_scores():
+    assert parse_evaluation(f"```json\n{REPORT.model_dump_json()}\n```") == REPORT
+    with pytest.raises(EvaluationParseError, match="closing_score"):
+        parse_evaluation(json.dumps({**REPORT.model_dump(), "closing_score": 12}))
+    with pytest.raises(EvaluationParseError):
+        parse_evaluation("综合评分 7/10")
+
+
+def test_repair_is_bounded():
+    llm = FakeLLM(["还是不对", REPORT.model_dump_json()])
+    assert parse_or_repair_evaluation('{"comprehensive_score": 7', llm=llm) == REPORT
+    assert len(llm.prompts) == 2 and "JSON不完整" in llm.prompts[0]
+
+    llm = FakeLLM(["不对"] * 10)
+    with pytest.raises(EvaluationParseError):
+        parse_or_repair_evaluation("不对", llm=llm)
+    assert len(llm.prompts) == 2  # evaluation_repair_attempts
+
+
+def test_markdown_round_trip_and_legacy_parse():
+    assert parse_markdown_report(report_to_markdown(REPORT)) == REPORT
+    legacy = parse_markdown_report(LEGACY_MARKDOWN)
+    assert legacy.comprehensive_score == 6 and legacy.closing_score == 5
+    assert legacy.strengths == ["语气亲切", "产品介绍清楚"]
+    assert legacy.suggestions == ["先了解预算再推荐", "主动提出试戴"]
+
+
+def test_scores_are_stored_indexed_exported_and_backfilled(tmp_path):
+    manager = ReportManager(str(tmp_path))
+    history = [{"role": "salesperson", "content": "您好"}, {"role": "customer", "content": "太贵了"}]
+    report_id = manager.save_report(report_to_markdown(REPORT), "预算敏感型", history, evaluation=REPORT)
+
+    # 旧版报告：只有Markdown正文，索引建立之后才放进目录
+    legacy = {"id": "20240101_000000", "timestamp": "2024-01-01T00:00:00", "persona": "犹豫不决型",
+              "report_content": LEGACY_MARKDOWN, "conversation_history": history, "conversation_length": 2}
+    (tmp_path / "report_20240101_000000.json").write_text(json.dumps(legacy, ensure_ascii=False), encoding="utf-8")
+
+    assert [r["id"] for r in manager.get_all_reports()] == [report_id]
+    assert manager.get_score_table()["comprehensive_score"].tolist() == [7.5]
+
+    assert manager.backfill_scores() == {"updated": 1, "skipped": 1, "failed": 0}
+    table = manager.get_score_table().set_index("persona")
+    assert table.loc["犹豫不决型", "demand_mining_score"] == 5
+    assert manager.load_report("20240101_000000")["report_content"] == LEGACY_MARKDOWN
+
+    excel = pd.read_excel(BytesIO(manager.export_reports_to_excel([report_id, "20240101_000000"])))
+    assert excel["综合评分"].tolist() == [7.5, 6]
+    assert excel["推动成交"].tolist() == [6, 5]
+
+    # 另一个进程（新的管理器实例）删除报告后，索引按文件修改时间重新读取
+    assert ReportManager(str(tmp_path)).delete_report(report_id)
+    assert [r["id"] for r in manager.get_all_reports()] == ["20240101_000000"]
+
+
+def test_concurrent_writers_do_not_drop_index_entries(tmp_path):
+    history = [{"role": "salesperson", "content": "您好"}]
+    for i in range(40):
+        data = {"id": f"r{i:02d}", "timestamp": "2024-01-01T00:00:00", "persona": "预算敏感型",
+                "report_content": "旧报告", "conversation_history": history}
+        (tmp_path / f"report_r{i:02d}.json").write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+    # 两个管理器实例各自打开锁文件，相当于两个进程（如页面和批量评估）同时写索引
+    managers = [ReportManager(str(tmp_path)), ReportManager(str(tmp_path))]
+
+    def write(manager, ids):
+        for report_id in ids:
+            manager.update_evaluations([(report_id, REPORT, None)])
+
+    threads = [threading.Thread(target=write, args=(managers[n], [f"r{i:02d}" for i in range(n, 40, 2)]))
+               for n in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    assert len(managers[0].get_score_table()) == 40
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
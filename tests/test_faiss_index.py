@@ -0,0 +1,37 @@
+import faiss
+import numpy as np
+import pytest
+
+from src.rag.faiss_index import INDEX_TYPES, create_faiss_index, resolve_index_type, search_parameters
+
+
+@pytest.mark.parametrize("index_type", INDEX_TYPES)
+def test_index_types_train_and_find_exact_match(index_type):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((3000, 32)).astype(np.float32)
+
+    index, resolved = create_faiss_index(vectors, index_type, nlist=16, hnsw_m=16, pq_m=8, nprobe=16)
+    index.add(vectors)
+
+    assert resolved == index_type
+    _, ids = index.search(vectors[:20], 5)
+    assert (ids[:, :5] == np.arange(20)[:, None]).any(axis=1).mean() >= 0.9
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "hnsw"])
+def test_search_parameters_apply_selector(index_type):
+    rng = np.random.default_rng(1)
+    vectors = rng.standard_normal((1000, 16)).astype(np.float32)
+    index, _ = create_faiss_index(vectors, index_type, nlist=8, hnsw_m=16, nprobe=8)
+    index.add(vectors)
+
+    params = search_parameters(index, faiss.IDSelectorRange(0, 100))
+    _, ids = index.search(vectors[500:501], 5, params=params)
+    assert all(0 <= i < 100 for i in ids[0] if i != -1)
+
+
+def test_small_catalogs_fall_back_to_flat():
+    assert resolve_index_type("ivf_pq", 5, nlist=256) == "flat"
+    assert resolve_index_type("hnsw", 5, nlist=256) == "hnsw"
+    with pytest.raises(ValueError):
+        resolve_index_type("lsh", 5, nlist=256)
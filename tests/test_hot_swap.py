@@ -0,0 +1,44 @@
+import os
+
+from src.rag.index_versions import (
+    current_version_path, list_versions, new_version_path, prune_versions, publish_version
+)
+from src.utils.hot_swap import HotSwapReference
+
+
+def test_readers_keep_their_version_until_released():
+    retired = []
+    ref = HotSwapReference(loader=lambda: "v1", on_retired=retired.append)
+
+    with ref.acquire() as first:
+        assert first == "v1"
+        ref.swap("v2")
+        with ref.acquire() as second:
+            assert second == "v2"
+        assert retired == []
+        assert ref.stats()["draining_versions"] == 1
+    assert retired == ["v1"]
+
+    # 没有读者时立即释放
+    ref.swap("v3")
+    assert retired == ["v1", "v2"]
+    assert ref.stats() == {"swaps": 2, "active_readers": 0, "draining_versions": 0}
+
+
+def test_version_layout_publish_and_prune(tmp_path):
+    store = str(tmp_path)
+    assert current_version_path(store) is None
+
+    versions = [new_version_path(store, f"{i:040d}") for i in range(4)]
+    assert list_versions(store) == sorted(versions)
+    publish_version(store, versions[1])
+    assert current_version_path(store) == versions[1]
+
+    removed = prune_versions(store, keep=1, in_use=[versions[2]])
+    assert removed == [versions[0]]
+    assert list_versions(store) == versions[1:]
+
+
+def test_legacy_flat_layout_is_current_version(tmp_path):
+    open(os.path.join(tmp_path, "index.faiss"), "wb").close()
+    assert current_version_path(str(tmp_path)) == str(tmp_path)
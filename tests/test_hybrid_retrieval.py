@@ -0,0 +1,24 @@
+from langchain.docstore.document import Document
+
+from src.rag.rag_system import reciprocal_rank_fusion
+
+
+def _doc(product_id, content=""):
+    return Document(page_content=content or f"product {product_id}", metadata={"id": product_id})
+
+
+def test_rrf_prefers_products_found_by_both_retrievers():
+    keyword = [_doc(3, "完整产品信息"), _doc(1)]
+    vector = [_doc(2), _doc(3, "短文本"), _doc(3, "短文本第二块")]
+
+    fused = reciprocal_rank_fusion([keyword, vector], k=3)
+
+    assert [d.metadata["id"] for d in fused] == [3, 2, 1]
+    # 同一产品去重，保留关键词结果中的完整内容
+    assert fused[0].page_content == "完整产品信息"
+    assert fused[0].metadata["rrf_score"] > fused[1].metadata["rrf_score"]
+
+
+def test_rrf_truncates_to_k():
+    fused = reciprocal_rank_fusion([[_doc(i) for i in range(10)]], k=2)
+    assert len(fused) == 2
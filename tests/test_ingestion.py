@@ -0,0 +1,44 @@
+import threading
+import time
+
+from langchain.text_splitter import CharacterTextSplitter
+
+from src.rag.ingestion import iter_document_batches, iter_product_documents, ordered_parallel_map
+
+
+def test_batches_keep_products_whole_and_filter_targets():
+    splitter = CharacterTextSplitter(chunk_size=200, chunk_overlap=20)
+    products = list(iter_product_documents("data/product_knowledge.csv", splitter, chunk_rows=2, product_ids={"2", "4", "5"}))
+    assert [pid for pid, _, _, _ in products] == ["2", "4", "5"]
+
+    batches = list(iter_document_batches(iter(products), batch_size=2))
+    assert [list(rows) for _, _, rows in batches] == [["2", "4"], ["5"]]
+    for docs, ids, rows in batches:
+        assert len(docs) == len(ids) == sum(len(row["chunk_ids"]) for row in rows.values())
+
+
+def test_ordered_parallel_map_preserves_order_and_bounds_in_flight():
+    lock = threading.Lock()
+    state = {"running": 0, "peak": 0, "produced": 0}
+
+    def items():
+        for i in range(20):
+            state["produced"] += 1
+            yield i
+
+    def work(i):
+        with lock:
+            state["running"] += 1
+            state["peak"] = max(state["peak"], state["running"])
+        time.sleep(0.01 * (i % 3))
+        with lock:
+            state["running"] -= 1
+        return i * i
+
+    consumed = 0
+    for item, result in ordered_parallel_map(work, items(), workers=3, max_in_flight=4):
+        assert result == item * item and item == consumed
+        consumed += 1
+        assert state["produced"] - consumed <= 4
+    assert consumed == 20
+    assert state["peak"] <= 3
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from src.rag.keyword_index import KeywordIndex, tokenize
+
+
+def test_tokenize_chinese_without_spaces():
+    tokens = tokenize("星动手镯 5G黄金")
+    assert "星动" in tokens
+    assert "手镯" in tokens
+    assert "5g" in tokens
+
+
+def test_keyword_index_ranks_exact_series_first():
+    df = pd.read_csv("data/product_knowledge.csv")
+    index = KeywordIndex.from_dataframe(df)
+
+    results = index.search("想看看玲珑系列", k=2)
+    assert index.doc_ids[results[0][0]] == 3
+    assert "小蛮腰手镯" in index.page_contents[results[0][0]]
+    assert results[0][1] >= results[-1][1]
+
+
+def test_keyword_index_unknown_query_returns_empty():
+    df = pd.read_csv("data/product_knowledge.csv")
+    index = KeywordIndex.from_dataframe(df)
+    assert index.search("xyz", k=2) == []
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+from langchain.prompts import PromptTemplate
+from langchain.schema.output_parser import StrOutputParser
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from src.utils.llm_cache import CachedChatModel, LLMCacheMiss, LLMResponseCache
+from src.utils.llm_router import Backend, LLMRouter
+from src.utils.llm_scheduler import ScheduledChatModel
+
+
+class FakeChatModel:
+    """记录调用次数的假聊天模型，回复中带调用序号"""
+
+    model_name = "fake-chat"
+    max_tokens = 500
+
+    def __init__(self, temperature=0.7):
+        self.temperature = temperature
+        self.calls = 0
+
+    def _reply(self, prompt):
+        self.calls += 1
+        return f"回复{self.calls}"
+
+    def invoke(self, input, config=None, **kwargs):
+        return AIMessage(content=self._reply(input))
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return self.invoke(input)
+
+    def stream(self, input, config=None, **kwargs):
+        for ch in self._reply(input):
+            yield AIMessageChunk(content=ch)
+
+    async def astream(self, input, config=None, **kwargs):
+        for chunk in self.stream(input):
+            yield chunk
+
+
+def test_record_then_replay_from_disk(tmp_path):
+    path = str(tmp_path / "llm.sqlite3")
+    llm = FakeChatModel()
+    recorder = CachedChatModel(llm, LLMResponseCache(path), mode="record")
+
+    assert recorder.invoke("您好，欢迎光临！").content == "回复1"
+    assert recorder.invoke("您好，欢迎光临！").content == "回复1"
+    assert "".join(c.content for c in recorder.stream("这款多少钱？")) == "回复2"
+    assert llm.calls == 2
+    assert recorder.cache.stats()["hits"] == 1
+
+    # 新进程：只回放，不调用模型
+    offline = FakeChatModel()
+    replayer = CachedChatModel(offline, LLMResponseCache(path), mode="replay")
+    assert replayer.invoke("您好，欢迎光临！").content == "回复1"
+    assert "".join(c.content for c in replayer.stream("这款多少钱？")) == "回复2"
+    assert offline.calls == 0
+    with pytest.raises(LLMCacheMiss):
+        replayer.invoke("没有录制过的话")
+
+
+def test_key_includes_sampling_parameters(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"))
+    warm = CachedChatModel(FakeChatModel(temperature=0.7), cache, mode="record")
+    cold = CachedChatModel(FakeChatModel(temperature=0.1), cache, mode="replay")
+    warm.invoke("您好")
+    with pytest.raises(LLMCacheMiss):
+        cold.invoke("您好")
+
+
+def test_live_mode_bypasses_cache_and_lcel_chain_uses_cache(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"))
+    llm = FakeChatModel()
+    live = CachedChatModel(llm, cache, mode="live")
+    live.invoke("您好")
+    live.invoke("您好")
+    assert llm.calls == 2 and len(cache) == 0
+
+    prompt = PromptTemplate(template="评估：{conversation_history}", input_variables=["conversation_history"])
+    chain = prompt | CachedChatModel(llm, cache, mode="record") | StrOutputParser()
+    first = "".join(chain.stream({"conversation_history": "salesperson: 您好"}))
+    second = chain.invoke({"conversation_history": "salesperson: 您好"})
+    assert first == second == "回复3"
+
+    async def run():
+        return await chain.ainvoke({"conversation_history": "salesperson: 您好"})
+
+    assert asyncio.run(run()) == "回复3"
+    assert llm.calls == 3
+
+
+class FailingChatModel(FakeChatModel):
+    model_name = "primary-chat"
+
+    def _reply(self, prompt):
+        self.calls += 1
+        raise ConnectionError("主后端不可用")
+
+
+def test_failover_reply_is_recorded_under_the_answering_backend(tmp_path):
+    cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"))
+    primary, fallback = FailingChatModel(), FakeChatModel()
+    router = LLMRouter([Backend("primary", primary, failure_threshold=100), Backend("fallback", fallback)])
+    recorder = CachedChatModel(router, cache, mode="record")
+    assert recorder.model_name == "primary-chat"
+
+    assert recorder.invoke("您好").content == "回复1"
+    assert "".join(c.content for c in recorder.stream("这款多少钱？")) == "回复2"
+    assert router.stats()["failovers"] == 1 and len(cache) == 2
+    # 备用后端的回复不会在主后端的键下命中
+    with pytest.raises(LLMCacheMiss):
+        CachedChatModel(FailingChatModel(), cache, mode="replay").invoke("您好")
+    replayer = CachedChatModel(FakeChatModel(), cache, mode="replay")
+    assert replayer.invoke("您好").content == "回复1"
+    assert "".join(c.content for c in replayer.stream("这款多少钱？")) == "回复2"
+
+    # 同样配置的路由（经过调度包装）回放和再次录制时，切换过的prompt也能命中，不调用任何后端
+    backends = [FailingChatModel(), FakeChatModel()]
+    routed = ScheduledChatModel(LLMRouter([Backend("primary", backends[0]), Backend("fallback", backends[1])]))
+    for mode in ("replay", "record"):
+        cached = CachedChatModel(routed, cache, mode=mode)
+        assert cached.invoke("您好").content == "回复1"
+        assert "".join(c.content for c in cached.stream("这款多少钱？")) == "回复2"
+    assert [model.calls for model in backends] == [0, 0] and len(cache) == 2
@@ -0,0 +1,114 @@
+import asyncio
+import time
+
+import openai
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from config import PERFORMANCE_CONFIG
+from src.utils import llm_client
+from src.utils.llm_client import ResilientChatModel, create_chat_model, get_http_client
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer(reply="太贵了", ttft_ms=10, chunk_ms=1) as server:
+        yield server
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setitem(PERFORMANCE_CONFIG, "llm_retry_backoff_seconds", 0.01)
+    monkeypatch.setitem(PERFORMANCE_CONFIG, "llm_retry_backoff_max_seconds", 0.02)
+
+
+def _model(server, **kwargs):
+    llm = create_chat_model("fake-model", "sk-test", server.base_url, streaming=True, stream_usage=True)
+    return ResilientChatModel(llm, **kwargs)
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+def test_stream_uses_shared_pool_and_reports_usage(server):
+    server.prompt_cached_tokens = 2
+    model = _model(server, hedging=False)
+    assert model.llm.http_client is get_http_client()
+    assert model.llm.max_retries == 0
+
+    chunks = list(model.stream("你好"))
+    assert "".join(c.content for c in chunks) == "太贵了"
+    message = model.invoke("你好")
+    assert message.content == "太贵了"
+    assert message.usage_metadata["input_token_details"]["cache_read"] == 2
+    assert model.stats()["ttft_ms"]["count"] == 2
+
+
+def test_retries_server_errors_before_first_token(server):
+    server.fail_first = 2
+    model = _model(server, max_retries=2, hedging=False)
+    assert model.invoke("你好").content == "太贵了"
+    assert server.requests == 3
+    assert model.stats()["retries"] == 2 and model.stats()["failures"] == 0
+
+
+def test_does_not_retry_client_errors(server):
+    server.fail_first = 1
+    server.status_code_on_failure = 400
+    model = _model(server, max_retries=2, hedging=False)
+    with pytest.raises(openai.BadRequestError):
+        model.invoke("你好")
+    assert server.requests == 1
+    assert model.stats()["failures"] == 1
+
+
+def test_hedge_wins_and_closes_slow_request(server, monkeypatch):
+    monkeypatch.setitem(PERFORMANCE_CONFIG, "llm_hedge_max_ms", 100)
+    server.slow_first = 1
+    server.slow_ttft_ms = 1000
+    model = _model(server, hedging=True)
+
+    start = time.perf_counter()
+    assert "".join(c.content for c in model.stream("你好")) == "太贵了"
+    assert time.perf_counter() - start < 0.8
+    stats = model.stats()
+    assert stats["hedges"] == 1 and stats["hedge_wins"] == 1
+    # 慢请求被关闭：服务端写入时发现连接已断开
+    _wait_until(lambda: server.disconnected == 1)
+    assert server.completed == 1
+
+
+def test_async_stream_retries_and_hedges(server, monkeypatch):
+    monkeypatch.setitem(PERFORMANCE_CONFIG, "llm_hedge_max_ms", 100)
+    server.fail_first = 1
+    server.slow_first = 1
+    server.slow_ttft_ms = 1000
+    model = _model(server, max_retries=1, hedging=True)
+
+    async def run():
+        return "".join([c.content async for c in model.astream("你好")])
+
+    assert asyncio.run(run()) == "太贵了"
+    stats = model.stats()
+    assert stats["retries"] == 1 and stats["hedge_wins"] == 1
+
+
+def test_async_calls_from_successive_event_loops(server):
+    """每个事件循环用自己的连接池：前一个循环留下的 keep-alive 连接不会被下一个循环复用"""
+    llm = create_chat_model("fake-model", "sk-test", server.base_url)
+
+    async def run():
+        message = await llm.ainvoke("你好")
+        return message.content, await llm_client._loop_http_client()
+
+    first_text, first_client = asyncio.run(run())
+    second_text, second_client = asyncio.run(run())
+    assert first_text == second_text == "太贵了"
+    assert first_client is not second_client
+    # 循环关闭前连接池随之关闭
+    assert first_client.is_closed and second_client.is_closed
+    assert not llm_client._loop_clients
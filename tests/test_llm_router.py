@@ -0,0 +1,82 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fake_openai_server import FakeOpenAIServer
+from src.utils.llm_client import ResilientChatModel, create_chat_model
+from src.utils.llm_router import Backend, CircuitBreaker, LLMRouter
+
+
+@pytest.fixture
+def servers():
+    with FakeOpenAIServer(reply="主后端", ttft_ms=10, chunk_ms=1) as primary, \
+            FakeOpenAIServer(reply="备用后端", ttft_ms=10, chunk_ms=1) as secondary:
+        yield primary, secondary
+
+
+def _backend(name, server, **kwargs):
+    llm = create_chat_model(f"{name}-model", "sk-test", server.base_url, streaming=True)
+    return Backend(name, ResilientChatModel(llm, max_retries=0, hedging=False), **kwargs)
+
+
+def _text(router, prompt="你好"):
+    return "".join(chunk.content for chunk in router.stream(prompt))
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+def test_routes_to_fastest_backend(servers):
+    primary, secondary = servers
+    primary.ttft_ms = 150
+    router = LLMRouter([_backend("primary", primary), _backend("secondary", secondary)])
+    # 两个后端都没有样本时先用主后端，之后没有样本的备用后端被试用一次，然后固定选更快的
+    assert [_text(router) for _ in range(5)] == ["主后端"] + ["备用后端"] * 4
+    assert router.model_name == "primary-model"
+    backends = router.stats()["backends"]
+    assert backends["primary"]["calls"] == 1 and backends["secondary"]["calls"] == 4
+
+
+def test_fails_over_opens_breaker_and_recovers_after_probe(servers):
+    primary, secondary = servers
+    primary.fail_first = 1000
+    router = LLMRouter([
+        _backend("primary", primary, failure_threshold=1, cooldown_seconds=0.2),
+        _backend("secondary", secondary),
+    ])
+
+    assert _text(router) == "备用后端"
+    assert router.stats()["failovers"] == 1
+    assert router.stats()["backends"]["primary"]["state"] == CircuitBreaker.OPEN
+    # 熔断期间不再请求主后端；探测仍失败时继续熔断（等探测结果记录后再检查状态）
+    assert _text(router) == "备用后端"
+    _wait_until(lambda: router.stats()["backends"]["primary"]["opens"] >= 2)
+    assert router.stats()["backends"]["primary"]["state"] == CircuitBreaker.OPEN
+
+    primary.fail_first = 0
+    _wait_until(lambda: router.stats()["backends"]["primary"]["state"] == CircuitBreaker.CLOSED)
+    assert router.stats()["backends"]["primary"]["opens"] >= 2
+
+
+def test_all_backends_broken_still_tries_and_raises_last_error(servers):
+    primary, secondary = servers
+    primary.fail_first = secondary.fail_first = 1000
+    router = LLMRouter([
+        _backend("primary", primary, failure_threshold=1, cooldown_seconds=60),
+        _backend("secondary", secondary, failure_threshold=1, cooldown_seconds=60),
+    ])
+    with pytest.raises(Exception):
+        _text(router)
+    secondary.fail_first = 0
+    # 全部熔断时按熔断先后依次尝试
+    assert _text(router) == "备用后端"
+
+    async def run():
+        return "".join([chunk.content async for chunk in router.astream("你好")])
+
+    assert asyncio.run(run()) == "备用后端"
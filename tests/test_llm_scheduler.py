@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from src.utils.llm_scheduler import (
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_REPORT,
+    LLMQueueTimeout,
+    LLMScheduler,
+    ScheduledChatModel,
+    TokenBucket,
+    llm_priority,
+)
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+def test_token_bucket_refills_at_rate():
+    bucket = TokenBucket(per_minute=600, burst=2)  # 每秒10个
+    assert bucket.try_take(2) == 0.0
+    wait = bucket.try_take(1)
+    assert 0.05 < wait <= 0.1
+    time.sleep(wait)
+    assert bucket.try_take(1) == 0.0
+    # 超过容量的请求按容量计，不会永远等待
+    assert bucket.try_take(100) <= 0.2
+
+
+def test_higher_priority_is_granted_first():
+    scheduler = LLMScheduler(max_concurrency=1)
+    held = scheduler.acquire(PRIORITY_BATCH)
+    order = []
+
+    def worker(priority):
+        ticket = scheduler.acquire(priority)
+        order.append(priority)
+        scheduler.release(ticket)
+
+    threads = []
+    for priority in (PRIORITY_BATCH, PRIORITY_REPORT, PRIORITY_INTERACTIVE):
+        threads.append(threading.Thread(target=worker, args=(priority,)))
+        threads[-1].start()
+        _wait_until(lambda: scheduler.stats()["queues"][priority]["queued"] == 1)
+
+    scheduler.release(held)
+    for thread in threads:
+        thread.join(5)
+    assert order == [PRIORITY_INTERACTIVE, PRIORITY_REPORT, PRIORITY_BATCH]
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 0
+    assert stats["queues"][PRIORITY_BATCH]["granted"] == 2
+    assert stats["queues"][PRIORITY_BATCH]["wait_ms"]["count"] == 2
+
+
+def test_token_budget_is_corrected_by_actual_usage():
+    scheduler = LLMScheduler(max_concurrency=4, tokens_per_minute=60000)  # 每秒1000个token
+    scheduler._tokens.capacity = 1000
+    scheduler._tokens._data[0] = 1000
+    first = scheduler.acquire(tokens=800)
+    scheduler.release(first, used_tokens=100)  # 归还多预估的700
+
+    start = time.perf_counter()
+    scheduler.release(scheduler.acquire(tokens=800))
+    assert time.perf_counter() - start < 0.1
+    # 预算已用完，需要等待恢复
+    start = time.perf_counter()
+    scheduler.release(scheduler.acquire(tokens=500))
+    assert time.perf_counter() - start > 0.2
+
+
+def test_queue_timeout_leaves_no_waiter():
+    scheduler = LLMScheduler(max_concurrency=1)
+    held = scheduler.acquire()
+    with pytest.raises(LLMQueueTimeout):
+        scheduler.acquire(PRIORITY_REPORT, timeout=0.05)
+    queue = scheduler.stats()["queues"][PRIORITY_REPORT]
+    assert queue["queued"] == 0 and queue["timeouts"] == 1 and queue["granted"] == 0
+    scheduler.release(held)
+    scheduler.release(scheduler.acquire(PRIORITY_BATCH, timeout=1))
+
+
+def test_concurrency_is_shared_across_processes(tmp_path):
+    # 两个调度器实例模拟两个进程
+    first = LLMScheduler(max_concurrency=1, requests_per_minute=600, shared_dir=str(tmp_path))
+    second = LLMScheduler(max_concurrency=1, requests_per_minute=600, shared_dir=str(tmp_path))
+    held = first.acquire()
+    with pytest.raises(LLMQueueTimeout):
+        second.acquire(timeout=0.2)
+    first.release(held)
+    second.release(second.acquire(timeout=1))
+
+
+class FakeLLM:
+    max_tokens = 10
+
+    def stream(self, input, config=None):
+        yield AIMessageChunk(content="太贵")
+        yield AIMessageChunk(content="了", usage_metadata={"input_tokens": 5, "output_tokens": 2, "total_tokens": 7})
+
+    async def astream(self, input, config=None):
+        for chunk in self.stream(input):
+            yield chunk
+
+
+def test_scheduled_model_uses_context_priority():
+    scheduler = LLMScheduler(max_concurrency=2)
+    model = ScheduledChatModel(FakeLLM(), PRIORITY_REPORT, scheduler=scheduler)
+    assert "".join(c.content for c in model.stream("你好")) == "太贵了"
+    with llm_priority(PRIORITY_BATCH):
+        assert "".join(c.content for c in model.stream("你好")) == "太贵了"
+
+    async def run():
+        return "".join([c.content async for c in model.astream("你好")])
+
+    assert asyncio.run(run()) == "太贵了"
+    queues = scheduler.stats()["queues"]
+    assert queues[PRIORITY_REPORT]["granted"] == 2
+    assert queues[PRIORITY_BATCH]["granted"] == 1
+    assert scheduler.stats()["in_flight"] == 0
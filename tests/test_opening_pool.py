@@ -0,0 +1,121 @@
+import threading
+import time
+
+import httpx
+
+from src.core.opening_pool import WELCOME_MESSAGES, OpeningPool
+
+
+class FakeAgent:
+    def __init__(self, persona_name, fail=None, release=None):
+        self.persona_name = persona_name
+        self.fail = fail
+        self.release = release
+        self.turns = []
+        self.last_timing = {}
+
+    def stream(self, text):
+        if self.release is not None:
+            self.release.wait(5)
+        if self.fail:
+            raise self.fail
+        reply = f"{self.persona_name}：随便看看"
+        self.turns.append((text, reply))
+        self.last_timing = {"ttft_ms": 1.0, "total_ms": 2.0}
+        yield reply
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+def test_take_returns_pregenerated_agent_and_refills():
+    pool = OpeningPool(lambda name, use_rag: FakeAgent(name), size=2, workers=2)
+    assert pool.take("王女士") is None  # 池空时不等待
+    _wait_until(lambda: pool.stats()["ready"].get("王女士") == 2)
+
+    opening = pool.take("王女士")
+    assert opening.reply == "王女士：随便看看"
+    assert opening.welcome_message in WELCOME_MESSAGES
+    # 代理记忆中已有第一轮对话
+    assert opening.agent.turns == [(opening.welcome_message, opening.reply)]
+    _wait_until(lambda: pool.stats()["ready"].get("王女士") == 2)
+    assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 1
+
+    # 欢迎语轮换，开场不重复
+    welcomes = {pool.take("王女士").welcome_message for _ in range(2)} | {opening.welcome_message}
+    assert len(welcomes) == 3
+
+
+def test_fill_does_not_oversubscribe_and_backs_off_on_failure():
+    release = threading.Event()
+    created = []
+
+    def factory(name, use_rag):
+        created.append(name)
+        return FakeAgent(name, fail=httpx.ReadTimeout("API超时"), release=release)
+
+    pool = OpeningPool(factory, size=3, workers=1, retry_seconds=60)
+    pool.fill(["张阿姨"])
+    pool.fill(["张阿姨"])
+    release.set()
+    _wait_until(lambda: pool.stats()["failures"] == 3)
+    assert len(created) == 3
+    assert pool.stats()["pending"] == 0
+
+    # 失败后在重试间隔内不再生成
+    pool.fill(["张阿姨"])
+    time.sleep(0.05)
+    assert len(created) == 3
+
+
+def test_prefill_runs_once_per_mode():
+    created = []
+
+    def factory(name, use_rag):
+        created.append((name, use_rag))
+        return FakeAgent(name)
+
+    pool = OpeningPool(factory, size=1, workers=1)
+    for _ in range(3):  # 页面每次重新运行都会调用
+        pool.prefill(["王女士"])
+    _wait_until(lambda: pool.stats()["ready"].get("王女士") == 1)
+    pool.take("王女士")
+    _wait_until(lambda: pool.stats()["ready"].get("王女士") == 1)
+    pool.prefill(["王女士"])
+    pool.prefill(["王女士"], use_rag=True)
+    _wait_until(lambda: len(created) == 3)
+    time.sleep(0.05)
+    assert created == [("王女士", False)] * 2 + [("王女士", True)]
+
+
+def test_retry_interval_doubles_and_config_errors_stop_prefill(capsys):
+    pool = OpeningPool(lambda name, use_rag: FakeAgent(name, fail=httpx.ReadTimeout("API超时")),
+                       size=1, workers=1, retry_seconds=0.05)
+    for failures in (1, 2):
+        time.sleep(0.11)
+        pool.fill(["王女士"])
+        _wait_until(lambda: pool.stats()["failures"] == failures)
+    output = capsys.readouterr().out
+    assert "0.05秒后重试" in output and "0.1秒后重试" in output
+
+    created = []
+
+    def factory(name, use_rag):
+        created.append(name)
+        return FakeAgent(name, fail=ValueError("未配置API密钥"))
+
+    pool = OpeningPool(factory, size=2, workers=2, retry_seconds=0, max_config_failures=3)
+    pool.fill(["张阿姨"])
+    _wait_until(lambda: pool.stats()["failures"] == 2)
+    pool.fill(["张阿姨"])
+    _wait_until(lambda: pool.stats()["disabled"] == ["张阿姨"])
+    for _ in range(3):
+        pool.fill(["张阿姨"])
+    assert pool.take("张阿姨") is None
+    time.sleep(0.05)
+    assert len(created) == 4
+    assert capsys.readouterr().out.count("停止预生成") == 1
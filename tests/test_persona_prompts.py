@@ -0,0 +1,43 @@
+from langchain.docstore.document import Document
+from langchain_core.messages import AIMessageChunk
+
+import src.core.agent_logic as agent_logic
+from src.prompts.persona_prompts import PERSONA_PROMPTS, PERSONA_RAG_PROMPTS, SHARED_INSTRUCTIONS
+
+
+class RecordingLLM:
+    def __init__(self):
+        self.prompts = []
+
+    def stream(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        yield AIMessageChunk(content=f"第{len(self.prompts)}句回复")
+
+    def invoke(self, prompt, **kwargs):
+        return AIMessageChunk(content="摘要")
+
+
+def test_all_prompts_share_the_static_prefix():
+    for prompt in list(PERSONA_PROMPTS.values()) + list(PERSONA_RAG_PROMPTS.values()):
+        assert prompt.template.startswith(SHARED_INSTRUCTIONS)
+        # 每轮变化的部分在对话历史之后
+        assert prompt.template.index("{history}") < prompt.template.index("{input}")
+        if "{context}" in prompt.template:
+            assert prompt.template.index("{history}") < prompt.template.index("{context}")
+
+
+def test_previous_turn_prompt_is_a_prefix_of_the_next(monkeypatch):
+    llm = RecordingLLM()
+    monkeypatch.setattr(agent_logic, "get_llm", lambda use_deepseek=True, temperature=0.7: llm)
+    products = iter(["古法金手镯 6000元", "满天星手镯 4000元", "平安扣 3000元"])
+    monkeypatch.setattr(agent_logic, "query_vector_store",
+                        lambda query, k=1, filters=None: [Document(page_content=next(products))])
+    agent = agent_logic.create_rag_agent("预算敏感型 (王女士)")
+    for text in ("您好，欢迎光临！", "这款古法金手镯很保值。", "今天买有优惠。"):
+        agent.invoke({"input": text})
+
+    for previous, current in zip(llm.prompts, llm.prompts[1:]):
+        # 上一轮prompt中产品信息之前的部分（共享前缀 + 历史）原样出现在这一轮开头
+        stable = previous[:previous.index("相关产品信息")].rstrip("\n")
+        assert current.startswith(stable)
+        assert len(stable) > len(SHARED_INSTRUCTIONS)
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import numpy as np
+
+from src.rag.query_cache import RetrievalCache, normalize_query
+
+
+def test_normalize_query_folds_width_case_and_edge_punctuation():
+    assert normalize_query("您好，想看看什么手镯？") == normalize_query(" 您好,想看看什么手镯? ")
+
+
+def test_exact_hits_ttl_and_invalidate():
+    cache = RetrievalCache(max_size=2, ttl_seconds=0.05)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return ["result"]
+
+    assert cache.get_or_compute("您好，想看看什么手镯？", (1, "hybrid", ()), compute) == ["result"]
+    assert cache.get_or_compute("您好,想看看什么手镯?", (1, "hybrid", ()), compute) == ["result"]
+    assert len(calls) == 1
+    # 不同检索参数不复用
+    cache.get_or_compute("您好,想看看什么手镯?", (2, "hybrid", ()), compute)
+    assert len(calls) == 2
+
+    time.sleep(0.06)
+    cache.get_or_compute("您好,想看看什么手镯?", (1, "hybrid", ()), compute)
+    assert len(calls) == 3
+
+    cache.invalidate()
+    assert len(cache) == 0
+
+
+def test_semantic_hits_within_threshold():
+    vectors = {"想看手镯": [1.0, 0.0], "想看看手镯": [0.99, 0.05], "多少钱": [0.0, 1.0]}
+    cache = RetrievalCache(semantic_threshold=0.95)
+    embed = lambda q: np.array(vectors[q])
+
+    cache.get_or_compute("想看手镯", 1, lambda: "bracelets", embed=embed)
+    assert cache.get_or_compute("想看看手镯", 1, lambda: "recomputed", embed=embed) == "bracelets"
+    assert cache.get_or_compute("多少钱", 1, lambda: "price", embed=embed) == "price"
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_concurrent_identical_queries_are_coalesced():
+    cache = RetrievalCache()
+    started = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return "value"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute("q", 1, compute)))
+               for _ in range(5)]
+    threads[0].start()
+    started.wait(1)
+    for t in threads[1:]:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+    assert cache.stats()["coalesced"] == 4
+
+
+def test_results_from_before_invalidate_are_not_cached():
+    cache = RetrievalCache()
+    # 查询在索引切换前取得旧版本（先读取代数），切换和 invalidate() 之后才计算完成
+    generation = cache.generation
+    cache.invalidate()
+    assert cache.get_or_compute("q", 1, lambda: "old", generation=generation) == "old"
+    assert len(cache) == 0
+
+    # 旧代数的计算进行中时，新代数的相同查询不与它合并
+    started, release = threading.Event(), threading.Event()
+
+    def slow_old():
+        started.set()
+        release.wait(1)
+        return "old"
+
+    generation = cache.generation
+    old = threading.Thread(target=cache.get_or_compute, args=("q", 1, slow_old), kwargs={"generation": generation})
+    old.start()
+    started.wait(1)
+    cache.invalidate()
+    assert cache.get_or_compute("q", 1, lambda: "new", generation=cache.generation) == "new"
+    release.set()
+    old.join()
+    assert cache.get_or_compute("q", 1, lambda: "recomputed") == "new"
@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from src.utils.resource_manager import ResourceManager
+
+
+def test_concurrent_loads_share_one_load():
+    manager = ResourceManager()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        time.sleep(0.05)
+        return "model"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.load("model", loader))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["model"] * 5
+    assert len(calls) == 1
+    status = manager.status()["model"]
+    assert status["state"] == "ready"
+    assert status["load_seconds"] >= 0.05
+
+
+def test_non_blocking_load_returns_none_while_warming_up():
+    manager = ResourceManager()
+    release = threading.Event()
+
+    manager.warm_up({"index": lambda: release.wait(1) and "index"})
+    time.sleep(0.02)
+    assert manager.is_loading("index")
+    assert manager.load("index", lambda: "other", wait=False) is None
+
+    release.set()
+    assert manager.load("index", lambda: "index") == "index"
+    assert manager.all_ready()
+    # 预热只启动一次
+    assert manager.warm_up({"index": lambda: "again"}) is False
+
+
+def test_failed_load_is_reported_and_can_retry():
+    manager = ResourceManager()
+
+    def broken():
+        raise RuntimeError("no network")
+
+    with pytest.raises(RuntimeError):
+        manager.load("model", broken)
+    assert manager.status()["model"]["error"] == "no network"
+    assert manager.load("model", lambda: "ok") == "ok"
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+from langchain_core.messages import AIMessageChunk
+
+import src.core.agent_logic as agent_logic
+from src.memory.conversation_memory import RollingSummaryMemory
+from src.utils.metrics import get_llm_usage_stats, get_stream_stats, timed_stream
+
+
+class FakeStreamingLLM:
+    """按块返回固定回复的假LLM，记录收到的prompt"""
+
+    def __init__(self, chunks, delay=0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.prompts = []
+
+    def stream(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        for chunk in self.chunks:
+            time.sleep(self.delay)
+            yield AIMessageChunk(content=chunk)
+
+    async def astream(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        for chunk in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield AIMessageChunk(content=chunk)
+
+    def invoke(self, prompt, **kwargs):
+        return AIMessageChunk(content="摘要")
+
+
+def test_timed_stream_records_ttft_and_total():
+    def chunks():
+        time.sleep(0.02)
+        yield AIMessageChunk(content="")
+        yield AIMessageChunk(content="太")
+        time.sleep(0.02)
+        yield "贵了"
+
+    timing = {}
+    before = get_stream_stats().get("test_stream", {}).get("ttft_ms", {}).get("count", 0)
+    assert list(timed_stream(chunks(), "test_stream", timing)) == ["太", "贵了"]
+    assert 15 <= timing["ttft_ms"] < timing["total_ms"]
+    assert timing["chunks"] == 2
+    assert get_stream_stats()["test_stream"]["ttft_ms"]["count"] == before + 1
+
+
+def test_basic_agent_streams_and_updates_memory_after_completion():
+    llm = FakeStreamingLLM(["嗯，", "多少钱", "一克？"])
+    memory = RollingSummaryMemory(lambda previous, lines: "", background=False, ai_prefix="王女士")
+    agent = agent_logic.SimpleConversationChain(llm, agent_logic.PERSONA_PROMPTS["预算敏感型 (王女士)"], memory)
+
+    stream = agent.stream("您好，欢迎光临！")
+    assert next(stream) == "嗯，"
+    assert memory.render() == ""  # 回复完成前不写入记忆
+    assert "".join(stream) == "多少钱一克？"
+    assert memory.render() == "销售：您好，欢迎光临！\n王女士：嗯，多少钱一克？"
+    assert "ttft_ms" in agent.last_timing and "total_ms" in agent.last_timing
+
+    assert agent.predict("足金999，今天有优惠。") == "嗯，多少钱一克？"
+    assert "王女士：嗯，多少钱一克？" in llm.prompts[-1]
+
+
+def test_rag_agent_streams_with_retrieval_in_ttft(monkeypatch):
+    llm = FakeStreamingLLM(["这款", "在预算内吗？"])
+    monkeypatch.setattr(agent_logic, "get_llm", lambda use_deepseek=True, temperature=0.7: llm)
+
+    def slow_retrieval(query, k=1, filters=None):
+        time.sleep(0.03)
+        return []
+
+    monkeypatch.setattr(agent_logic, "query_vector_store", slow_retrieval)
+    agent = agent_logic.create_rag_agent("预算敏感型 (王女士)")
+
+    assert list(agent.stream("推荐这款古法金手镯")) == ["这款", "在预算内吗？"]
+    assert agent.last_timing["ttft_ms"] >= 25
+    assert "暂无相关产品信息" in llm.prompts[-1]
+    assert agent.invoke({"input": "足金的"}) == "这款在预算内吗？"
+    assert "王女士：这款在预算内吗？" in agent.memory.render()
+
+
+def test_async_agents_share_one_event_loop(monkeypatch):
+    llm = FakeStreamingLLM(["这款", "多少钱？"], delay=0.05)
+    monkeypatch.setattr(agent_logic, "get_llm", lambda use_deepseek=True, temperature=0.7: llm)
+    retrieval_calls = []
+
+    async def slow_retrieval(query, k=1, filters=None):
+        retrieval_calls.append(query)
+        await asyncio.sleep(0.05)
+        return []
+
+    monkeypatch.setattr(agent_logic, "aquery_vector_store", slow_retrieval)
+    rag_agents = [agent_logic.create_rag_agent("预算敏感型 (王女士)") for _ in range(10)]
+    basic_agents = [agent_logic.create_agent("犹豫不决型 (张阿姨)") for _ in range(10)]
+
+    async def run():
+        calls = [agent.ainvoke({"input": f"第{i}位客户您好"}) for i, agent in enumerate(rag_agents + basic_agents)]
+        return await asyncio.gather(*calls)
+
+    start = time.perf_counter()
+    replies = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert replies == ["这款多少钱？"] * 20
+    assert len(retrieval_calls) == 10
+    # 20个会话并发：总耗时接近单个会话（约0.15秒），而不是逐个累加
+    assert elapsed < 1.0
+    assert all(agent.memory.stats()["turns"] == 1 for agent in rag_agents + basic_agents)
+    assert rag_agents[0].last_timing["ttft_ms"] >= 90
+
+
+def test_usage_and_context_cache_hits_are_recorded():
+    usage = {"input_tokens": 1200, "output_tokens": 30, "total_tokens": 1230,
+             "input_token_details": {"cache_read": 1024}}
+
+    def chunks():
+        yield AIMessageChunk(content="太贵了")
+        yield AIMessageChunk(content="", usage_metadata=usage)
+
+    timing = {}
+    before = get_llm_usage_stats().get("test_usage", {}).get("cached_tokens", 0)
+    assert list(timed_stream(chunks(), "test_usage", timing)) == ["太贵了"]
+    assert (timing["input_tokens"], timing["cached_tokens"], timing["output_tokens"]) == (1200, 1024, 30)
+    assert get_llm_usage_stats()["test_usage"]["cached_tokens"] == before + 1024
+    assert get_stream_stats()["test_usage"]["ttft_ms_cache_hit"]["count"] >= 1
+
+
+def test_invalid_fast_model_falls_back_to_main_llm_with_one_warning(monkeypatch, capsys):
+    monkeypatch.setattr(agent_logic, "OPENAI_API_KEY", "YOUR_OPENAI_API_KEY")
+    for spec in ("gpt-4o-mini", "anthropic:claude-haiku", "openai:gpt-4o-mini"):
+        monkeypatch.setattr(agent_logic, "_llm_cache", {})
+        monkeypatch.setattr(agent_logic, "LLM_FAST_MODEL", spec)
+        assert agent_logic.get_fast_llm() is None and agent_logic.get_fast_llm() is None
+        assert capsys.readouterr().out.count("LLM_FAST_MODEL 配置无效") == 1
+
+    monkeypatch.setattr(agent_logic, "_llm_cache", {})
+    monkeypatch.setattr(agent_logic, "_routers", {})
+    monkeypatch.setattr(agent_logic, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(agent_logic, "DEEPSEEK_API_KEY", "sk-test")
+    assert agent_logic.get_fast_llm().model_name == "gpt-4o-mini"
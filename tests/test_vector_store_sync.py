@@ -0,0 +1,203 @@
+import hashlib
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import src.rag.rag_system as rag_system
+
+
+class FakeModel:
+    """确定性的假embedding模型（字符二元组哈希词袋），记录被编码的文本"""
+
+    def __init__(self):
+        self.encoded = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, **kwargs):
+        self.encoded.extend(texts)
+        vectors = np.zeros((len(texts), 64), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for i in range(len(text) - 1):
+                bucket = int(hashlib.md5(text[i:i + 2].encode("utf-8")).hexdigest(), 16) % 64
+                vectors[row, bucket] += 1.0
+        return vectors
+
+
+@pytest.fixture
+def fake_model(monkeypatch, tmp_path):
+    model = FakeModel()
+    monkeypatch.setattr(rag_system, "_bert_model", model)
+    monkeypatch.setattr(rag_system, "_embedding_caches", {})
+    monkeypatch.setattr(rag_system, "_embedding_batchers", {})
+    monkeypatch.setattr(rag_system, "_query_cache", rag_system.RetrievalCache())
+    monkeypatch.setattr(rag_system, "EMBEDDING_CACHE_PATH", str(tmp_path / "embedding_cache"))
+    # 假模型只存在于本进程，不使用编码进程池
+    monkeypatch.setitem(rag_system.PERFORMANCE_CONFIG, "ingestion_workers", 1)
+    monkeypatch.setattr(rag_system, "VECTOR_STORE_PATH", str(tmp_path / "vector_store"))
+    monkeypatch.setattr(rag_system, "_index_versions", rag_system._new_index_versions())
+    return model
+
+
+def current_version(store_path):
+    return rag_system.current_version_path(str(store_path))
+
+
+def assert_docstore_matches_vectors(store):
+    """第i条文档正好是第i个向量的原文"""
+    expected = FakeModel().encode([record["page_content"] for record in store.docstore.records()])
+    actual = np.stack([store.index.reconstruct(position) for position in range(store.index.ntotal)])
+    np.testing.assert_allclose(actual, expected)
+
+
+def test_incremental_rebuild_only_embeds_changed_rows(tmp_path, fake_model):
+    csv_path = tmp_path / "products.csv"
+    store_path = tmp_path / "vector_store"
+    shutil.copy("data/product_knowledge.csv", csv_path)
+
+    assert rag_system.create_vector_store(csv_path=str(csv_path), store_path=str(store_path))
+    assert len(fake_model.encoded) == 5
+
+    # 未变更时直接跳过
+    fake_model.encoded.clear()
+    assert rag_system.create_vector_store(csv_path=str(csv_path), store_path=str(store_path))
+    assert fake_model.encoded == []
+
+    # 修改一个价格并删除一个产品
+    df = pd.read_csv(csv_path)
+    df.loc[df["id"] == 2, "price_yuan"] = 9900
+    df = df[df["id"] != 5]
+    df.to_csv(csv_path, index=False)
+
+    assert rag_system.create_vector_store(csv_path=str(csv_path), store_path=str(store_path))
+    assert len(fake_model.encoded) == 1
+    assert "价格9900元" in fake_model.encoded[0]
+
+    store = rag_system._read_vectorstore(current_version(store_path), rag_system.BertEmbeddings())
+    assert store.index.ntotal == 4
+    assert sorted(record["metadata"]["id"] for record in store.docstore.records()) == [1, 2, 3, 4]
+    assert_docstore_matches_vectors(store)
+    assert not os.path.exists(os.path.join(current_version(store_path), "index.pkl"))
+
+
+def test_duplicate_product_ids_are_rejected_at_ingestion(tmp_path, fake_model, capsys):
+    csv_path = tmp_path / "products.csv"
+    store_path = tmp_path / "vector_store"
+    df = pd.read_csv("data/product_knowledge.csv")
+    pd.concat([df, df[df["id"] == 3]]).to_csv(csv_path, index=False)
+
+    assert not rag_system.create_vector_store(csv_path=str(csv_path), store_path=str(store_path))
+    assert "重复的产品id: 3" in capsys.readouterr().out
+    assert fake_model.encoded == [] and current_version(store_path) is None
+
+    with pytest.raises(rag_system.DuplicateProductIdError) as excinfo:
+        rag_system.IndexVersion(str(csv_path)).product_data()
+    assert excinfo.value.duplicate_ids == [3]
+
+
+def test_streaming_build_adds_batches_and_reports_progress(tmp_path, fake_model, monkeypatch):
+    from benchmarks.synthetic_catalog import make_catalog
+
+    csv_path = tmp_path / "products.csv"
+    store_path = tmp_path / "vector_store"
+    make_catalog(300).to_csv(csv_path, index=False)
+    monkeypatch.setitem(rag_system.PERFORMANCE_CONFIG, "ingestion_chunk_rows", 64)
+    monkeypatch.setitem(rag_system.PERFORMANCE_CONFIG, "ingestion_batch_size", 50)
+    monkeypatch.setitem(rag_system.PERFORMANCE_CONFIG, "faiss_max_training_points", 100)
+    # 记录创建索引时缓存了多少向量：flat 不需要训练，用第一批就创建
+    created_with = []
+    new_index = rag_system._new_index
+    monkeypatch.setattr(rag_system, "_new_index",
+                        lambda vectors, index_type: created_with.append(len(vectors)) or new_index(vectors, index_type))
+
+    events = []
+    assert rag_system.create_vector_store(
+        csv_path=str(csv_path), store_path=str(store_path),
+        progress_callback=lambda stage, done, total: events.append((stage, done, total)),
+    )
+    assert created_with == [50]
+
+    embed_events = [(done, total) for stage, done, total in events if stage == "embed"]
+    assert embed_events[0] == (0, 300) and embed_events[-1] == (300, 300)
+    assert len(embed_events) == 7
+    assert events[-1] == ("save", 1, 1)
+
+    store = rag_system._read_vectorstore(current_version(store_path), rag_system.BertEmbeddings())
+    assert store.index.ntotal == 300
+    assert_docstore_matches_vectors(store)
+    assert len(rag_system.load_manifest(current_version(store_path))["rows"]) == 300
+
+    # 需要聚类训练的索引先缓存 faiss_max_training_points 个向量（不含文档）
+    monkeypatch.setitem(rag_system.PERFORMANCE_CONFIG, "faiss_index_type", "ivf_flat")
+    monkeypatch.setitem(rag_system.PERFORMANCE_CONFIG, "faiss_nlist", 2)
+    created_with.clear()
+    assert rag_system.create_vector_store(csv_path=str(csv_path), store_path=str(store_path), force=True)
+    assert created_with == [100]
+
+
+def test_hybrid_query_fuses_keyword_and_vector_results(tmp_path, fake_model, monkeypatch):
+    store_path = tmp_path / "vector_store"
+    assert rag_system.create_vector_store(store_path=str(store_path))
+
+    results = rag_system.query_vector_store("星动手镯", k=2, mode="hybrid")
+
+    assert results[0].metadata["id"] == 2
+    assert "价格: 9200元" in results[0].page_content
+    assert len({doc.metadata["id"] for doc in results}) == len(results)
+
+
+def test_vector_search_applies_attribute_prefilter(tmp_path, fake_model, monkeypatch):
+    store_path = tmp_path / "vector_store"
+    assert rag_system.create_vector_store(store_path=str(store_path))
+
+    for mode in ("vector", "hybrid"):
+        results = rag_system.query_vector_store("福运转运珠手镯", k=3, mode=mode, filters="price_yuan<=9200")
+        assert {doc.metadata["id"] for doc in results} <= {2, 3}
+        assert results
+
+
+def test_hnsw_store_rebuilds_when_rows_are_removed(tmp_path, fake_model, monkeypatch):
+    monkeypatch.setitem(rag_system.PERFORMANCE_CONFIG, "faiss_index_type", "hnsw")
+    csv_path = tmp_path / "products.csv"
+    store_path = tmp_path / "vector_store"
+    shutil.copy("data/product_knowledge.csv", csv_path)
+    assert rag_system.create_vector_store(csv_path=str(csv_path), store_path=str(store_path))
+
+    df = pd.read_csv(csv_path)
+    df[df["id"] != 1].to_csv(csv_path, index=False)
+    fake_model.encoded.clear()
+    assert rag_system.create_vector_store(csv_path=str(csv_path), store_path=str(store_path))
+
+    # 全量重建，但未变更的行命中embedding缓存
+    assert fake_model.encoded == []
+    manifest = rag_system.load_manifest(current_version(store_path))
+    assert manifest["resolved_index_type"] == "hnsw"
+    assert sorted(manifest["rows"]) == ["2", "3", "4", "5"]
+
+
+def test_rebuild_hot_swaps_while_in_flight_queries_finish_on_old_version(tmp_path, fake_model, monkeypatch):
+    csv_path = tmp_path / "products.csv"
+    shutil.copy("data/product_knowledge.csv", csv_path)
+    monkeypatch.setattr(rag_system, "PRODUCT_KNOWLEDGE_PATH", str(csv_path))
+    assert rag_system.create_vector_store()
+    first_version = rag_system.current_version_path(rag_system.VECTOR_STORE_PATH)
+    assert "价格: 9200元" in rag_system.query_vector_store("满天星", k=1, mode="keyword")[0].page_content
+
+    df = pd.read_csv(csv_path)
+    df.loc[df["id"] == 2, "price_yuan"] = 9900
+    df.to_csv(csv_path, index=False)
+
+    with rag_system._index_versions.acquire() as old_version:
+        assert rag_system.create_vector_store()
+        # 新查询立即使用新版本，进行中的查询仍使用旧版本
+        assert "价格: 9900元" in rag_system.query_vector_store("满天星", k=1, mode="hybrid")[0].page_content
+        assert "价格: 9200元" in old_version.keyword_documents("满天星", 1)[0].page_content
+        assert old_version.loaded_vectorstore is not None
+        assert rag_system.get_index_version_info()["draining_versions"] == 1
+
+    # 最后一个查询结束后旧版本被释放
+    assert old_version.loaded_vectorstore is None
+    assert old_version.store_path == first_version
+    assert rag_system.get_index_version_info()["draining_versions"] == 0
+    assert rag_system.current_version_path(rag_system.VECTOR_STORE_PATH) != first_version